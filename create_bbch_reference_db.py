@@ -11,6 +11,10 @@
 
 from modules.handle_bbch_references import HandleBBCHReferences
 from modules.access_sql import AccessSql
+from modules.db_config import DbConfig
+from modules.ingest_pipeline import IngestPipeline
+from modules.metrics import metrics
+from modules.db_schema import DbSchema
 from modules.interpolate_geotiffs import InterpolateGeotiffs
 from modules.file_utils import FileUtils
 from modules.rasdaman_request import RasdamanRequest
@@ -19,11 +23,18 @@ from modules.field_id_creator import FieldIdCreation
 from rasdaman.credentials import Credentials
 
 import modules.geo_position as geo
+import io
 import os
 import re
+import time
+import logging
 import geojson
 import psycopg2
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
 
 # ------------------------These are helper methods for data access------------------------- #
 
@@ -112,7 +123,7 @@ def process_field_files(folder_path, field_id_dict, db_connector):
                 elif (field_id, year) in field_id_dict:
                     hashed_field_id = field_id_dict[(field_id, year)]
                 else:
-                    print("Field id not in hashed dictionary.")
+                    logger.warning("Field id not in hashed dictionary.")
                     return
 
                 # Insert data into the database
@@ -127,17 +138,17 @@ def add_fields_to_table(field_folder, field_id_dict):
             - field_folder: Path to the folder containing GeoJSON files.
             -  field_id_dict: Dictionary containing the hashed id values for the fields
     """
-    print("Starting process.")
+    logger.info("Starting process.")
     db_connector, db_cursor = AccessSql.create_db_connection()
 
     if db_connector and db_cursor:
         # This is an alternative method to use here.
         # process_field_files(field_folder, field_id_dict, db_connector)
         process_ww_regular_field_files(field_folder, db_connector)
-        db_connector.close()
         db_cursor.close()
+        AccessSql.release_db_connection(db_connector)
     else:
-        print("DB connection failed!!!")
+        logger.error("DB connection failed!!!")
 
 
 def add_field_series_to_table(db_connector, start_date, end_date, field_id, id_date_bbch_dict, dwd_values, field_geojson,
@@ -145,16 +156,25 @@ def add_field_series_to_table(db_connector, start_date, end_date, field_id, id_d
                               coh_series_folder,
                               s2_series_folder,
                               s2_interp_folder,
-                              field_id_dict):
+                              field_id_dict,
+                              table_name="field_day_c",
+                              stage_workers=None):
     """
         Here all field series are added to the table containing, S1, S2, BBCH and DWD weather data.
-        The data can be referenced by date, id and geojson polygon
+        The data can be referenced by date, id and geojson polygon.
+        The days run through the stages discover, read, validate, interpolate, encode and write, connected by bounded
+        queues. Reading files, computing the valid pixel and interpolating overlap with the database writes.
+        The rows are bulk loaded with one COPY and one commit per DbConfig.upsert_batch_size rows or
+        DbConfig.ingest_batch_bytes raster bytes.
+        :param stage_workers: Amount of threads of the stages read, validate, interpolate and encode.
+        Defaults to DbConfig.ingest_stage_workers.
+        :raises RuntimeError: If a batch could not be loaded or days failed in a stage. The batches loaded before
+        stay entered.
     """
 
     # Create folder for specific field interpolated s2 data if not already created
-    s2_interp_folder = s2_interp_folder
-    if not os.path.exists(s2_interp_folder):
-        os.mkdir(s2_interp_folder)
+    # The folder is shared by the worker processes, so it may be created by another one at the same time.
+    os.makedirs(s2_interp_folder, exist_ok=True)
 
     # Get all possible dates
     dates = DateTransformer.generate_date_range(start_date, end_date)
@@ -193,91 +213,158 @@ def add_field_series_to_table(db_connector, start_date, end_date, field_id, id_d
     s2_timeseries_path = [s2_series_folder + "/" + str(element) for element in s2_timeseries]
     date_s2_data_dict = dict(zip(available_s2_dates, s2_timeseries_path))
 
-    # Make sure to extend this if more parameters are acquired and added to row.
-    cur_bbch = cur_bsc = cur_coh = cur_s2 = cur_dwd = bsc_val = coh_val = s2_val = s2_interp = None
-
     if field_id in id_date_bbch_dict:
         id_date_bbch_dict_item = id_date_bbch_dict[int(field_id)]
     else:
         id_date_bbch_dict_item = None
 
-    print("Current field id in process:" + field_id)
-
-    # Iterate over all possible dates, require if the data is available, and enter available data to table.
-    for i in range(len(dates)):
-        cur_date_time = datetime.strptime(dates[i], "%Y-%m-%d").date()
-        cur_date = dates[i]
-        hashed_field_id = None
-
-        if id_date_bbch_dict_item and cur_date in id_date_bbch_dict_item:
-            cur_bbch = id_date_bbch_dict_item.get(cur_date)
-        if cur_date in date_bsc_data_dict:
+    logger.info("Current field id in process: %s", field_id)
+
+    # The source files entered before. Days whose files are all unchanged are skipped.
+    manifest = {}
+    incremental = AccessSql.ingest_manifest_enabled(db_connector, table_name)
+    if incremental:
+        manifest = AccessSql.fetch_ingest_manifest(db_connector, table_name, bsc_timeseries_path +
+                                                   coh_timeseries_path + s2_timeseries_path)
+        if manifest is None:
+            logger.warning("Ingest manifest not available, all days are entered.")
+            manifest = {}
+
+    def discover_days():
+        # Iterate over all possible dates and yield the days where new or changed raster data is available.
+        for cur_date in dates:
             cur_bsc = date_bsc_data_dict.get(cur_date)
-        if cur_date in date_coh_data_dict:
             cur_coh = date_coh_data_dict.get(cur_date)
-        if cur_date in date_s2_data_dict:
             cur_s2 = date_s2_data_dict.get(cur_date)
-        if cur_date in dwd_values:
             cur_dwd = dwd_values.get(cur_date)
 
-        if not cur_bsc and not cur_coh and not cur_s2:
-            # Make sure to extend this if more parameters are acquired and added to row.
-            cur_bbch = cur_bsc = cur_coh = cur_s2 = cur_dwd = bsc_val = coh_val = s2_val = s2_interp = None
-            continue
+            if not cur_bsc and not cur_coh and not cur_s2:
+                continue
 
-        if cur_bsc:
-            valid_pixels_bsc, total_pixels_bsc = InterpolateGeotiffs.valid_pixel_in_poly(field_geojson, cur_bsc)
-
-            # According to amount of valid pixel in raster data, validity flag is set.
-            print("Valid Pixels Bsc:", valid_pixels_bsc)
-            print("Total Pixels Polygon with 2 bands:", total_pixels_bsc)
-            amount = valid_pixels_bsc / total_pixels_bsc if total_pixels_bsc != 0 else 0
-            bsc_val = amount > 0.5
-
-        if cur_coh:
-            valid_pixels_coh, total_pixels_coh = InterpolateGeotiffs.valid_pixel_in_poly(field_geojson,
-                                                                                         cur_coh)
-            # According to amount of valid pixel in raster data, validity flag is set.
-            print("Valid Pixels Coh:", valid_pixels_coh)
-            print("Total Pixels Polygon:", total_pixels_coh)
-            amount = valid_pixels_coh / total_pixels_coh if total_pixels_coh != 0 else 0
-            coh_val = amount > 0.5
-
-        if cur_s2:
-            # Takes into account, the no data value is 0 for S2 data
-            valid_pixels_s2, total_pixels_s2 = InterpolateGeotiffs.valid_pixel_in_poly(field_geojson, cur_s2, 0)
-
-            # According to amount of valid pixel in raster data, validity flag is set.
-            print("Valid Pixels S2:", valid_pixels_s2)
-            print("Total Pixels Polygon with 10 bands:", total_pixels_s2)
-            amount = valid_pixels_s2 / total_pixels_s2 if total_pixels_s2 != 0 else 0
-            s2_val = amount > 0.5
-
-            # Here the S2 data is interpolated and added to the dedicated folder. This will only be performed once.
-            s2_interp = None
-            if s2_val:
-                s2_interp = InterpolateGeotiffs.interpolate_tiff(cur_s2, s2_interp_folder)
-
-        # Derive the id from the dictionary. This is NOT an efficient solution.
-        year = cur_date[:4]
-        if (field_id, "0000") in field_id_dict:
-            hashed_field_id = field_id_dict[(field_id, "0000")]
-        elif (field_id, year) in field_id_dict:
-            hashed_field_id = field_id_dict[(field_id, year)]
-        else:
-            print("Something wrong with id" + str(field_id))
+            if incremental and not any(AccessSql.source_file_changed(path, manifest.get(path))
+                                       for path in (cur_bsc, cur_coh, cur_s2) if path):
+                continue
+
+            cur_bbch = id_date_bbch_dict_item.get(cur_date) if id_date_bbch_dict_item else None
+
+            # Derive the id from the dictionary. This is NOT an efficient solution.
+            year = cur_date[:4]
+            if (field_id, "0000") in field_id_dict:
+                hashed_field_id = field_id_dict[(field_id, "0000")]
+            elif (field_id, year) in field_id_dict:
+                hashed_field_id = field_id_dict[(field_id, year)]
+            else:
+                logger.warning("Something wrong with id %s", field_id)
+                continue
+
+            yield {"field_id": hashed_field_id, "date": datetime.strptime(cur_date, "%Y-%m-%d").date(),
+                   "bbch_phase": cur_bbch,
+                   "bsc_data": cur_bsc, "bsc_valid": None,
+                   "coh_data": cur_coh, "coh_valid": None,
+                   "s2_data": cur_s2, "s2_valid": None, "s2_interp_data": None,
+                   "temp_mean": int(cur_dwd[1]) if cur_dwd else None,
+                   "precip": int(cur_dwd[0]) if cur_dwd else None}
+
+    stage_workers = dict(DbConfig.ingest_stage_workers, **(stage_workers or {}))
+
+    pipeline = IngestPipeline(DbConfig.ingest_queue_size)
+    pipeline.add_stage("read", read_day_rasters, stage_workers["read"])
+    pipeline.add_stage("validate", lambda day: validate_day_rasters(day, field_geojson), stage_workers["validate"])
+    pipeline.add_stage("interpolate", lambda day: interpolate_day_s2(day, s2_interp_folder),
+                       stage_workers["interpolate"])
+    pipeline.add_stage("encode", encode_day_row, stage_workers["encode"])
+
+    # The write stage runs in this thread, as the connection must not be shared between threads. The batches are bounded
+    # by their raster bytes, as the rows of a batch are held in memory until they are loaded.
+    # A failing batch is rolled back and stops the field, so it is reported as failed.
+    for series_rows in IngestPipeline.batches(pipeline.run(discover_days()), DbConfig.upsert_batch_size,
+                                              DbConfig.ingest_batch_bytes, day_row_bytes):
+        if AccessSql.copy_field_series(db_connector, table_name, series_rows) is None:
+            raise RuntimeError(f"Loading {len(series_rows)} days of field {field_id} failed")
+
+    for stage, error in pipeline.errors:
+        logger.error("Error in stage %s of field %s: %s", stage, field_id, error)
+
+    # The days of the failed stages are not entered, the other days of the field are.
+    if pipeline.errors:
+        raise RuntimeError(f"{len(pipeline.errors)} errors entering field {field_id}, the first in stage "
+                           f"{pipeline.errors[0][0]}: {pipeline.errors[0][1]}")
+
+
+# The raster columns holding the files found for a day.
+DAY_RASTER_COLUMNS = ["bsc_data", "coh_data", "s2_data"]
+
+
+def day_row_bytes(day):
+    """
+        The amount of raster bytes an encoded day holds in memory.
+    """
+    return sum(len(day[column]) for column in AccessSql.RASTER_COLUMNS
+               if isinstance(day.get(column), (bytes, bytearray)))
+
+
+def read_raster_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def read_day_rasters(day):
+    """
+        Read stage: The raster files of a day are read into memory. The paths are kept for interpolation and for
+        out-db storage, which enters the paths instead of the rasters. Size, modification time and hash of the files
+        are entered into the ingest manifest with the row.
+    """
+    day["sources"] = {column: day[column] for column in DAY_RASTER_COLUMNS if day[column]}
+    day["raster_bytes"] = {column: read_raster_file(path) for column, path in day["sources"].items()}
+    day["source_files"] = [AccessSql.source_file_state(column, path, day["raster_bytes"][column])
+                           for column, path in day["sources"].items()]
+    return day
+
+
+def validate_day_rasters(day, field_geojson):
+    """
+        Validate stage: According to amount of valid pixel in raster data, the validity flag of each raster is set.
+    """
+    # Takes into account, the no data value is 0 for S2 data
+    no_data_values = {"bsc_data": 6.9055e-41, "coh_data": 6.9055e-41, "s2_data": 0}
+
+    for column, raster in day["raster_bytes"].items():
+        valid_pixels, total_pixels = InterpolateGeotiffs.valid_pixel_in_poly(field_geojson, io.BytesIO(raster),
+                                                                             no_data_values[column])
+        logger.debug("Valid Pixels %s: %s, Total Pixels Polygon: %s", column, valid_pixels, total_pixels)
+
+        amount = valid_pixels / total_pixels if total_pixels != 0 else 0
+        day[column.replace("_data", "_valid")] = amount > 0.5
+
+    return day
+
+
+def interpolate_day_s2(day, s2_interp_folder):
+    """
+        Interpolate stage: The valid S2 data is interpolated and added to the dedicated folder. This will only be
+        performed once.
+    """
+    if day["s2_valid"]:
+        day["s2_interp_data"] = InterpolateGeotiffs.interpolate_tiff(day["sources"]["s2_data"], s2_interp_folder)
+        day["raster_bytes"]["s2_interp_data"] = read_raster_file(day["s2_interp_data"])
+
+    return day
+
+
+def encode_day_row(day):
+    """
+        Encode stage: The day is converted to the row entered by AccessSql.copy_field_series(). The rasters are entered
+        from memory, only out-db rasters are entered by their path.
+    """
+    sources = day.pop("sources")
+    raster_bytes = day.pop("raster_bytes")
 
-        db_cursor = db_connector.cursor()
-        AccessSql.enter_partial_row(db_cursor, db_connector, "field_c", hashed_field_id, date=cur_date_time,
-                                   bbch_phase=cur_bbch,
-                                   bsc_data=cur_bsc, bsc_valid=bsc_val,
-                                   coh_data=cur_coh, coh_valid=coh_val,
-                                   s2_data=cur_s2, s2_valid=s2_val, s2_interp_data=s2_interp,
-                                   temp_mean=int(cur_dwd[1]),
-                                   precip=int(cur_dwd[0]))
+    if DbConfig.raster_storage != "outdb":
+        day.update(raster_bytes)
+    else:
+        day.update(sources)
 
-        # Make sure to extend this if more parameters are acquired and added to row.
-        cur_bbch = cur_bsc = cur_coh = cur_s2 = cur_dwd = bsc_val = coh_val = s2_val = s2_interp = None
+    return day
 
 
 # -------------------------These methods access data directly------------------------- #
@@ -346,7 +433,7 @@ def create_dwd_field_series(start_date, end_date, field_geojson, csv_file_name):
     centroid = geo.get_centroid_bounds_area(poly)[0]
     easting = centroid.x
     northing = centroid.y
-    print("E value: " + str(easting) + " N value: " + str(northing))
+    logger.debug("E value: %s N value: %s", easting, northing)
 
     dates = DateTransformer.generate_date_range(start_date, end_date)
 
@@ -411,47 +498,139 @@ def add_field_series_table_entries(start_date, end_date, field_id_dict):
 
     id_date_bbch_dict = dict(zip(field_ids, date_bbch_groups))
 
-    db_connector, db_cursor = AccessSql.create_db_connection()
+    # The arguments of add_field_series_to_table() of each field.
+    field_jobs = []
 
-    if db_connector and db_cursor:
+    for k in range(0, len(field_items)):
+        name_comps = field_items[k].replace(".geojson", "").split("_")
+        field_id = name_comps[1]
+        file_name = dwd_series_folder + "ZEPP_" + field_id + "_DWD_2017-2021.csv"
+
+        if len(name_comps) == 5 and name_comps[4].isnumeric() and int(name_comps[4]) <= 2016:
+            continue
+        elif len(name_comps) == 5 and name_comps[4].isnumeric() and int(name_comps[4]) > 2016:
+            file_name = dwd_series_folder + "ZEPP_" + field_id + "_DWD_" + name_comps[4] + ".csv"
 
-        for k in range(0, len(field_items)):
-            name_comps = field_items[k].replace(".geojson", "").split("_")
-            field_id = name_comps[1]
-            file_name = dwd_series_folder + "ZEPP_" + field_id + "_DWD_2017-2021.csv"
+            # Adjust date range to required year.
+            start_date = start_date.replace("2017", name_comps[4])
+            end_date = end_date.replace("2021", name_comps[4])
 
-            if len(name_comps) == 5 and name_comps[4].isnumeric() and int(name_comps[4]) <= 2016:
-                continue
-            elif len(name_comps) == 5 and name_comps[4].isnumeric() and int(name_comps[4]) > 2016:
-                file_name = dwd_series_folder + "ZEPP_" + field_id + "_DWD_" + name_comps[4] + ".csv"
+        elif len(name_comps) == 5:
+            file_name = dwd_series_folder + "ZEPP_" + field_id + "_" + name_comps[4] + "_DWD_2017-2021.csv"
 
-                # Adjust date range to required year.
-                start_date = start_date.replace("2017", name_comps[4])
-                end_date = end_date.replace("2021", name_comps[4])
+        field_jobs.append({"start_date": start_date, "end_date": end_date, "field_id": field_id,
+                           "dwd_file": file_name,
+                           "field_geojson": field_folder + field_items[k],
+                           "bsc_series_folder": bsc_folder + field_items[k].replace(".geojson", ""),
+                           "coh_series_folder": coh_folder + field_items[k].replace(".geojson", ""),
+                           "s2_series_folder": s2_folder + field_items[k].replace(".geojson", ""),
+                           "s2_interp_folder": s2_interp_folder})
 
-            elif len(name_comps) == 5:
-                file_name = dwd_series_folder + "ZEPP_" + field_id + "_" + name_comps[4] + "_DWD_2017-2021.csv"
+        # Reset adjusted date range
+        start_date = "2017-01-01"
+        end_date = "2021-12-31"
 
-            date_dwd = FileUtils.read_csv_to_dict(file_name)
+    ingest_field_series(field_jobs, id_date_bbch_dict, field_id_dict)
 
-            add_field_series_to_table(db_connector, start_date, end_date,
-                                      field_id,
-                                      id_date_bbch_dict, date_dwd,
-                                      field_folder + field_items[k],
-                                      bsc_folder + field_items[k].replace(".geojson", ""),
-                                      coh_folder + field_items[k].replace(".geojson", ""),
-                                      s2_folder + field_items[k].replace(".geojson", ""),
-                                      s2_interp_folder,
-                                      field_id_dict)
 
-            # Reset adjusted date range
-            start_date = "2017-01-01"
-            end_date = "2021-12-31"
+# Dictionaries shared by all fields, handed to each worker process once by init_ingest_worker().
+ingest_context = {}
 
-        db_connector.close()
-        db_cursor.close()
+
+def init_ingest_worker(id_date_bbch_dict, field_id_dict):
+    """
+        This initialises a worker process of ingest_field_series(). Each worker keeps one pooled connection open.
+        The metrics inherited from the parent process are reset, so they are not merged back a second time.
+    """
+    DbConfig.pool_min_connections = 1
+    metrics.reset()
+    ingest_context["id_date_bbch_dict"] = id_date_bbch_dict
+    ingest_context["field_id_dict"] = field_id_dict
+
+
+def ingest_field_job(field_job):
+    """
+        This adds the series of one field to the field_day table on a pooled connection of the current process.
+        Errors are caught and returned, so a failing field does not stop the other fields.
+        :param field_job: The arguments of the field as created by add_field_series_table_entries().
+        :return: Tuple of the field id, the error message, None if the field was entered, and the metrics recorded
+        for the field, which are merged by the calling process.
+    """
+    error = None
+    start = time.perf_counter()
+
+    try:
+        date_dwd = FileUtils.read_csv_to_dict(field_job["dwd_file"])
+
+        with AccessSql.db_session() as (db_connector, _):
+            try:
+                add_field_series_to_table(db_connector, field_job["start_date"], field_job["end_date"],
+                                          field_job["field_id"],
+                                          ingest_context["id_date_bbch_dict"], date_dwd,
+                                          field_job["field_geojson"],
+                                          field_job["bsc_series_folder"],
+                                          field_job["coh_series_folder"],
+                                          field_job["s2_series_folder"],
+                                          field_job["s2_interp_folder"],
+                                          ingest_context["field_id_dict"])
+            except Exception:
+                db_connector.rollback()
+                raise
+
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+
+    metrics.observe("agriref_ingest_field_seconds", time.perf_counter() - start)
+    metrics.count("agriref_ingest_fields", labels={"result": "failed" if error else "entered"})
+    return field_job["field_id"], error, metrics.drain()
+
+
+def ingest_field_series(field_jobs, id_date_bbch_dict, field_id_dict, workers=None):
+    """
+        This adds the series of all fields to the field_day table, spread over a pool of worker processes.
+        The validity counting and interpolation are CPU bound, so the fields are processed in parallel on all cores.
+        :param field_jobs: List of the arguments of each field as created by add_field_series_table_entries().
+        :param id_date_bbch_dict: Dictionary of the bbch phase of each field and date.
+        :param field_id_dict: Dictionary containing the hashed field id values.
+        :param workers: Amount of worker processes. Defaults to DbConfig.ingest_workers, 1 ingests in this process.
+        :return: List of (field_id, error message) of the fields that failed.
+        The metrics of all workers are written to DbConfig.metrics_file if set.
+    """
+    workers = workers or DbConfig.ingest_workers
+    failed_fields = []
+
+    if workers <= 1:
+        ingest_context["id_date_bbch_dict"] = id_date_bbch_dict
+        ingest_context["field_id_dict"] = field_id_dict
+        for field_id, error, field_metrics in map(ingest_field_job, field_jobs):
+            metrics.merge(field_metrics)
+            if error is not None:
+                failed_fields.append((field_id, error))
     else:
-        print("DB connection failed!!!")
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_ingest_worker,
+                                 initargs=(id_date_bbch_dict, field_id_dict)) as executor:
+            futures = {executor.submit(ingest_field_job, field_job): field_job["field_id"] for field_job in field_jobs}
+
+            for future in as_completed(futures):
+                try:
+                    field_id, error, field_metrics = future.result()
+                    metrics.merge(field_metrics)
+                except BrokenProcessPool as e:
+                    # A worker died, e.g. out of memory. The fields still pending in the pool fail as well.
+                    field_id, error = futures[future], f"{type(e).__name__}: {e}"
+
+                if error is not None:
+                    failed_fields.append((field_id, error))
+
+    for field_id, error in failed_fields:
+        logger.error("Error entering field %s: %s", field_id, error)
+
+    logger.info("Entered %s of %s field series.", len(field_jobs) - len(failed_fields), len(field_jobs))
+
+    if DbConfig.metrics_file:
+        metrics.write(DbConfig.metrics_file, "prometheus" if DbConfig.metrics_file.endswith(".prom") else "json")
+
+    return failed_fields
 
 
 def add_field_bbch_table_entries(folder_path, db_connector):
@@ -462,7 +641,7 @@ def add_field_bbch_table_entries(folder_path, db_connector):
         if filename.endswith('.geojson'):
             filepath = os.path.join(folder_path, filename)
         else:
-            print("Something wrong with geojson file name." + filename)
+            logger.warning("Something wrong with geojson file name: %s", filename)
             continue
 
         # Calculate area
@@ -502,6 +681,15 @@ def create_tables_from_data():
     # Creation of the tables. Only has to be executed once.
     AccessSql.create_sql_database_and_tables("field_c", "field_day_c")
 
+    # Adds the indexes and keys to tables created before. Only pending migrations are applied.
+    DbSchema.migrate("field_c", "field_day_c")
+
+    # Chunk interval and compression policy of the hypertable as set in DbConfig.
+    DbSchema.configure_hypertable("field_day_c")
+
+    # Weekly temperature, precipitation and growing degree days per field, maintained as new days are entered.
+    DbSchema.create_meteo_aggregate("field_day_c")
+
     # This loop only needs to be executed once. After that the csv files for DWD Coverage values can be accessed directly.
     #create_dwd_files()
 
@@ -521,6 +709,10 @@ def create_tables_from_data():
     # This will be updated to access the S1 Germany grid in Rasdaman as well.
     add_field_series_table_entries(start_date="2018-01-01", end_date="2021-12-31", field_id_dict=field_id_dict)
 
+    # The historical chunks are read-only, compress them now and report the size of each chunk.
+    DbSchema.refresh_meteo_aggregate("field_day_c")
+    DbSchema.compress_chunks("field_day_c")
+
     # This is a convenience function to display the content of the table
     AccessSql.count_rows_in_table("public.field_day")
 
@@ -532,6 +724,11 @@ def create_tables_from_data():
     geojson_poly = "/media/data_storage_2/jennifer/zepp_field_series_2017-2021/field_series_tests/field_filter_test.geojson"
     AccessSql.query_by_geojson_polygon("field", "geom", geojson_poly, 25832)
 
+    # This searches the fields and valid S2 days of a region in one indexed query, returning (field_id, date) handles.
+    handles = AccessSql.connect_and_search_fields("field_c", "field_day_c", bbox=(380000, 5470000, 420000, 5510000),
+                                                  start_date="2018-01-01", end_date="2018-12-31", s2=True,
+                                                  handles=True)
+
     # Generate a list of file paths to plot multiple items in one plot.
     file_paths = [
             "/media/data_storage_2/jennifer/zepp_field_series_2017-2021/RLP_bsc_field_series_2018-2021/"
@@ -545,7 +742,7 @@ def create_tables_from_data():
         ]
     InterpolateGeotiffs.plot_geotiffs(file_paths)
 
-    print("Execution os complete.")
+    logger.info("Execution os complete.")
 
 # ----------------Here are examples of how further module methods can be used------------ #
 
@@ -574,9 +771,13 @@ def create_tables_from_unified_fields():
 
     db_connector, db_cursor = AccessSql.create_db_connection()
     add_field_bbch_table_entries(field_folder, db_connector)
+    AccessSql.release_db_connection(db_connector)
 
 
 def main():
+    # Messages below DbConfig.log_level are off, set AGRIREF_LOG_LEVEL=INFO or DEBUG to follow the ingest.
+    logging.basicConfig(level=DbConfig.log_level, format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s')
+
     # Only has to be executed once
     create_tables_from_data()
 
@@ -9,21 +9,38 @@
 #
 #--------------------------------------------------------------------------------------------------------------------------------
 
-import time
+import os
+import uuid
+import logging
+import datetime
+import hashlib
+import threading
+from itertools import islice
 import geojson
 import numpy as np
 
 from typing import List, Tuple, Any, Optional
+from contextlib import contextmanager
 
 import psycopg2
 from psycopg2 import sql
-from psycopg2.extras import DictCursor
+from psycopg2.extras import DictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool, PoolError
 
+import rasterio
 from rasterio.io import MemoryFile
+from rasterio.windows import Window
 
+from modules.db_config import DbConfig
 from modules.interpolate_geotiffs import InterpolateGeotiffs
+from modules.raster_wkb import RasterWkb
+from modules.row_cache import RowCache
+from modules.raster_disk_cache import RasterDiskCache
+from modules.metrics import metrics
 import modules.geo_position as geo
 
+logger = logging.getLogger(__name__)
+
 
 class AccessSql:
     """
@@ -33,37 +50,175 @@ class AccessSql:
     # This holds the db cursor. Only needs to be opened once
     db_cursor = None
 
+    # This holds the connection pool shared by all entry points and the process it was created in.
+    db_pool = None
+    db_pool_pid = None
+    db_pool_lock = threading.Lock()
+
+    # Pools inherited from a parent process. They are kept referenced, so their connections are never closed from the
+    # child process, which would terminate the sessions of the parent.
+    inherited_db_pools = []
+
+    # The tables found by table_exists(). Tables that are missing are looked up again, as a migration may create them.
+    existing_tables = set()
+
+    # Decoded rows of fetch_decoded_row(), disabled with a budget of 0 bytes.
+    row_cache = RowCache(DbConfig.row_cache_bytes)
+
+    # Decoded rasters of fetch_cached_raster() shared by the processes of a machine, disabled without directory.
+    raster_disk_cache = (RasterDiskCache(DbConfig.raster_cache_directory, DbConfig.raster_cache_bytes)
+                         if DbConfig.raster_cache_directory else None)
+
+    # All columns of the field_day table in table order with their types. Raster columns are staged as bytea.
+    FIELD_DAY_COLUMNS = ["field_id", "date", "size", "bbch_phase", "bbch_sim",
+                         "bsc_data", "bsc_interp_data", "bsc_valid",
+                         "coh_data", "coh_interp_data", "coh_valid",
+                         "s2_data", "s2_interp_data", "s2_valid",
+                         "temp_min", "temp_max", "temp_mean", "precip"]
+
+    RASTER_COLUMNS = ["bsc_data", "bsc_interp_data", "coh_data", "coh_interp_data", "s2_data", "s2_interp_data"]
+
+    # The scalar columns, selected with columns="metadata" to read no raster at all.
+    METADATA_COLUMNS = ["field_id", "date", "size", "bbch_phase", "bbch_sim", "bsc_valid", "coh_valid", "s2_valid",
+                        "temp_min", "temp_max", "temp_mean", "precip"]
+
+    # Expressions to transfer a raster column: as GeoTIFF encoded by the server ("gtiff") or as the native Postgis
+    # raster binary ("wkb"), which is decoded without GDAL by RasterWkb.
+    RASTER_FORMATS = {"gtiff": "ST_AsGDALRaster({source}, 'GTIFF') AS {column}",
+                      "wkb": "ST_AsBinary({source}) AS {column}"}
+
+    # Expressions to load a raster value: the GeoTIFF binary as in-db raster ("indb") or the path of a COG as out-db
+    # raster ("outdb"). Out-db rasters hold the geotransform, srid and band metadata, the pixels stay in the file.
+    # Content addressed rasters ("dedup") are loaded once into RASTER_STORE_TABLE and referenced by HASH_COLUMNS.
+    RASTER_STORAGES = {"indb": "ST_FromGDALRaster({value}::bytea)",
+                       "outdb": "ST_AddBand(NULL::raster, {value}::text, NULL::int[])",
+                       "dedup": "ST_FromGDALRaster({value}::bytea)"}
+
+    # The value of the pixel outside the field polygon of each raster column, 0 for S2.
+    RASTER_NO_DATA_VALUES = {"bsc_data": 6.9055e-41, "bsc_interp_data": 6.9055e-41, "coh_data": 6.9055e-41,
+                             "coh_interp_data": 6.9055e-41, "s2_data": 0, "s2_interp_data": 0}
+
+    RASTER_STORE_TABLE = "raster_store"
+    HASH_COLUMNS = [column + "_hash" for column in RASTER_COLUMNS]
+
+    FIELD_DAY_STAGING_TYPES = {"field_id": "BIGINT", "date": "DATE", "size": "INTEGER", "bbch_phase": "INTEGER",
+                               "bbch_sim": "BOOLEAN", "bsc_valid": "BOOLEAN", "coh_valid": "BOOLEAN",
+                               "s2_valid": "BOOLEAN", "temp_min": "INTEGER", "temp_max": "INTEGER",
+                               "temp_mean": "INTEGER", "precip": "INTEGER",
+                               "bsc_data_hash": "TEXT", "bsc_interp_data_hash": "TEXT", "coh_data_hash": "TEXT",
+                               "coh_interp_data_hash": "TEXT", "s2_data_hash": "TEXT", "s2_interp_data_hash": "TEXT"}
+
+    # The statements creating the unique key on (field_id, date) as (statement, index name) with the placeholders
+    # {field_day} and {index}. Rows entered twice would prevent the unique index, the last physical row of a key is kept.
+    # Also applied as migration 1 of DbSchema.
+    FIELD_DAY_UNIQUE_KEY_STATEMENTS = [
+        ("""DELETE FROM public.{field_day} a
+            USING public.{field_day} b
+            WHERE a.field_id = b.field_id AND a.date = b.date AND a.ctid < b.ctid""", None),
+        ("CREATE UNIQUE INDEX IF NOT EXISTS {index} ON public.{field_day} (field_id, date)",
+         "{field_day}_field_id_date_key")
+    ]
+
     # Configure logging can be activated when needed.
     # logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
+    @staticmethod
+    def get_db_pool():
+        """
+        This returns the shared connection pool and creates it on first use in each process.
+        The connections are opened with the DSN of DbConfig and are initialised once with the GDAL driver setting.
+        The pool is thread safe, so each thread can take its own connection.
+        :return: db_pool
+        """
+        with AccessSql.db_pool_lock:
+            if AccessSql.db_pool is not None and AccessSql.db_pool_pid != os.getpid():
+                AccessSql.inherited_db_pools.append(AccessSql.db_pool)
+                AccessSql.db_pool = None
+
+            if AccessSql.db_pool is None or AccessSql.db_pool.closed:
+                AccessSql.db_pool = ThreadedConnectionPool(DbConfig.pool_min_connections,
+                                                           DbConfig.pool_max_connections,
+                                                           dsn=DbConfig.dsn,
+                                                           options=DbConfig.session_options,
+                                                           connection_factory=PreparedConnection)
+                AccessSql.db_pool_pid = os.getpid()
+
+                # Only execute this to check if drivers are active.
+                # db_connector = AccessSql.db_pool.getconn()
+                # AccessSql.print_gdal_drivers(db_connector)
+                # AccessSql.db_pool.putconn(db_connector)
+
+            return AccessSql.db_pool
+
+    @staticmethod
+    def take_db_connection():
+        """
+        This takes a connection from the shared pool. Errors are raised to the caller.
+        Connections that were closed while idle in the pool (e.g. by a server restart) are replaced.
+        :return: db_connector
+        """
+        db_pool = AccessSql.get_db_pool()
+        db_connector = db_pool.getconn()
+
+        if db_connector.closed:
+            db_pool.putconn(db_connector, close=True)
+            db_connector = db_pool.getconn()
+
+        return db_connector
+
     @staticmethod
     def create_db_connection():
         """
-        This creates the connection to the database.
+        This takes a connection to the database from the shared connection pool.
+        Hand the connection back with release_db_connection() instead of closing it.
         :return: db_connector, db_cursor
         """
 
-        db_connector = None
         try:
-            # Password must be set.
-            db_connector = psycopg2.connect(database="agriRef", user="postgres", host="localhost",
-                                            password="", port="5432")
-
+            db_connector = AccessSql.take_db_connection()
             db_cursor = db_connector.cursor()
 
-            # Very important command to active GDAL drivers.
-            query = "SET postgis.gdal_enabled_drivers TO 'ENABLE_ALL'"
-            db_cursor.execute(query)
-
-            # Only execute this to check if drivers are active.
-            # AccessSql.print_gdal_drivers(db_connector)
-
             return db_connector, db_cursor
 
         except (Exception, psycopg2.DatabaseError) as error:
-            print(error)
+            logger.error(error)
             return None, None
 
+    @staticmethod
+    def release_db_connection(db_connector):
+        """
+        This hands a connection back to the shared connection pool. Open transactions are rolled back.
+        :param db_connector: The connection taken with create_db_connection().
+        :return:
+        """
+
+        if db_connector is None:
+            return
+
+        try:
+            AccessSql.get_db_pool().putconn(db_connector)
+        except PoolError:
+            # The connection does not belong to the current pool.
+            db_connector.close()
+
+    @staticmethod
+    @contextmanager
+    def db_session():
+        """
+        This takes a connection from the shared pool for the duration of a with block and hands it back afterwards.
+
+        Yields:
+            tuple: The connection and a cursor of the connection.
+        """
+        db_connector = AccessSql.take_db_connection()
+        db_cursor = db_connector.cursor()
+        try:
+            yield db_connector, db_cursor
+        finally:
+            if not db_cursor.closed:
+                db_cursor.close()
+            AccessSql.release_db_connection(db_connector)
+
     @staticmethod
     def print_gdal_drivers(db_connection):
         """
@@ -97,7 +252,7 @@ class AccessSql:
             cursor.close()
 
         except psycopg2.Error as e:
-            print(f"Error executing query: {e}")
+            logger.error("Error executing query: %s", e)
 
     @staticmethod
     def create_sql_database_and_tables(field_table_name, field_day_table_name):
@@ -113,10 +268,10 @@ class AccessSql:
             db_connector, AccessSql.db_cursor = AccessSql.create_db_connection()
 
             AccessSql.db_cursor.execute("create extension if not exists postgis; create extension if not exists postgis_raster;")
-            print(AccessSql.db_cursor.statusmessage)
+            logger.info(AccessSql.db_cursor.statusmessage)
 
             AccessSql.db_cursor.execute("create extension if not exists timescaledb cascade;")
-            print(AccessSql.db_cursor.statusmessage)
+            logger.info(AccessSql.db_cursor.statusmessage)
 
             # Activating this will delete all table content.
 #            db_cursor.execute("DROP TABLE public.field_c")
@@ -134,7 +289,7 @@ class AccessSql:
                 );
             """.format(field_table_name))
 
-            print("Creating table field: " + AccessSql.db_cursor.statusmessage)
+            logger.info("Creating table field: %s", AccessSql.db_cursor.statusmessage)
 
             AccessSql.db_cursor.execute("""
                 CREATE TABLE IF NOT EXISTS public.{} (
@@ -159,57 +314,54 @@ class AccessSql:
                 );
             """.format(field_day_table_name))
 
-            print("Creating table field_day: " + AccessSql.db_cursor.statusmessage)
+            logger.info("Creating table field_day: %s", AccessSql.db_cursor.statusmessage)
 
-            AccessSql.db_cursor.execute("SELECT create_hypertable('field_day', 'date', 'field_id', 2);")
-            print("Creating hypertable: " + AccessSql.db_cursor.statusmessage)
+            # Chunks by date interval of DbConfig.chunk_interval and 2 space partitions by field_id.
+            AccessSql.db_cursor.execute("SELECT create_hypertable(%s, 'date', 'field_id', 2, "
+                                        "chunk_time_interval => %s::interval, if_not_exists => TRUE);",
+                                        ("public." + field_day_table_name, DbConfig.chunk_interval))
+            logger.info("Creating hypertable: %s", AccessSql.db_cursor.statusmessage)
 
             db_connector.commit()
 
-            AccessSql.db_cursor.execute("select * from information_schema.tables;")
+            # The key for idempotent entering of rows by field_id and date.
+            AccessSql.ensure_field_day_unique_key(db_connector, field_day_table_name)
+
+            # Listing the tables is only worth the query when debugging.
+            if logger.isEnabledFor(logging.DEBUG):
+                AccessSql.db_cursor.execute("select * from information_schema.tables;")
 
-            print(AccessSql.db_cursor.fetchone() + ", size: " + AccessSql.db_cursor.arraysize)
-            print(AccessSql.db_cursor.fetchmany() + ", fetch all: " + AccessSql.db_cursor.fetchall() +
-                  ", amount rows: " + AccessSql.db_cursor.rowcount)
+                logger.debug("%s, size: %s", AccessSql.db_cursor.fetchone(), AccessSql.db_cursor.arraysize)
+                logger.debug("%s, fetch all: %s, amount rows: %s", AccessSql.db_cursor.fetchmany(),
+                             AccessSql.db_cursor.fetchall(), AccessSql.db_cursor.rowcount)
 
         except (Exception, psycopg2.DatabaseError) as error:
-            print(error)
+            logger.error(error)
         finally:
-            if db_connector is not None:
-                db_connector.close()
+            AccessSql.release_db_connection(db_connector)
 
     @staticmethod
     def count_rows_in_table(table_name):
         """
-            Counts the amount of rows in give table and prints the result.
+            Counts the amount of rows in give table and logs the result.
 
             Parameters:
                 table_name (str): the name of the table
         """
         try:
-            db_connector = psycopg2.connect(database="agriRef", user="postgres", host="localhost",
-                                            password="sentinel22", port="5432")
-            db_cursor = db_connector.cursor()
+            with AccessSql.db_session() as (db_connector, db_cursor):
 
-            # Execute the SQL query to count rows in the table
-            query = f"SELECT COUNT(*) FROM {table_name};"
-            db_cursor.execute(query)
+                # Execute the SQL query to count rows in the table
+                query = f"SELECT COUNT(*) FROM {table_name};"
+                db_cursor.execute(query)
 
-            # Fetch the result
-            row_count = db_cursor.fetchone()[0]
+                # Fetch the result
+                row_count = db_cursor.fetchone()[0]
 
-            # Print the result
-            print(f"Number of rows in '{table_name}': {row_count}")
+                logger.info("Number of rows in '%s': %s", table_name, row_count)
 
         except (Exception, psycopg2.Error) as error:
-            print("Error while connecting to PostgreSQL", error)
-
-        finally:
-            # Close the cursor and connection
-            if db_connector:
-                db_cursor.close()
-                db_connector.close()
-                print("PostgreSQL connection is closed")
+            logger.error("Error while connecting to PostgreSQL: %s", error)
 
     # ------------------Methods that access field_c table-----------------
     @staticmethod
@@ -221,18 +373,47 @@ class AccessSql:
                SELECT ST_AsGeoJSON(geom) as geometry 
                FROM {} 
                WHERE field_id = %s;
-           """.format(table_name))
-
-        db_connector, db_cursor = AccessSql.create_db_connection()
+           """).format(AccessSql.table_identifier(table_name))
 
-        with db_cursor as cursor:
-            cursor.execute(query, (field_id,))
+        with AccessSql.db_session() as (db_connector, cursor):
+            AccessSql.execute_prepared(cursor, query, (field_id,))
             result = cursor.fetchone()
             if result:
                 return result[0]  # The geometry column in GeoJSON format
             else:
                 return None
 
+    @staticmethod
+    def get_polygons(field_ids, table_name, chunk_size=None):
+        """
+        Query the database for the geometry polygons of many field_ids at once.
+        The field_ids are sent as one array per chunk instead of one query per field_id.
+
+        Parameters:
+            field_ids (iterable): The field_ids.
+            table_name: The table holding the field polygons.
+            chunk_size (int, optional): Amount of field_ids per query. Defaults to DbConfig.fetch_chunk_size.
+
+        Returns:
+            dict: The geometry in GeoJSON format of each field_id, None if the field_id does not exist.
+        """
+        field_ids = list(field_ids)
+        chunk_size = chunk_size or DbConfig.fetch_chunk_size
+        polygons = dict.fromkeys(field_ids)
+
+        query = sql.SQL("""
+               SELECT field_id, ST_AsGeoJSON(geom) as geometry
+               FROM {}
+               WHERE field_id = ANY(%s::bigint[]);
+           """).format(AccessSql.table_identifier(table_name))
+
+        with AccessSql.db_session() as (db_connector, cursor):
+            for start in range(0, len(field_ids), chunk_size):
+                AccessSql.execute_prepared(cursor, query, (field_ids[start:start + chunk_size],))
+                polygons.update(cursor.fetchall())
+
+        return polygons
+
     # ------------------Methods that access field_day_c table------------
     @staticmethod
     def insert_field_row(db_connector, table_name, field_id, geom, startdate, enddate, crop_type, buff_distm, size):
@@ -257,20 +438,19 @@ class AccessSql:
 
         rounded_size = int(round(size, 0))
 
-        print(f"field_id: {field_id}")
-        print(f"geom: {geojson.dumps(geom)}")
-        print(f"startdate: {startdate}")
-        print(f"enddate: {enddate}")
-        print(f"crop_type: {crop_type}")
-        print(f"buff_distm: {buff_distm}")
-        print(f"rounded_size: {rounded_size}")
+        # The GeoJSON is only serialised for the message if debug messages are on, as this is called for each row.
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("field_id: %s, geom: %s, startdate: %s, enddate: %s, crop_type: %s, buff_distm: %s, "
+                         "rounded_size: %s", field_id, geojson.dumps(geom), startdate, enddate, crop_type, buff_distm,
+                         rounded_size)
 
         cursor.execute(insert_query, (field_id, geojson.dumps(geom), startdate, enddate, crop_type, buff_distm, rounded_size))
         db_connector.commit()
         cursor.close()
 
     @staticmethod
-    def fetch_row_from_db(db_connector, table_name, field_id, date):
+    @metrics.timed("agriref_query_seconds", {"query": "fetch_row"})
+    def fetch_row_from_db(db_connector, table_name, field_id, date, raster_format="gtiff", columns=None):
         """
         Fetch a row from the 'field_day' table in PostgreSQL by field_id and date.
 
@@ -278,77 +458,209 @@ class AccessSql:
         - db_connector: psycopg2 database connection object
         - field_id: ID of the field
         - date: Date of the data
+        - raster_format: The transfer format of the rasters, one of RASTER_FORMATS. Decode with decode_raster().
+        - columns: The columns to fetch in this order, "metadata" for all scalar columns. Defaults to all columns.
 
         Returns:
-        - Tuple containing all column values of the fetched row
+        - Tuple containing the column values of the fetched row
         """
         try:
-            query = """
-                 SELECT field_id,
-                        date,
-                        size,
-                        bbch_phase,
-                        bbch_sim,
-                        ST_AsGDALRaster(bsc_data, 'GTIFF') AS bsc_data,
-                        ST_AsGDALRaster(bsc_interp_data, 'GTIFF') AS bsc_interp_data,
-                        bsc_valid,
-                        ST_AsGDALRaster(coh_data, 'GTIFF') AS coh_data,
-                        ST_AsGDALRaster(coh_interp_data, 'GTIFF') AS coh_interp_data,
-                        coh_valid,
-                        ST_AsGDALRaster(s2_data, 'GTIFF') AS s2_data,
-                        ST_AsGDALRaster(s2_interp_data, 'GTIFF') AS s2_interp_data,
-                        s2_valid,
-                        temp_min,
-                        temp_max,
-                        temp_mean,
-                        precip
-                 FROM public.{}
+            query = sql.SQL("""
+                 SELECT {}
+                 FROM {}
                  WHERE field_id = %s AND date = %s
-             """.format(table_name)
+             """).format(sql.SQL(AccessSql.field_day_select_list(raster_format, columns=columns)),
+                         AccessSql.table_identifier(table_name))
 
             with db_connector.cursor() as cursor:
-                cursor.execute(query, (field_id, date))
+                AccessSql.execute_prepared(cursor, query, (field_id, date))
                 row = cursor.fetchone()
 
+            metrics.count("agriref_rows_fetched", 1 if row is not None else 0)
             return row
 
         except psycopg2.Error as e:
-            print(f"Error fetching row from database: {e}")
+            logger.error("Error fetching row from database: %s", e)
+            return None
+
+    @staticmethod
+    @metrics.timed("agriref_query_seconds", {"query": "fetch_rows"})
+    def fetch_rows(db_connector, table_name, keys, raster_format="gtiff", columns=None, chunk_size=None):
+        """
+        Fetch many rows from the field_day table by (field_id, date) with one query per chunk of keys.
+        The keys are sent as two arrays and joined to the table with unnest.
+
+        Parameters:
+        - db_connector: psycopg2 database connection object
+        - table_name: The name of the field_day table
+        - keys: Iterable of (field_id, date) with date as datetime.date or "yyyy-mm-dd"
+        - raster_format: The transfer format of the rasters, one of RASTER_FORMATS. Decode with decode_raster().
+        - columns: The columns to fetch in this order, "metadata" for all scalar columns. Defaults to all columns.
+        - chunk_size: Amount of keys per query. Defaults to DbConfig.fetch_chunk_size.
+
+        Returns:
+        - Dict with the tuple of column values of each key as given, None if the row does not exist.
+          None is returned on error.
+        """
+        keys = list(keys)
+        chunk_size = chunk_size or DbConfig.fetch_chunk_size
+        rows = dict.fromkeys(keys)
+
+        query = sql.SQL("""
+                 SELECT keys.key_index, {}
+                 FROM unnest(%s::bigint[], %s::date[]) WITH ORDINALITY AS keys(key_field_id, key_date, key_index)
+                 JOIN {} field_day ON field_day.field_id = keys.key_field_id AND field_day.date = keys.key_date
+             """).format(sql.SQL(AccessSql.field_day_select_list(raster_format, columns=columns)),
+                         AccessSql.table_identifier(table_name))
+
+        try:
+            with db_connector.cursor() as cursor:
+                for start in range(0, len(keys), chunk_size):
+                    chunk = keys[start:start + chunk_size]
+                    # A list of str would be sent as text[], which the prepared statement does not cast to date[].
+                    dates = [datetime.date.fromisoformat(key[1]) if isinstance(key[1], str) else key[1]
+                             for key in chunk]
+                    AccessSql.execute_prepared(cursor, query, ([key[0] for key in chunk], dates))
+
+                    # The ordinality maps each row back to the key as given by the caller.
+                    for row in cursor.fetchall():
+                        rows[chunk[row[0] - 1]] = tuple(row[1:])
+                        metrics.count("agriref_rows_fetched")
+
+            return rows
+
+        except psycopg2.Error as e:
+            logger.error("Error fetching rows from database: %s", e)
+            db_connector.rollback()
+            return None
+
+    @staticmethod
+    def fetch_decoded_row(db_connector, table_name, field_id, date, raster_format="gtiff", columns=None):
+        """
+        Fetch a row from the field_day table and decode its rasters. Decoded rows are kept in the in-process
+        row_cache, so repeated requests are served from memory. The cached band arrays are read-only and shared.
+
+        Parameters:
+        - db_connector: psycopg2 database connection object
+        - table_name: The name of the field_day table
+        - field_id: ID of the field
+        - date: Date of the data
+        - raster_format: The transfer format of the rasters, one of RASTER_FORMATS.
+        - columns: The columns to fetch, "metadata" for all scalar columns. Defaults to all columns.
+
+        Returns:
+        - Dict of the column values with the rasters as returned by decode_raster(). None if the row does not exist.
+        """
+        columns = AccessSql.resolve_columns(columns)
+        key = RowCache.make_key(table_name, field_id, date, (raster_format, tuple(columns)))
+
+        decoded_row = AccessSql.row_cache.get(key)
+        metrics.count("agriref_cache_requests",
+                      labels={"cache": "row", "result": "hit" if decoded_row is not None else "miss"})
+        if decoded_row is not None:
+            return decoded_row
+
+        row = AccessSql.fetch_row_from_db(db_connector, table_name, field_id, date, raster_format, columns)
+        if row is None:
+            return None
+
+        decoded_row = {column: AccessSql.decode_raster(value, raster_format) if column in AccessSql.RASTER_COLUMNS
+                       else value for column, value in zip(columns, row)}
+
+        for column in AccessSql.RASTER_COLUMNS:
+            for band in (decoded_row.get(column) or {}).get("bands", []):
+                if band is not None:
+                    band.flags.writeable = False
+
+        AccessSql.row_cache.put(key, decoded_row)
+        return decoded_row
+
+    @staticmethod
+    def fetch_cached_raster(db_connector, table_name, field_id, date, column, raster_format="wkb"):
+        """
+        Fetch a single raster of a row and decode it. Decoded rasters are kept in the raster_disk_cache, so the worker
+        processes of a machine read them memory-mapped from the local disk instead of the database.
+
+        Parameters:
+        - db_connector: psycopg2 database connection object
+        - table_name: The name of the field_day table
+        - field_id: ID of the field
+        - date: Date of the data
+        - column: The raster column, one of RASTER_COLUMNS
+        - raster_format: The transfer format of the raster, one of RASTER_FORMATS.
+
+        Returns:
+        - The raster as returned by decode_raster(). None if the row or raster does not exist.
+        """
+        if column not in AccessSql.RASTER_COLUMNS:
+            raise ValueError(f"Unknown raster column: {column}")
+
+        disk_cache = AccessSql.raster_disk_cache
+        if disk_cache is not None:
+            raster = disk_cache.get(table_name, field_id, date, column)
+            metrics.count("agriref_cache_requests",
+                          labels={"cache": "raster_disk", "result": "hit" if raster is not None else "miss"})
+            if raster is not None:
+                return raster
+
+        row = AccessSql.fetch_row_from_db(db_connector, table_name, field_id, date, raster_format, [column])
+        raster = AccessSql.decode_raster(row[0], raster_format) if row else None
+
+        if disk_cache is not None and raster is not None:
+            disk_cache.put(table_name, field_id, date, column, raster)
+
+        return raster
+
+    @staticmethod
+    def invalidate_cached_rows(table_name, field_id, date=None):
+        """
+        Remove the rows of a field_id, or only of one date of it, from the row_cache and raster_disk_cache after they
+        were changed in the database.
+        """
+        AccessSql.row_cache.invalidate(table_name, field_id, date)
+
+        if AccessSql.raster_disk_cache is not None:
+            AccessSql.raster_disk_cache.invalidate(table_name, field_id, date)
+
+    @staticmethod
+    def connect_and_fetch_rows(keys, table_name, raster_format="gtiff", columns=None):
+        """
+        This connects to the db and retrieves the rows of many (field_id, date) keys from the given table.
+        :param keys: Iterable of (field_id, date).
+        :param table_name: The name of the table to retrieve the rows from.
+        :param raster_format: The transfer format of the rasters, one of RASTER_FORMATS.
+        :param columns: The columns to fetch, "metadata" for all scalar columns. Defaults to all columns.
+        :return: Dict with the row of each key, None if the row does not exist.
+        """
+
+        try:
+            with AccessSql.db_session() as (db_connector, _):
+                return AccessSql.fetch_rows(db_connector, table_name, keys, raster_format, columns)
+
+        except (Exception, psycopg2.DatabaseError) as error:
+            logger.error(error)
             return None
 
     @staticmethod
-    def connect_and_fetch_row(field_id, table_name, date):
+    def connect_and_fetch_row(field_id, table_name, date, raster_format="gtiff", columns=None):
         """
         This connects to the db and retrieves a row fromthe given table for the given field_id and date.
         :param field_id: The field_id. This is a hashed value created with sensitive information.
         :param table_name: The name of the table to retrieve the row from.
         :param date: The date to receive teh row from.
+        :param raster_format: The transfer format of the rasters, one of RASTER_FORMATS.
+        :param columns: The columns to fetch, "metadata" for all scalar columns. Defaults to all columns.
         :return:
         """
 
-        db_connector = None
-        row = None
         try:
-            db_connector = psycopg2.connect(database="agriRef", user="postgres", host="localhost",
-                                            password="sentinel22", port="5432")
-
-            cursor = db_connector.cursor()
-
-            # Very important command to active GDAL drivers.
-            query = "SET postgis.gdal_enabled_drivers TO 'ENABLE_ALL'"
-            cursor.execute(query)
-
-            # Only execute this to check if drivers are active.
-            # AccessSql.print_gdal_drivers(db_connector)
+            # The pooled connection already has the GDAL drivers activated.
+            with AccessSql.db_session() as (db_connector, _):
+                return AccessSql.fetch_row_from_db(db_connector, table_name, field_id, date, raster_format, columns)
 
-            row = AccessSql.fetch_row_from_db(db_connector, table_name, field_id, date)
         except (Exception, psycopg2.DatabaseError) as error:
-            print(error)
+            logger.error(error)
             return None
-        finally:
-            if db_connector is not None:
-                db_connector.close()
-                return row
 
     @staticmethod
     def insert_complete_row(db_cursor, db_connector, table_name, field_id, date, size, bbch_phase, bbch_sim,
@@ -386,7 +698,7 @@ class AccessSql:
         """
 
         if not field_id:
-            print("No valid identifier given")
+            logger.warning("No valid identifier given")
 
         # Construct the SQL query for insertion
         query = """
@@ -455,9 +767,10 @@ class AccessSql:
                           bsc_data=None, bsc_interp_data=None, bsc_valid=None,
                           coh_data=None, coh_interp_data=None, coh_valid=None,
                           s2_data=None, s2_interp_data=None, s2_valid=None,
-                          temp_min=None, temp_max=None, temp_mean=None, precip=None):
+                          temp_min=None, temp_max=None, temp_mean=None, precip=None, storage=None):
         """
-        Insert a partial row into the field_day table.
+        Insert a partial row into the field_day table. If the row of field_id and date is already entered, the given
+        non-null values are merged into it. Database errors are raised after the rollback.
 
         Parameters:
             db_cursor (psycopg2.extensions.cursor): The database cursor object.
@@ -481,100 +794,197 @@ class AccessSql:
             temp_max (float, optional): The maximum temperature.
             temp_mean (float, optional): The mean temperature.
             precip (float, optional): The precipitation.
+            storage (str, optional): The raster storage, one of RASTER_STORAGES. Defaults to DbConfig.raster_storage.
         """
 
         if not field_id:
-            print("No valid identifier given")
-
-        # Retrieve object by ID from the database. Only enter row that have not already been entered.
-        db_cursor.execute(f"SELECT * FROM public.{table_name} WHERE field_id = %s AND date = %s", (field_id, date))
-        db_row = db_cursor.fetchone()
-        if db_row:
-            print("Data row with field_id " + str(field_id) + " and date:" + str(date) + " already entered.")
+            logger.warning("No valid identifier given")
             return
-        else:
-            print("Data row with field_id " + str(field_id) + " and date:" + str(date) + " entered.")
 
-        parameter_values = [value for value in locals().values()]
-        valid_parameter_values = [value for value in parameter_values if value is not None]
+        row = {"field_id": field_id, "date": date, "size": size, "bbch_phase": bbch_phase, "bbch_sim": bbch_sim,
+               "bsc_data": bsc_data, "bsc_interp_data": bsc_interp_data, "bsc_valid": bsc_valid,
+               "coh_data": coh_data, "coh_interp_data": coh_interp_data, "coh_valid": coh_valid,
+               "s2_data": s2_data, "s2_interp_data": s2_interp_data, "s2_valid": s2_valid,
+               "temp_min": temp_min, "temp_max": temp_max, "temp_mean": temp_mean, "precip": precip}
 
-        valid_parameter_list = [column for column, value in locals().items() if value is not None]
-        query_parameter_markers = ["%s" for _ in range(len(valid_parameter_values))]
+        # A row already entered for field_id and date is merged with the given non-null values.
+        AccessSql.upsert_partial_rows(db_connector, table_name, [row], storage=storage)
 
-        valid_parameter_values = valid_parameter_values[3:]
-        valid_parameter_list = valid_parameter_list[3:len(valid_parameter_values) + 3]
-        query_parameter_markers = query_parameter_markers[3:]
+        logger.debug("Data row with field_id %s and date: %s entered.", field_id, date)
 
-        raster_bsc = raster_coh = raster_s2 = raster_s2_interp = None
+    @staticmethod
+    @metrics.timed("agriref_query_seconds", {"query": "upsert_partial_rows"})
+    def upsert_partial_rows(db_connector, table_name, rows, batch_size=None, page_size=None, storage=None):
+        """
+        Insert many partial rows into the field_day table with INSERT ... ON CONFLICT (field_id, date).
+        Rows that are already entered are merged: only the non-null values of a new row replace the entered values.
+        Requires the unique key on (field_id, date), see ensure_field_day_unique_key().
+        Each batch is committed on its own. On error the failing batch is rolled back and the error is raised, the
+        batches before stay entered.
 
-        if bsc_data:
-            raster_bin = AccessSql.read_geotiff_bin(bsc_data)
-            bsc_rast_query = """ST_FromGDALRaster(%s::bytea)"""
+        Parameters:
+            db_connector (psycopg2.extensions.connection): The database connection object.
+            table_name: The name of the field_day table.
+            rows: Iterable of dictionaries mapping column names of FIELD_DAY_COLUMNS to values. Raster columns hold
+            the path to a geotiff file or the raster binary.
+            batch_size (int, optional): The amount of rows committed at once. Defaults to DbConfig.upsert_batch_size.
+            page_size (int, optional): The amount of rows sent per statement. Defaults to DbConfig.upsert_page_size.
+            storage (str, optional): The raster storage, one of RASTER_STORAGES. Defaults to DbConfig.raster_storage.
 
-            # Replace path with raster binary at same position
-            valid_parameter_values = AccessSql.insert_list_at_item(valid_parameter_values, bsc_data, [raster_bin])
+        Returns:
+            int: The number of rows inserted or updated. Rows of the same key are merged first and counted once.
+        """
+        batch_size = batch_size or DbConfig.upsert_batch_size
+        page_size = page_size or DbConfig.upsert_page_size
+        storage = AccessSql.resolve_raster_storage(storage)
 
-            # Get index of parameter position
-            index = valid_parameter_list.index("bsc_data")
+        columns = AccessSql.entered_columns(storage)
 
-            # Replace simple parameter name in query with query Postgis command to load raster binary as GDAL Raster
-            query_parameter_markers.pop(index)
-            query_parameter_markers.insert(index, bsc_rast_query)
+        query = sql.SQL("INSERT INTO public.{table} AS t ({columns}) VALUES %s {conflict}").format(
+            table=sql.Identifier(table_name),
+            columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
+            conflict=AccessSql.upsert_conflict_clause(columns))
 
-        if coh_data:
-            raster_bin = AccessSql.read_geotiff_bin(coh_data)
-            coh_rast_query = """ST_FromGDALRaster(%s::bytea)"""
+        # Rasters are loaded as GDAL rasters or out-db references on the server, all other values are passed as they are.
+        template = "(" + ", ".join(AccessSql.RASTER_STORAGES[storage].format(value="%({})s".format(column))
+                                   if column in AccessSql.RASTER_COLUMNS else "%({})s".format(column)
+                                   for column in columns) + ")"
 
-            # Replace path with raster binary at same position
-            valid_parameter_values = AccessSql.insert_list_at_item(valid_parameter_values, coh_data, [raster_bin])
+        rows_affected = 0
+        rows = iter(rows)
 
-            # Get index of parameter position
-            index = valid_parameter_list.index("coh_data")
+        try:
+            with db_connector.cursor() as cursor:
+                while True:
+                    batch = list(islice(rows, batch_size))
+                    if not batch:
+                        break
 
-            # Replace simple parameter name in query with query Postgis command to load raster binary as GDAL Raster
-            query_parameter_markers.pop(index)
-            query_parameter_markers.insert(index, coh_rast_query)
+                    batch = AccessSql.merge_rows_by_key(batch)
+                    if AccessSql.band_stats_enabled(db_connector, table_name):
+                        AccessSql.enter_band_stats(db_connector, table_name, batch, page_size)
 
-        if s2_data:
-            raster_bin = AccessSql.read_geotiff_bin(s2_data)
-            s2_rast_query = """ST_FromGDALRaster(%s::bytea)"""
+                    if storage == "dedup":
+                        batch = AccessSql.store_rasters(db_connector, batch, page_size)
 
-            # Replace path with raster binary at same position
-            valid_parameter_values = AccessSql.insert_list_at_item(valid_parameter_values, s2_data, [raster_bin])
+                    batch = [AccessSql.prepare_upsert_row(row, storage, columns) for row in batch]
 
-            # Get index of parameter position
-            index = valid_parameter_list.index("s2_data")
+                    execute_values(cursor, query.as_string(db_connector), batch, template=template,
+                                   page_size=page_size)
+                    rows_affected += len(batch)
 
-            # Replace simple parameter name in query with query Postgis command to load raster binary as GDAL Raster
-            query_parameter_markers.pop(index)
-            query_parameter_markers.insert(index, s2_rast_query)
+                    db_connector.commit()
+                    metrics.count("agriref_rows_entered", len(batch))
 
-        if s2_interp_data:
-            raster_bin = AccessSql.read_geotiff_bin(s2_interp_data)
-            s2_rast_query = """ST_FromGDALRaster(%s::bytea)"""
+                    for row in batch:
+                        AccessSql.invalidate_cached_rows(table_name, row["field_id"], row["date"])
 
-            # Replace path with raster binary at same position
-            valid_parameter_values = AccessSql.insert_list_at_item(valid_parameter_values, s2_interp_data, [raster_bin])
+        except (Exception, psycopg2.Error) as e:
+            logger.error("Error entering rows after %s rows: %s", rows_affected, e)
+            db_connector.rollback()
+            raise
 
-            # Get index of parameter position
-            index = valid_parameter_list.index("s2_interp_data")
+        return rows_affected
 
-            # Replace simple parameter name in query with query Postgis command to load raster binary as GDAL Raster
-            query_parameter_markers.pop(index)
-            query_parameter_markers.insert(index, s2_rast_query)
+    @staticmethod
+    def upsert_conflict_clause(columns):
+        """
+        Build the ON CONFLICT clause merging the non-null values of a new row into the row already entered.
+        The target table has to be aliased as t.
 
-        # Construct the SQL query for insertion with only non-None parameters
-        query = """
-            INSERT INTO public.{} (
-                {}
-            )
-            VALUES ({})""".format(table_name, ", ".join(valid_parameter_list),", ".join(query_parameter_markers))
+        Parameters:
+            columns (list): The inserted columns.
 
-        # Execute the query with the provided data
-        db_cursor.execute(query, valid_parameter_values)
+        Returns:
+            sql.Composed: The ON CONFLICT clause.
+        """
+        assignments = sql.SQL(", ").join(
+            sql.SQL("{column} = COALESCE(EXCLUDED.{column}, t.{column})").format(column=sql.Identifier(column))
+            for column in columns if column not in ("field_id", "date"))
 
-        # Commit the transaction
-        db_connector.commit()
+        return sql.SQL("ON CONFLICT (field_id, date) DO UPDATE SET {}").format(assignments)
+
+    @staticmethod
+    def merge_rows_by_key(rows):
+        """
+        Merge rows with the same field_id and date, later non-null values replace earlier ones.
+        A statement with ON CONFLICT DO UPDATE must not contain the same key twice. Rows without key are dropped.
+
+        Parameters:
+            rows: Iterable of the rows as dictionaries.
+
+        Returns:
+            list: The merged rows in order of their first occurrence.
+        """
+        merged = {}
+        for row in rows:
+            if not row.get("field_id") or not row.get("date"):
+                logger.warning("Row without valid identifiers field_id and date dropped.")
+                continue
+
+            key = (row["field_id"], str(row["date"]))
+            if key in merged:
+                merged[key].update({column: value for column, value in row.items() if value is not None})
+            else:
+                merged[key] = dict(row)
+
+        return list(merged.values())
+
+    @staticmethod
+    def prepare_upsert_row(row, storage="indb", columns=None):
+        """
+        Complete a row with all columns of the field_day table and read the rasters given as path.
+        Out-db rasters are not read, but replaced by the absolute path of their COG.
+
+        Parameters:
+            row (dict): The column values of the row.
+            storage (str): The raster storage, one of RASTER_STORAGES.
+            columns (list, optional): The entered columns. Defaults to FIELD_DAY_COLUMNS.
+
+        Returns:
+            dict: The row with a value for each column.
+        """
+        prepared = {}
+        for column in columns or AccessSql.FIELD_DAY_COLUMNS:
+            value = row.get(column)
+
+            if value is not None and column in AccessSql.RASTER_COLUMNS:
+                if storage == "outdb":
+                    value = AccessSql.outdb_path(value)
+                elif isinstance(value, str):
+                    value = AccessSql.read_geotiff_bin(value)
+                else:
+                    value = psycopg2.Binary(bytes(value))
+
+            prepared[column] = value
+
+        return prepared
+
+    @staticmethod
+    def ensure_field_day_unique_key(db_connector, table_name):
+        """
+        Create the unique key on (field_id, date) of the field_day table if it does not exist yet.
+        Rows entered twice are removed beforehand. The statements are shared with migration 1 of DbSchema.
+
+        Parameters:
+            db_connector (psycopg2.extensions.connection): The database connection object.
+            table_name: The name of the field_day table.
+        """
+        try:
+            with db_connector.cursor() as cursor:
+                for statement, index_name in AccessSql.FIELD_DAY_UNIQUE_KEY_STATEMENTS:
+                    names = {"field_day": sql.Identifier(table_name)}
+                    if index_name:
+                        names["index"] = sql.Identifier(index_name.format(field_day=table_name))
+
+                    cursor.execute(sql.SQL(statement).format(**names))
+                    logger.info("Creating unique key: %s", cursor.statusmessage)
+
+            db_connector.commit()
+
+        except psycopg2.Error as e:
+            logger.error("Error creating unique key: %s", e)
+            db_connector.rollback()
 
     @staticmethod
     def update_partial_row(db_cursor, db_connector, table_name, ras_as_bin=False, field_id=None, date=None, size=None,
@@ -582,7 +992,7 @@ class AccessSql:
                            bsc_data=None, bsc_interp_data=None, bsc_valid=None,
                            coh_data=None, coh_interp_data=None, coh_valid=None,
                            s2_data=None, s2_interp_data=None, s2_valid=None,
-                           temp_min=None, temp_max=None, temp_mean=None, precip=None):
+                           temp_min=None, temp_max=None, temp_mean=None, precip=None, storage=None):
 
         """
         Update a partial row in the field_day table.
@@ -611,23 +1021,54 @@ class AccessSql:
             temp_max (float, optional): The maximum temperature.
             temp_mean (float, optional): The mean temperature.
             precip (float, optional): The precipitation.
+            storage (str, optional): The raster storage, one of RASTER_STORAGES. Defaults to DbConfig.raster_storage.
+            Out-db rasters are given as path to a geotiff file.
         """
 
         if not field_id or not date:
-            print("No valid identifiers field_id and date given to identify row to update.")
+            logger.warning("No valid identifiers field_id and date given to identify row to update.")
+
+        storage = AccessSql.resolve_raster_storage(storage)
+
+        if storage == "dedup":
+            # The rasters are stored once by content hash, the row is updated with the hashes.
+            row = {"field_id": field_id, "date": date, "size": size, "bbch_phase": bbch_phase, "bbch_sim": bbch_sim,
+                   "bsc_data": bsc_data, "bsc_interp_data": bsc_interp_data, "bsc_valid": bsc_valid,
+                   "coh_data": coh_data, "coh_interp_data": coh_interp_data, "coh_valid": coh_valid,
+                   "s2_data": s2_data, "s2_interp_data": s2_interp_data, "s2_valid": s2_valid,
+                   "temp_min": temp_min, "temp_max": temp_max, "temp_mean": temp_mean, "precip": precip}
+            row = AccessSql.store_rasters(db_connector, [row])[0]
+
+            columns = [column for column in AccessSql.entered_columns(storage) if column not in ("field_id", "date")]
+            db_cursor.execute(sql.SQL("UPDATE public.{} SET {} WHERE field_id = %(field_id)s AND date = %(date)s")
+                              .format(sql.Identifier(table_name), sql.SQL(", ").join(
+                                  sql.SQL("{column} = COALESCE({value}, {column})").format(
+                                      column=sql.Identifier(column), value=sql.Placeholder(column))
+                                  for column in columns)),
+                              {column: row.get(column) for column in columns + ["field_id", "date"]})
+
+            logger.debug("Rows affected: %s", db_cursor.rowcount)
+            db_connector.commit()
+            AccessSql.invalidate_cached_rows(table_name, field_id, date)
+            return
 
         # Move this to sql class for all raster data types.
         raster_bsc = raster_coh = raster_s2 = raster_s2_interp = None
-        if bsc_data:
+        if storage == "outdb":
+            raster_bsc, bsc_interp_data, raster_coh, coh_interp_data, raster_s2, raster_s2_interp = (
+                AccessSql.outdb_path(raster) if raster else None for raster in
+                (bsc_data, bsc_interp_data, coh_data, coh_interp_data, s2_data, s2_interp_data))
+
+        elif bsc_data:
             raster_bsc = bsc_data if ras_as_bin else AccessSql.read_geotiff_bin(bsc_data)
 
-        if coh_data:
+        if coh_data and storage == "indb":
             raster_coh = coh_data if ras_as_bin else AccessSql.read_geotiff_bin(coh_data)
 
-        if s2_data:
+        if s2_data and storage == "indb":
             raster_s2 = s2_data if ras_as_bin else AccessSql.read_geotiff_bin(s2_data)
 
-        if s2_interp_data:
+        if s2_interp_data and storage == "indb":
             raster_s2_interp = AccessSql.read_geotiff_bin(s2_interp_data)
 
         # Construct the SQL query for updating the remaining columns
@@ -638,21 +1079,21 @@ class AccessSql:
                     size = COALESCE(%s, size), 
                     bbch_phase = COALESCE(%s, bbch_phase), 
                     bbch_sim = COALESCE(%s, bbch_sim), 
-                    bsc_data = COALESCE(ST_FromGDALRaster(%s::bytea), bsc_data), 
-                    bsc_interp_data = COALESCE(ST_FromGDALRaster(%s::bytea), bsc_interp_data), 
+                    bsc_data = COALESCE({raster}, bsc_data), 
+                    bsc_interp_data = COALESCE({raster}, bsc_interp_data), 
                     bsc_valid = COALESCE(%s, bsc_valid), 
-                    coh_data = COALESCE(ST_FromGDALRaster(%s::bytea), coh_data), 
-                    coh_interp_data = COALESCE(ST_FromGDALRaster(%s::bytea), coh_interp_data), 
+                    coh_data = COALESCE({raster}, coh_data), 
+                    coh_interp_data = COALESCE({raster}, coh_interp_data), 
                     coh_valid = COALESCE(%s, coh_valid), 
-                    s2_data = COALESCE(ST_FromGDALRaster(%s::bytea), s2_data), 
-                    s2_interp_data = COALESCE(ST_FromGDALRaster(%s::bytea), s2_interp_data), 
+                    s2_data = COALESCE({raster}, s2_data), 
+                    s2_interp_data = COALESCE({raster}, s2_interp_data), 
                     s2_valid = COALESCE(%s, s2_valid), 
                     temp_min = COALESCE(%s, temp_min), 
                     temp_max = COALESCE(%s, temp_max), 
                     temp_mean = COALESCE(%s, temp_mean), 
                     precip = COALESCE(%s, precip)
                 WHERE field_id = %s AND date = %s  -- Add condition to match the specific entry
-            """.format(table_name)
+            """.format(table_name, raster=AccessSql.RASTER_STORAGES[storage].format(value="%s"))
 
         # Execute the update query with the provided data
         db_cursor.execute(update_query2, (
@@ -664,10 +1105,105 @@ class AccessSql:
             field_id, date  # Condition to match the specific entry
         ))
 
-        print("Rows affected:" + str(db_cursor.rowcount))
+        logger.debug("Rows affected: %s", db_cursor.rowcount)
 
         # Commit the transaction
         db_connector.commit()
+        AccessSql.invalidate_cached_rows(table_name, field_id, date)
+
+    @staticmethod
+    @metrics.timed("agriref_query_seconds", {"query": "copy_field_series"})
+    def copy_field_series(db_connector, table_name, rows, storage=None):
+        """
+        Bulk load whole field time series into the field_day table with COPY ... FROM STDIN.
+        The rows are streamed into a temporary staging table and merged into the table with a single statement,
+        which converts the rasters with ST_FromGDALRaster. Rows of a field_id and date that are already entered
+        are merged with the non-null values. The band statistics are entered as well, see band_stats_enabled().
+        Everything is committed once.
+
+        Parameters:
+            db_connector (psycopg2.extensions.connection): The database connection object.
+            table_name: The name of the field_day table to load the rows to.
+            rows: Iterable of dictionaries mapping column names of FIELD_DAY_COLUMNS to values. Raster columns hold
+            the path to a geotiff file or the raster binary. Missing columns are entered as NULL. The source files of
+            a row given as "source_files" are entered into the ingest manifest in the same transaction, see
+            ingest_manifest_enabled().
+            storage (str, optional): The raster storage, one of RASTER_STORAGES. Defaults to DbConfig.raster_storage.
+
+        Returns:
+            int: The number of rows entered or merged, 0 if no row has a field_id and date. None is returned on error,
+            nothing is entered then.
+        """
+        staging_table = "field_day_staging"
+        storage = AccessSql.resolve_raster_storage(storage)
+        columns = AccessSql.entered_columns(storage)
+
+        # Out-db rasters are staged as the path of their COG.
+        staging_columns = sql.SQL(", ").join(
+            sql.SQL("{} {}").format(sql.Identifier(column),
+                                    sql.SQL(("TEXT" if storage == "outdb" else "BYTEA")
+                                            if column in AccessSql.RASTER_COLUMNS
+                                            else AccessSql.FIELD_DAY_STAGING_TYPES[column]))
+            for column in columns)
+
+        select_columns = sql.SQL(", ").join(
+            sql.SQL(AccessSql.RASTER_STORAGES[storage].format(value="s.{}")).format(sql.Identifier(column))
+            if column in AccessSql.RASTER_COLUMNS else sql.SQL("s.{}").format(sql.Identifier(column))
+            for column in columns)
+
+        column_list = sql.SQL(", ").join(map(sql.Identifier, columns))
+
+        # Rows already entered are merged with the non-null staged values. The staged rows hold each key once, as a
+        # single ON CONFLICT DO UPDATE statement must not contain the same key twice.
+        merge_query = sql.SQL("""
+            INSERT INTO public.{table} AS t ({columns})
+            SELECT {select_columns}
+            FROM {staging} s
+            {conflict}
+        """).format(table=sql.Identifier(table_name), columns=column_list, select_columns=select_columns,
+                    staging=sql.Identifier(staging_table), conflict=AccessSql.upsert_conflict_clause(columns))
+
+        try:
+            # Rows of the same key are merged as by upsert_partial_rows(), rows without key are dropped.
+            rows = AccessSql.merge_rows_by_key(rows)
+
+            # The statistics are computed from the rasters as given, before they are replaced by their hash.
+            if AccessSql.band_stats_enabled(db_connector, table_name):
+                AccessSql.enter_band_stats(db_connector, table_name, rows)
+
+            if storage == "dedup":
+                rows = AccessSql.store_rasters(db_connector, rows)
+
+            with db_connector.cursor() as cursor:
+                cursor.execute(sql.SQL("CREATE TEMP TABLE {} ({}) ON COMMIT DROP").format(
+                    sql.Identifier(staging_table), staging_columns))
+
+                copy_query = sql.SQL("COPY {} ({}) FROM STDIN").format(sql.Identifier(staging_table), column_list)
+                cursor.copy_expert(copy_query.as_string(db_connector),
+                                   CopyRowStream(AccessSql.format_copy_line(row, columns, storage) for row in rows))
+
+                cursor.execute(merge_query)
+                rows_entered = cursor.rowcount
+
+            if AccessSql.ingest_manifest_enabled(db_connector, table_name):
+                AccessSql.enter_ingest_manifest(db_connector, table_name, rows)
+
+            db_connector.commit()
+            logger.info("Rows entered: %s", rows_entered)
+            metrics.count("agriref_rows_entered", rows_entered)
+            metrics.count("agriref_bytes_entered", sum(AccessSql.copy_payload_size(row, columns, storage)
+                                                       for row in rows))
+
+            for row in rows:
+                if row.get("field_id"):
+                    AccessSql.invalidate_cached_rows(table_name, row["field_id"], row.get("date"))
+
+            return rows_entered
+
+        except (Exception, psycopg2.Error) as e:
+            logger.error("Error loading field series: %s", e)
+            db_connector.rollback()
+            return None
 
     @staticmethod
     def delete_rows_by_id(db_connector, db_cursor, table_name, record_id):
@@ -699,50 +1235,67 @@ class AccessSql:
 
             # Commit the transaction
             db_connector.commit()
+            AccessSql.invalidate_cached_rows(table_name, record_id)
 
             return rows_deleted
 
         except psycopg2.Error as e:
-            print(f"Error: {e}")
+            logger.error("Error: %s", e)
             if db_connector:
                 db_connector.rollback()
             return 0
 
     @staticmethod
-    def connect_and_filter_by_complete(bsc, coh, s2, s2_invalid):
+    def connect_and_filter_by_complete(bsc, coh, s2, s2_invalid, raster_format="gtiff", columns=None):
         """
             This connects to database and filters out all rows from field_day table as following:
             - Raster data is complete and more than 50% of the pixel are valid.
+            The rasters are transferred in raster_format, one of RASTER_FORMATS. Only the given columns are fetched,
+            "metadata" fetches all scalar columns without rasters.
         """
         rows = None
-        db_connector = None
 
-        time.sleep(3)
         try:
-            db_connector = psycopg2.connect(database="agriRef", user="postgres", host="localhost",
-                                            password="sentinel22", port="5432")
+            with AccessSql.db_session() as (db_connector, _):
+                rows = AccessSql.filter_field_day(db_connector, bsc, coh, s2, s2_invalid, raster_format, columns)
 
-            cursor = db_connector.cursor()
-            query = "SET postgis.gdal_enabled_drivers TO 'ENABLE_ALL'"
-            cursor.execute(query)
+        except (Exception, psycopg2.Error) as error:
+            logger.error("Error while connecting to PostgreSQL: %s", error)
 
-            rows = AccessSql.filter_field_day(db_connector, bsc, coh, s2, s2_invalid)
+        return rows
 
-        except (Exception, psycopg2.Error) as error:
-            print("Error while connecting to PostgreSQL", error)
+    @staticmethod
+    def stream_filter_by_complete(bsc, coh, s2, s2_invalid, itersize=None, raster_format="gtiff", columns=None,
+                                  ordered=False, after_key=None, table_name="field_day_c"):
+        """
+            This connects to database and streams all rows from field_day table filtered as in
+            connect_and_filter_by_complete(). The pooled connection is held until the generator is exhausted or closed.
 
-        finally:
-            # Close the cursor and connection
-            if db_connector:
-                db_connector.close()
-                print("PostgreSQL connection is closed")
-                return rows
+            Parameters:
+                s2_invalid: The flag to define if s2 is retrieved with less than 50% valid pixel.
+                s2: The flag to define if s2 radar data must be available in table.
+                coh: The flag to define if coh radar data must be available in table.
+                bsc: The flag to define if bsc radar data must be available in table.
+                itersize: The amount of rows fetched from the server at once. Defaults to DbConfig.stream_itersize.
+                raster_format: The transfer format of the rasters, one of RASTER_FORMATS.
+                columns: The columns to fetch, "metadata" for all scalar columns. Defaults to all columns.
+                ordered: The flag to return the rows ordered by field_id and date.
+                after_key: Only rows ordered after this (field_id, date) are returned, to continue a stream.
+                table_name: The name of the field_day table.
+
+            Yields:
+                tuple: The rows one by one.
+        """
+        with AccessSql.db_session() as (db_connector, _):
+            yield from AccessSql.iter_field_day(db_connector, bsc, coh, s2, s2_invalid, itersize, raster_format,
+                                                columns, ordered, after_key, table_name)
 
     @staticmethod
-    def filter_field_day(db_connector, bsc, coh, s2, s2_invalid):
+    def filter_field_day(db_connector, bsc, coh, s2, s2_invalid, raster_format="gtiff", columns=None):
         """
             This filters out all rows from field_day table as following:
             - Raster data is complete and more than 50% of the pixel are valid.
+            Use iter_field_day() to process large results without holding all rows in memory.
 
             Parameters:
                 db_connector (psycopg2.extensions.connection): The database connection object.
@@ -750,23 +1303,44 @@ class AccessSql:
                 s2: The flag to define if s2 radar data must be available in table.
                 coh: The flag to define if coh radar data must be available in table.
                 bsc: The flag to define if bsc radar data must be available in table.
+                raster_format: The transfer format of the rasters, one of RASTER_FORMATS.
+                columns: The columns to fetch, "metadata" for all scalar columns. Defaults to all columns.
         """
 
-        cursor = db_connector.cursor()
+        rows = list(AccessSql.iter_field_day(db_connector, bsc, coh, s2, s2_invalid, raster_format=raster_format,
+                                             columns=columns))
+
+        logger.info("The amount of rows with all values valid is: %s", len(rows))
+
+        return rows
+
+    @staticmethod
+    def iter_field_day(db_connector, bsc, coh, s2, s2_invalid, itersize=None, raster_format="gtiff", columns=None,
+                       ordered=False, after_key=None, table_name="field_day_c"):
+        """
+            This streams all rows from field_day table filtered as in filter_field_day() with a named (server-side)
+            cursor. Only itersize rows are held in client memory at once and the first rows are available immediately.
+
+            Parameters:
+                db_connector (psycopg2.extensions.connection): The database connection object.
+                s2_invalid: The flag to define if s2 is retrieved with less than 50% valid pixel.
+                s2: The flag to define if s2 radar data must be available in table.
+                coh: The flag to define if coh radar data must be available in table.
+                bsc: The flag to define if bsc radar data must be available in table.
+                itersize: The amount of rows fetched from the server at once. Defaults to DbConfig.stream_itersize.
+                raster_format: The transfer format of the rasters, one of RASTER_FORMATS.
+                columns: The columns to fetch, "metadata" for all scalar columns. Defaults to all columns.
+                ordered: The flag to return the rows ordered by field_id and date.
+                after_key: Only rows ordered after this (field_id, date) are returned, to continue a stream.
+                It implies ordered.
+                table_name: The name of the field_day table.
+
+            Yields:
+                tuple: The rows one by one.
+        """
 
         # Define the SQL query
-        query_start = f"""
-            SELECT field_id, date, size, bbch_phase, bbch_sim, 
-                        ST_AsGDALRaster(bsc_data, 'GTIFF') AS bsc_data,
-                        ST_AsGDALRaster(bsc_interp_data, 'GTIFF') AS bsc_interp_data,
-                        bsc_valid,
-                        ST_AsGDALRaster(coh_data, 'GTIFF') AS coh_data,
-                        ST_AsGDALRaster(coh_interp_data, 'GTIFF') AS coh_interp_data,
-                        coh_valid,
-                        ST_AsGDALRaster(s2_data, 'GTIFF') AS s2_data,
-                        ST_AsGDALRaster(s2_interp_data, 'GTIFF') AS s2_interp_data,
-                        s2_valid, temp_min, temp_max, temp_mean, precip
-            FROM public.field_day_c
+        query_start = """
             WHERE bbch_phase IS NOT NULL
                 AND bbch_phase > -1
               AND precip IS NOT NULL
@@ -777,13 +1351,20 @@ class AccessSql:
         conditional_clauses = []
 
         if bsc:
-            conditional_clauses.append("bsc_data IS NOT NULL AND bsc_valid = TRUE")
+            conditional_clauses.append(AccessSql.raster_present("bsc_data") + " AND bsc_valid = TRUE")
         if coh:
-            conditional_clauses.append("coh_data IS NOT NULL AND coh_valid = TRUE")
+            conditional_clauses.append(AccessSql.raster_present("coh_data") + " AND coh_valid = TRUE")
         if s2 and not s2_invalid:
-            conditional_clauses.append("s2_data IS NOT NULL AND s2_valid = TRUE")
+            conditional_clauses.append(AccessSql.raster_present("s2_data") + " AND s2_valid = TRUE")
         if s2 and s2_invalid:
-            conditional_clauses.append("s2_data IS NOT NULL")
+            conditional_clauses.append(AccessSql.raster_present("s2_data"))
+
+        # The row comparison is answered from the unique index on (field_id, date), so a stream continues without a
+        # full scan.
+        params = None
+        if after_key is not None:
+            conditional_clauses.append("(field_id, date) > (%s, %s)")
+            params = tuple(after_key)
 
         # Combine base query with conditional clauses
         if conditional_clauses:
@@ -791,26 +1372,39 @@ class AccessSql:
         else:
             full_query = query_start
 
-        query = sql.SQL(full_query)
+        if ordered or after_key is not None:
+            full_query += " ORDER BY field_id, date"
 
-        # Execute the query
-        cursor.execute(query)
+        query = sql.SQL("SELECT {} FROM {}").format(sql.SQL(AccessSql.field_day_select_list(raster_format,
+                                                                                             columns=columns)),
+                                                     AccessSql.table_identifier(table_name)) + sql.SQL(full_query)
 
-        # Fetch all rows
-        rows = cursor.fetchall()
+        yield from AccessSql.stream_query(db_connector, query, params, itersize=itersize)
 
-        print("The amount of rows with all values valid is: " + str(len(rows)))
+    @staticmethod
+    def stream_query(db_connector, query, params=None, itersize=None, cursor_factory=None):
+        """
+            Execute a query with a named (server-side) cursor and yield the result rows.
+            The rows are transferred in portions of itersize rows while iterating.
 
-        # Print or process the fetched rows as needed
-        for row in rows:
-            field_id, date, size, bbch_phase, bbch_sim, bsc_data, bsc_interp_data, bsc_valid, \
-                coh_data, coh_interp_data, coh_valid, s2_data, s2_interp_data, s2_valid, \
-                temp_min, temp_max, temp_mean, precip = row
+            Parameters:
+                db_connector (psycopg2.extensions.connection): The database connection object.
+                query: The query to execute.
+                params: The query parameters.
+                itersize: The amount of rows fetched from the server at once. Defaults to DbConfig.stream_itersize.
+                cursor_factory: The cursor factory, e.g. DictCursor.
 
-            print("Field id: " + str(field_id if field_id else -1) + ", date: " + str(date if date else -1) + ", bbch : ",
-                  str(bbch_phase if bbch_phase is not None else -1))
+            Yields:
+                The rows one by one.
+        """
+        cursor = db_connector.cursor(name="agri_ref_stream_" + uuid.uuid4().hex, cursor_factory=cursor_factory)
+        cursor.itersize = itersize or DbConfig.stream_itersize
 
-        return rows
+        try:
+            cursor.execute(query, params)
+            yield from cursor
+        finally:
+            cursor.close()
 
     @staticmethod
     def get_valid_bbch_phase(cursor, field_id: int, date: str) -> Optional[int]:
@@ -852,68 +1446,257 @@ class AccessSql:
             return None
 
     @staticmethod
-    def fetch_bbch_extended_rows(db_connector, bsc: bool, coh: bool, s2: bool) -> List[Tuple[Any]]:
+    def fetch_bbch_extended_rows(db_connector, bsc: bool, coh: bool, s2: bool,
+                                 fill_strategy: str = "previous", raster_format: str = "gtiff",
+                                 columns=None) -> List[Tuple[Any]]:
         """
         Fetch rows from the field_day table based on the given conditions and process them to handle NULL bbch_phase values.
+        Use iter_bbch_extended_rows() to process large results without holding all rows in memory.
 
         Parameters:
         - db_connector: A psycopg2 connection object to the PostgreSQL database.
         - bsc: Boolean flag to filter rows with valid bsc_data.
         - coh: Boolean flag to filter rows with valid coh_data.
         - s2: Boolean flag to filter rows with valid s2_data.
+        - fill_strategy: How NULL bbch_phase values are filled, one of BBCH_FILL_STRATEGIES.
+        - raster_format: The transfer format of the rasters, one of RASTER_FORMATS.
+        - columns: The columns to fetch, "metadata" for all scalar columns. Defaults to all columns.
 
         Returns:
         - List of tuples containing the processed rows.
         """
         try:
-            cursor = db_connector.cursor(cursor_factory=DictCursor)
-
-            base_query = f"""
-                SELECT field_id, date, size, bbch_phase, bbch_sim, 
-                       ST_AsGDALRaster(bsc_data, 'GTIFF') AS bsc_data,
-                       ST_AsGDALRaster(bsc_interp_data, 'GTIFF') AS bsc_interp_data,
-                       bsc_valid,
-                       ST_AsGDALRaster(coh_data, 'GTIFF') AS coh_data,
-                       ST_AsGDALRaster(coh_interp_data, 'GTIFF') AS coh_interp_data,
-                       coh_valid,
-                       ST_AsGDALRaster(s2_data, 'GTIFF') AS s2_data,
-                       ST_AsGDALRaster(s2_interp_data, 'GTIFF') AS s2_interp_data,
-                       s2_valid, temp_min, temp_max, temp_mean, precip
-                FROM public.field_day_c
-                WHERE precip >= 0
-                  AND temp_mean >= 0
-            """
+            return list(AccessSql.iter_bbch_extended_rows(db_connector, bsc, coh, s2, fill_strategy=fill_strategy,
+                                                          raster_format=raster_format, columns=columns))
 
-            conditional_clauses = []
+        except psycopg2.Error as e:
+            logger.error("Error fetching rows from database: %s", e)
+            return []
 
-            if bsc:
-                conditional_clauses.append("bsc_data IS NOT NULL AND bsc_valid = TRUE")
-            if coh:
-                conditional_clauses.append("coh_data IS NOT NULL AND coh_valid = TRUE")
-            if s2:
-                conditional_clauses.append("s2_data IS NOT NULL AND s2_valid = TRUE")
+    # Expressions filling a NULL bbch_phase from the preceding or following valid bbch_phase of the same field.
+    # "previous" and "next" fall back to the other direction, "nearest" takes the closer one in time.
+    BBCH_FILL_STRATEGIES = {
+        "previous": "COALESCE(prev_bbch, next_bbch)",
+        "next": "COALESCE(next_bbch, prev_bbch)",
+        "nearest": """CASE WHEN prev_bbch IS NULL THEN next_bbch
+                           WHEN next_bbch IS NULL THEN prev_bbch
+                           WHEN date - prev_date <= next_date - date THEN prev_bbch
+                           ELSE next_bbch END"""
+    }
 
-            if conditional_clauses:
-                base_query += " AND " + " AND ".join(conditional_clauses)
+    @staticmethod
+    def iter_bbch_extended_rows(db_connector, bsc: bool, coh: bool, s2: bool, itersize=None,
+                                fill_strategy: str = "previous", raster_format: str = "gtiff", columns=None):
+        """
+        Stream rows from the field_day table as in fetch_bbch_extended_rows() with a named (server-side) cursor.
+        The NULL bbch_phase values are filled within the query with window functions over (field_id, date),
+        so the whole fetch is one ordered scan of the table.
 
-            cursor.execute(base_query)
-            rows = cursor.fetchall()
+        Parameters:
+        - db_connector: A psycopg2 connection object to the PostgreSQL database.
+        - bsc: Boolean flag to filter rows with valid bsc_data.
+        - coh: Boolean flag to filter rows with valid coh_data.
+        - s2: Boolean flag to filter rows with valid s2_data.
+        - itersize: The amount of rows fetched from the server at once. Defaults to DbConfig.stream_itersize.
+        - fill_strategy: How NULL bbch_phase values are filled, one of BBCH_FILL_STRATEGIES.
+        - raster_format: The transfer format of the rasters, one of RASTER_FORMATS.
+        - columns: The columns to fetch, "metadata" for all scalar columns. Defaults to all columns.
 
-            processed_rows = []
+        Yields:
+        - The processed rows one by one.
+        """
+        if fill_strategy not in AccessSql.BBCH_FILL_STRATEGIES:
+            raise ValueError(f"Unknown bbch fill strategy: {fill_strategy}")
+
+        # The running count of valid bbch phases groups each row with its preceding (or following) valid bbch phase,
+        # which is then the first value of the group. The windows run over all rows of a field before filtering.
+        bbch_fill = f"COALESCE(bbch_phase, {AccessSql.BBCH_FILL_STRATEGIES[fill_strategy]}) AS bbch_phase"
+
+        base_query = f"""
+            SELECT {AccessSql.field_day_select_list(raster_format, {"bbch_phase": bbch_fill}, columns)}
+            FROM (
+                SELECT grouped.*,
+                       first_value(bbch_phase) OVER (PARTITION BY field_id, prev_group ORDER BY date) AS prev_bbch,
+                       first_value(date) OVER (PARTITION BY field_id, prev_group ORDER BY date) AS prev_date,
+                       first_value(bbch_phase) OVER (PARTITION BY field_id, next_group ORDER BY date DESC) AS next_bbch,
+                       first_value(date) OVER (PARTITION BY field_id, next_group ORDER BY date DESC) AS next_date
+                FROM (
+                    SELECT field_day.*,
+                           count(bbch_phase) OVER (PARTITION BY field_id ORDER BY date) AS prev_group,
+                           count(bbch_phase) OVER (PARTITION BY field_id ORDER BY date DESC) AS next_group
+                    FROM public.field_day_c field_day
+                ) grouped
+            ) filled
+            WHERE precip >= 0
+              AND temp_mean >= 0
+        """
 
-            for row in rows:
-                if row['bbch_phase'] is None:
-                    new_bbch_phase = AccessSql.get_valid_bbch_phase(cursor, row['field_id'], row['date'])
-                    if new_bbch_phase is not None:
-                        row['bbch_phase'] = new_bbch_phase
-                processed_rows.append(row)
+        conditional_clauses = []
 
-            cursor.close()
-            return processed_rows
+        if bsc:
+            conditional_clauses.append(AccessSql.raster_present("bsc_data") + " AND bsc_valid = TRUE")
+        if coh:
+            conditional_clauses.append(AccessSql.raster_present("coh_data") + " AND coh_valid = TRUE")
+        if s2:
+            conditional_clauses.append(AccessSql.raster_present("s2_data") + " AND s2_valid = TRUE")
+
+        if conditional_clauses:
+            base_query += " AND " + " AND ".join(conditional_clauses)
+
+        yield from AccessSql.stream_query(db_connector, base_query, itersize=itersize, cursor_factory=DictCursor)
+
+    @staticmethod
+    def fetch_meteo_features(db_connector, table_name, field_ids, start_date, end_date, rolling_weeks=4):
+        """
+        Fetch the weekly agro-meteorological features of fields from the continuous aggregate of the field_day table,
+        see DbSchema.create_meteo_aggregate(). The growing degree days are accumulated from the start of each year.
+
+        Parameters:
+        - db_connector: psycopg2 database connection object
+        - table_name: The name of the field_day table
+        - field_ids: The field_ids to fetch the features of
+        - start_date: The first week to fetch
+        - end_date: The last week to fetch
+        - rolling_weeks: Amount of weeks of the rolling precipitation sum
+
+        Returns:
+        - List of tuples (field_id, week, temp_mean, temp_min, temp_max, precip, gdd, gdd_cumulative, precip_rolling)
+          ordered by field_id and week. None on error.
+        """
+        rolling_weeks = int(rolling_weeks)
+
+        # The windows are computed before the start date filter, so the sums include the weeks before it. The rolling
+        # sum covers a range of dates, so weeks missing in the aggregate do not extend it further back.
+        query = sql.SQL("""
+            SELECT field_id, week, temp_mean, temp_min, temp_max, precip, gdd, gdd_cumulative, precip_rolling
+            FROM (
+                SELECT field_id, week, temp_mean, temp_min, temp_max, precip, gdd,
+                       sum(gdd) OVER (PARTITION BY field_id, date_trunc('year', week)
+                                      ORDER BY week) AS gdd_cumulative,
+                       sum(precip) OVER (PARTITION BY field_id ORDER BY week
+                                         RANGE BETWEEN {preceding} PRECEDING AND CURRENT ROW) AS precip_rolling
+                FROM public.{view}
+                WHERE field_id = ANY(%s::bigint[])
+                  AND week >= LEAST(date_trunc('year', %s::date), %s::date - %s * INTERVAL '7 days')
+                  AND week <= %s::date
+            ) features
+            WHERE week >= time_bucket(INTERVAL '7 days', %s::date)
+            ORDER BY field_id, week
+        """).format(view=sql.Identifier(AccessSql.meteo_aggregate_name(table_name)),
+                    preceding=sql.SQL("INTERVAL {}").format(sql.Literal(f"{max(rolling_weeks - 1, 0) * 7} days")))
+
+        try:
+            with db_connector.cursor() as cursor:
+                cursor.execute(query, (list(field_ids), start_date, start_date, rolling_weeks, end_date, start_date))
+                return cursor.fetchall()
 
         except psycopg2.Error as e:
-            print(f"Error fetching rows from database: {e}")
-            return []
+            logger.error("Error fetching meteo features: %s", e)
+            db_connector.rollback()
+            return None
+
+    @staticmethod
+    def fetch_band_stats_series(db_connector, table_name, field_id, raster_column, band=1, start_date=None,
+                                end_date=None):
+        """
+        Fetch the time series of the band statistics of a field computed at ingest. No raster is read.
+
+        Parameters:
+        - db_connector: psycopg2 database connection object
+        - table_name: The name of the field_day table
+        - field_id: ID of the field
+        - raster_column: The raster column, one of RASTER_COLUMNS
+        - band: The band number starting with 1
+        - start_date: The first date to fetch, optional
+        - end_date: The last date to fetch, optional
+
+        Returns:
+        - List of tuples (date, mean, std, min, max, valid_count) ordered by date. None on error.
+        """
+        if raster_column not in AccessSql.RASTER_COLUMNS:
+            raise ValueError(f"Unknown raster column: {raster_column}")
+
+        query = sql.SQL("""
+            SELECT date, mean, std, min, max, valid_count
+            FROM public.{}
+            WHERE field_id = %s AND raster_column = %s AND band = %s
+              AND (%s::date IS NULL OR date >= %s::date)
+              AND (%s::date IS NULL OR date <= %s::date)
+            ORDER BY date
+        """).format(sql.Identifier(AccessSql.band_stats_name(table_name)))
+
+        try:
+            with db_connector.cursor() as cursor:
+                cursor.execute(query, (field_id, raster_column, band, start_date, start_date, end_date, end_date))
+                return cursor.fetchall()
+
+        except psycopg2.Error as e:
+            logger.error("Error fetching band statistics: %s", e)
+            db_connector.rollback()
+            return None
+
+    @staticmethod
+    def table_exists(db_connector, table_name):
+        """
+        Check if a table exists in the public schema, e.g. a side table created by a schema migration.
+
+        Parameters:
+            db_connector (psycopg2.extensions.connection): The database connection object.
+            table_name: The name of the table.
+
+        Returns:
+            bool: True if the table exists.
+        """
+        if table_name in AccessSql.existing_tables:
+            return True
+
+        with db_connector.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (AccessSql.table_identifier(table_name).as_string(
+                db_connector),))
+            exists = cursor.fetchone()[0]
+
+        if exists:
+            AccessSql.existing_tables.add(table_name)
+
+        return exists
+
+    @staticmethod
+    def band_stats_enabled(db_connector, table_name):
+        """
+        Check if the band statistics are entered with the rows of a field_day table. This needs DbConfig.band_stats and
+        the side table of schema migration 5.
+        """
+        return DbConfig.band_stats and AccessSql.table_exists(db_connector, AccessSql.band_stats_name(table_name))
+
+    @staticmethod
+    def ingest_manifest_enabled(db_connector, table_name):
+        """
+        Check if the source files of the rows entered into a field_day table are recorded in its ingest manifest. This
+        needs DbConfig.ingest_incremental and the manifest table of schema migration 6.
+        """
+        return (DbConfig.ingest_incremental and
+                AccessSql.table_exists(db_connector, AccessSql.ingest_manifest_name(table_name)))
+
+    @staticmethod
+    def band_stats_name(table_name):
+        """
+        Get the name of the side table of the band statistics of a field_day table.
+        """
+        return table_name + "_band_stats"
+
+    @staticmethod
+    def ingest_manifest_name(table_name):
+        """
+        Get the name of the manifest of the source files entered into a field_day table.
+        """
+        return table_name + "_ingest_manifest"
+
+    @staticmethod
+    def meteo_aggregate_name(table_name):
+        """
+        Get the name of the continuous aggregate of the weekly agro-meteorological features of a field_day table.
+        """
+        return table_name + "_meteo_weekly"
 
     @staticmethod
     def query_raster_by_coordinate(db_cursor, table_name, raster_column, lon, lat, srid):
@@ -957,18 +1740,19 @@ class AccessSql:
 
             return results
         else:
-            print("Failed to transform coordinates.")
+            logger.error("Failed to transform coordinates.")
             return []
 
     @staticmethod
-    def query_by_geojson_polygon(table_name, raster_column, geojson_file_path, srid):
+    def query_by_geojson_polygon(table_name, geom_column, geojson_file_path, srid):
         """
             Query a PostGIS table by a GeoJSON polygon from a file.
+            The polygon is passed as query parameter and transformed once, the bounding box prefilter uses the GiST
+            index of the geometry column.
 
             Parameters:
-                - db_cursor (psycopg2.extensions.cursor): The database cursor object.
                 - table_name: The name of the table to query.
-                - raster_column: The name of the raster column in the table.
+                - geom_column: The name of the geometry column in the table.
                 - geojson_file_path: Path to the GeoJSON file containing the polygon.
                 - srid: The SRID of the GeoJSON polygon.
 
@@ -976,38 +1760,664 @@ class AccessSql:
                 - query results.
         """
 
-        db_connector, db_cursor = AccessSql.create_db_connection()
-
         # This depends on the format and content of the geojson file.
         polygon_wkt = geo.load_wkt_from_geojson(geojson_file_path)
-        polygon_wkt = polygon_wkt.replace(" ", "", 1)
 
-        # Convert SRID coordinates to table coordinates 25832
-        query = f"""
-                    SELECT *
-                    FROM {table_name}
-                    WHERE {raster_column} IS NOT NULL
-                    AND ST_Intersects(
-                                     ST_Transform(
-                                                  GeomFromEWKT('SRID={srid};{polygon_wkt}'), 
-                                                  25832
-                                                  ),
-                                     {raster_column});
-                """
-
-        db_cursor.execute(query)
-
-        results = db_cursor.fetchall()
-
-        for row in results:
-            field_id, geom, startdate, enddate, nuar, crop_type, buff_distm, size = row
-            print("Field id: " + str(field_id) + ", date range: [" + str(startdate) + "," + str(enddate) + "], crop type : ",
-                str(crop_type) + ", size in sqm: " + str(size))
+        query = sql.SQL("""
+                    WITH region AS (
+                        SELECT ST_Transform(ST_GeomFromText(%s, %s), 25832) AS geom
+                    )
+                    SELECT t.*
+                    FROM {table} t, region
+                    WHERE t.{column} && region.geom
+                      AND ST_Intersects(t.{column}, region.geom);
+                """).format(table=AccessSql.table_identifier(table_name), column=sql.Identifier(geom_column))
+
+        with AccessSql.db_session() as (db_connector, db_cursor):
+            db_cursor.execute(query, (polygon_wkt, srid))
+            results = db_cursor.fetchall()
+
+        logger.info("Rows intersecting the polygon: %s", len(results))
 
         return results
 
+    @staticmethod
+    def search_fields(db_connector, field_table_name, field_day_table_name, geometry=None, bbox=None, srid=25832,
+                      start_date=None, end_date=None, bsc=False, coh=False, s2=False, handles=False):
+        """
+        Search the fields intersecting a region with one indexed query joining the field and field_day tables.
+        The region is prefiltered by bounding box with the GiST index of the field geometries, the date range and
+        validity flags are pushed down to the chunks and partial indexes of the field_day table.
+
+        Parameters:
+        - db_connector: psycopg2 database connection object
+        - field_table_name: The table holding the field polygons
+        - field_day_table_name: The table holding the data for each day and field
+        - geometry: The region as GeoJSON geometry dict or WKT string, optional
+        - bbox: The region as bounding box (min x, min y, max x, max y), optional
+        - srid: The SRID of the region
+        - start_date: The first date of a row, optional
+        - end_date: The last date of a row, optional
+        - bsc: Only rows with valid bsc data
+        - coh: Only rows with valid coh data
+        - s2: Only rows with valid s2 data
+        - handles: Flag to return the (field_id, date) of the rows instead of the field_ids. The handles can be
+          fetched with fetch_rows().
+
+        Returns:
+        - Sorted list of field_ids, or of (field_id, date) if handles is set. None on error.
+        """
+        if geometry is not None and bbox is not None:
+            raise ValueError("Either a geometry or a bbox can be given.")
+
+        region = None
+        params = []
+
+        # The region is transformed once, && uses the GiST index before the exact intersection.
+        if geometry is not None and isinstance(geometry, dict):
+            region = "ST_Transform(ST_SetSRID(ST_GeomFromGeoJSON(%s), %s), 25832)"
+            params += [geojson.dumps(geometry), srid]
+        elif geometry is not None:
+            region = "ST_Transform(ST_GeomFromText(%s, %s), 25832)"
+            params += [geometry, srid]
+        elif bbox is not None:
+            region = "ST_Transform(ST_MakeEnvelope(%s, %s, %s, %s, %s), 25832)"
+            params += list(bbox) + [srid]
+
+        field_conditions = ["f.geom && region.geom", "ST_Intersects(f.geom, region.geom)"] if region else []
+
+        day_conditions = ["d.field_id = f.field_id"]
+        if start_date:
+            day_conditions.append("d.date >= %s")
+            params.append(start_date)
+        if end_date:
+            day_conditions.append("d.date <= %s")
+            params.append(end_date)
+
+        # Bare boolean conditions match the predicates of the partial indexes.
+        for flag, column in ((bsc, "bsc_valid"), (coh, "coh_valid"), (s2, "s2_valid")):
+            if flag:
+                day_conditions.append("d." + column)
+
+        query = "WITH region AS (SELECT " + region + " AS geom) " if region else ""
+        from_clause = "public.{field} f" + (" CROSS JOIN region" if region else "")
+
+        if handles:
+            query += "SELECT d.field_id, d.date"
+            from_clause += " JOIN public.{field_day} d ON " + " AND ".join(day_conditions)
+            order = "d.field_id, d.date"
+        else:
+            query += "SELECT DISTINCT f.field_id"
+            order = "f.field_id"
+
+            if len(day_conditions) > 1:
+                field_conditions.append("EXISTS (SELECT 1 FROM public.{field_day} d WHERE " +
+                                        " AND ".join(day_conditions) + ")")
+
+        query += " FROM " + from_clause
+        if field_conditions:
+            query += " WHERE " + " AND ".join(field_conditions)
+        query += " ORDER BY " + order
+
+        query = sql.SQL(query).format(field=sql.Identifier(field_table_name),
+                                      field_day=sql.Identifier(field_day_table_name))
+
+        try:
+            with db_connector.cursor() as cursor:
+                cursor.execute(query, params)
+                results = cursor.fetchall()
+
+            return results if handles else [row[0] for row in results]
+
+        except psycopg2.Error as e:
+            logger.error("Error searching fields: %s", e)
+            db_connector.rollback()
+            return None
+
+    @staticmethod
+    def connect_and_search_fields(field_table_name, field_day_table_name, **search):
+        """
+        This connects to the db and searches the fields intersecting a region, see search_fields().
+        :param field_table_name: The table holding the field polygons.
+        :param field_day_table_name: The table holding the data for each day and field.
+        :param search: The keyword arguments of search_fields().
+        :return: Sorted list of field_ids or (field_id, date) handles.
+        """
+
+        try:
+            with AccessSql.db_session() as (db_connector, _):
+                return AccessSql.search_fields(db_connector, field_table_name, field_day_table_name, **search)
+
+        except (Exception, psycopg2.DatabaseError) as error:
+            logger.error(error)
+            return None
+
 # ------------------Helper methods-------------------------------------
 
+    @staticmethod
+    def execute_prepared(cursor, query, params=()):
+        """
+        Execute a query as prepared statement. Each query is prepared once per pooled connection with PREPARE and
+        executed with EXECUTE afterwards, so the server parses and plans it only once. The statement is named by the
+        hash of the query text. Connections not taken from the pool execute the query directly.
+
+        Parameters:
+            cursor (psycopg2.extensions.cursor): The cursor of the connection.
+            query (str or sql.Composable): The query with %s placeholders. Literal % signs are not supported.
+            params (tuple): The query parameters.
+        """
+        db_connector = cursor.connection
+        if isinstance(query, sql.Composable):
+            query = query.as_string(db_connector)
+
+        prepared_statements = getattr(db_connector, "prepared_statements", None)
+        if prepared_statements is None or not DbConfig.prepare_statements:
+            cursor.execute(query, params)
+            return
+
+        name = "agri_ref_" + hashlib.md5(query.encode()).hexdigest()
+
+        if name not in prepared_statements:
+            parts = query.split("%s")
+            statement = parts[0] + "".join("$" + str(number) + part for number, part in enumerate(parts[1:], 1))
+
+            cursor.execute("PREPARE " + name + " AS " + statement)
+            prepared_statements.add(name)
+
+        cursor.execute("EXECUTE " + name + (" (" + ", ".join(["%s"] * len(params)) + ")" if params else ""), params)
+
+    @staticmethod
+    def table_identifier(table_name):
+        """
+        Quote a table name, optionally qualified by its schema, as identifier. Unqualified tables are in public.
+
+        Parameters:
+            table_name (str): The table name, e.g. "field_day_c" or "public.field_day_c".
+
+        Returns:
+            sql.Identifier: The quoted table name.
+        """
+        names = table_name.split(".")
+        if len(names) > 2:
+            raise ValueError(f"Invalid table name: {table_name}")
+
+        return sql.Identifier(*(["public"] + names)[-2:])
+
+    @staticmethod
+    def field_day_select_list(raster_format="gtiff", expressions=None, columns=None):
+        """
+        Build the select list of field_day columns with the raster columns in the given transfer format.
+        Only the given columns are read, so rasters that are not selected are neither encoded nor transferred.
+
+        Parameters:
+            raster_format: "gtiff" to receive GeoTIFF files encoded by the server, "wkb" to receive the native
+            Postgis raster binary.
+            expressions (dict, optional): Select expressions replacing single columns.
+            columns (list or str, optional): The columns in select order, "metadata" for METADATA_COLUMNS.
+            Defaults to FIELD_DAY_COLUMNS.
+
+        Returns:
+            str: The comma separated select list.
+        """
+        if raster_format not in AccessSql.RASTER_FORMATS:
+            raise ValueError(f"Unknown raster format: {raster_format}")
+
+        columns = AccessSql.resolve_columns(columns)
+        expressions = expressions or {}
+
+        return ", ".join(expressions[column] if column in expressions
+                         else AccessSql.RASTER_FORMATS[raster_format].format(
+                             source=AccessSql.raster_source(column), column=column)
+                         if column in AccessSql.RASTER_COLUMNS else column
+                         for column in columns)
+
+    @staticmethod
+    def raster_source(column):
+        """
+        Get the expression of a raster column. With DbConfig.raster_storage "dedup" content addressed rasters are
+        looked up in RASTER_STORE_TABLE by their hash. A hash takes precedence over the in-db raster, which is left
+        unchanged and outdated when a row entered in-db is entered again as content addressed.
+
+        Parameters:
+            column (str): One of RASTER_COLUMNS.
+
+        Returns:
+            str: The SQL expression of the raster.
+        """
+        if DbConfig.raster_storage != "dedup":
+            return column
+
+        return (f"CASE WHEN {column}_hash IS NULL THEN {column} ELSE (SELECT store.rast "
+                f"FROM public.{AccessSql.RASTER_STORE_TABLE} store WHERE store.hash = {column}_hash) END")
+
+    @staticmethod
+    def raster_present(column):
+        """
+        Get the condition that a raster column holds a raster, in-db or content addressed.
+
+        Parameters:
+            column (str): One of RASTER_COLUMNS.
+
+        Returns:
+            str: The SQL condition.
+        """
+        if DbConfig.raster_storage != "dedup":
+            return f"{column} IS NOT NULL"
+
+        return f"({column} IS NOT NULL OR {column}_hash IS NOT NULL)"
+
+    @staticmethod
+    def resolve_columns(columns=None):
+        """
+        Resolve and validate a column selection of the field_day table.
+
+        Parameters:
+            columns (list or str, optional): The columns, "metadata" for METADATA_COLUMNS or None for all columns.
+
+        Returns:
+            list: The selected columns.
+        """
+        if columns is None:
+            return AccessSql.FIELD_DAY_COLUMNS
+        if columns == "metadata":
+            return AccessSql.METADATA_COLUMNS
+
+        unknown_columns = [column for column in columns if column not in AccessSql.FIELD_DAY_COLUMNS]
+        if unknown_columns or not columns:
+            raise ValueError(f"Unknown or no columns selected: {unknown_columns}")
+
+        return list(columns)
+
+    @staticmethod
+    def decode_raster(raster_obj, raster_format="gtiff"):
+        """
+        Decode a fetched raster column to band arrays and geotransform.
+
+        Parameters:
+            raster_obj: The fetched raster, GeoTIFF or Postgis raster binary.
+            raster_format: The transfer format the raster was fetched in, one of RASTER_FORMATS.
+
+        Returns:
+            dict or None: The raster as returned by RasterWkb.decode(). None if no raster is given.
+        """
+        if raster_obj is None:
+            return None
+
+        if raster_format == "wkb":
+            return RasterWkb.decode(raster_obj)
+
+        with MemoryFile(bytes(raster_obj)) as memfile:
+            with memfile.open() as rasterio_raster:
+                return {"width": rasterio_raster.width, "height": rasterio_raster.height,
+                        "srid": rasterio_raster.crs.to_epsg() if rasterio_raster.crs else None,
+                        "geotransform": rasterio_raster.transform.to_gdal(),
+                        "bands": list(rasterio_raster.read()),
+                        "nodata": list(rasterio_raster.nodatavals),
+                        "outdb": [None] * rasterio_raster.count}
+
+    @staticmethod
+    def load_outdb_bands(raster, window=None):
+        """
+        Read the pixels of the out-db bands of a decoded raster straight from their COG files.
+        Only the blocks of the COG overlapping the window are read.
+
+        Parameters:
+            raster (dict): The raster as returned by decode_raster(), fetched with raster_format "wkb".
+            window (tuple, optional): The window to read as (column offset, row offset, width, height) in pixel.
+            Defaults to the whole raster.
+
+        Returns:
+            dict or None: A copy of the raster with the bands read, width, height and geotransform of the window.
+        """
+        if raster is None:
+            return None
+
+        raster = dict(raster, bands=list(raster["bands"]))
+
+        if window is not None:
+            col_off, row_off, width, height = window
+            upper_left_x, scale_x, skew_x, upper_left_y, skew_y, scale_y = raster["geotransform"]
+
+            # In-db bands are cut to the window as well, so all bands have the same extent.
+            raster["bands"] = [band[row_off:row_off + height, col_off:col_off + width] if band is not None else None
+                               for band in raster["bands"]]
+            raster["geotransform"] = (upper_left_x + col_off * scale_x + row_off * skew_x, scale_x, skew_x,
+                                      upper_left_y + col_off * skew_y + row_off * scale_y, skew_y, scale_y)
+            raster["width"], raster["height"] = width, height
+
+        band_files = {}
+        for index, outdb in enumerate(raster["outdb"]):
+            if outdb is not None:
+                band_files.setdefault(outdb[1], []).append((index, outdb[0]))
+
+        # Each file is opened once for all of its bands.
+        for path, bands in band_files.items():
+            with rasterio.open(path) as src:
+                for index, band_number in bands:
+                    raster["bands"][index] = src.read(band_number, window=Window(*window) if window else None)
+
+        return raster
+
+    @staticmethod
+    def entered_columns(storage):
+        """
+        Get the columns entered into the field_day table for a raster storage. Content addressed rasters are entered
+        as their hash instead of the raster.
+
+        Parameters:
+            storage (str): The raster storage, one of RASTER_STORAGES.
+
+        Returns:
+            list: The entered columns.
+        """
+        if storage == "dedup":
+            return AccessSql.METADATA_COLUMNS + AccessSql.HASH_COLUMNS
+
+        return AccessSql.FIELD_DAY_COLUMNS
+
+    @staticmethod
+    def store_rasters(db_connector, rows, page_size=None):
+        """
+        Enter the rasters of rows into the content addressed raster store and replace them by their hash.
+        Rasters whose hash is already stored are neither read again nor uploaded. Nothing is committed.
+
+        Parameters:
+            db_connector (psycopg2.extensions.connection): The database connection object.
+            rows (list): The rows as dictionaries. Raster columns hold the path to a geotiff file or the raster binary.
+            page_size (int, optional): The amount of rasters sent per statement. Defaults to DbConfig.upsert_page_size.
+
+        Returns:
+            list: The rows with the HASH_COLUMNS set instead of the RASTER_COLUMNS.
+        """
+        page_size = page_size or DbConfig.upsert_page_size
+        sources = {}
+        hashed_rows = []
+
+        for row in rows:
+            hashed_row = {column: value for column, value in row.items() if column not in AccessSql.RASTER_COLUMNS}
+
+            for column in AccessSql.RASTER_COLUMNS:
+                if row.get(column) is not None:
+                    raster_hash = AccessSql.raster_hash(row[column])
+                    sources.setdefault(raster_hash, row[column])
+                    hashed_row[column + "_hash"] = raster_hash
+
+            hashed_rows.append(hashed_row)
+
+        if not sources:
+            return hashed_rows
+
+        store = sql.Identifier(AccessSql.RASTER_STORE_TABLE)
+
+        with db_connector.cursor() as cursor:
+            cursor.execute(sql.SQL("SELECT hash FROM public.{} WHERE hash = ANY(%s)").format(store), (list(sources),))
+            stored_hashes = {row[0] for row in cursor.fetchall()}
+
+            missing = iter([raster_hash for raster_hash in sources if raster_hash not in stored_hashes])
+            insert_query = sql.SQL("INSERT INTO public.{} (hash, rast) VALUES %s ON CONFLICT (hash) DO NOTHING").format(
+                store).as_string(db_connector)
+
+            # Only one page of rasters is read into memory at a time.
+            while True:
+                page = [(raster_hash, AccessSql.read_geotiff_bin(sources[raster_hash])
+                         if isinstance(sources[raster_hash], str) else psycopg2.Binary(bytes(sources[raster_hash])))
+                        for raster_hash in islice(missing, page_size)]
+                if not page:
+                    break
+
+                execute_values(cursor, insert_query, page, template="(%s, ST_FromGDALRaster(%s::bytea))")
+
+        logger.info("Rasters stored: %s, already stored: %s", len(sources) - len(stored_hashes), len(stored_hashes))
+
+        return hashed_rows
+
+    @staticmethod
+    def enter_band_stats(db_connector, table_name, rows, page_size=None):
+        """
+        Compute the statistics of each band of the rasters of rows and enter them into the band statistics side table.
+        Statistics already entered for a field_id, date, raster column and band are replaced. Nothing is committed.
+
+        Parameters:
+            db_connector (psycopg2.extensions.connection): The database connection object.
+            table_name: The name of the field_day table.
+            rows (list): The rows as dictionaries. Raster columns hold the path to a geotiff file or the raster binary.
+            page_size (int, optional): The amount of statistics sent per statement.
+            Defaults to DbConfig.upsert_page_size.
+
+        Returns:
+            int: The amount of band statistics entered.
+        """
+        page_size = page_size or DbConfig.upsert_page_size
+
+        band_stats = [(row["field_id"], row["date"], column) + stats
+                      for row in rows if row.get("field_id") and row.get("date")
+                      for column in AccessSql.RASTER_COLUMNS if row.get(column) is not None
+                      for stats in AccessSql.compute_band_stats(row[column],
+                                                                AccessSql.RASTER_NO_DATA_VALUES[column])]
+
+        if not band_stats:
+            return 0
+
+        query = sql.SQL("""
+            INSERT INTO public.{} (field_id, date, raster_column, band, mean, std, min, max, valid_count) VALUES %s
+            ON CONFLICT (field_id, raster_column, band, date) DO UPDATE SET
+                mean = EXCLUDED.mean, std = EXCLUDED.std, min = EXCLUDED.min, max = EXCLUDED.max,
+                valid_count = EXCLUDED.valid_count
+        """).format(sql.Identifier(AccessSql.band_stats_name(table_name)))
+
+        with db_connector.cursor() as cursor:
+            execute_values(cursor, query.as_string(db_connector), band_stats, page_size=page_size)
+
+        return len(band_stats)
+
+    @staticmethod
+    def compute_band_stats(raster, no_data_value=6.9055e-41):
+        """
+        Compute mean, standard deviation, minimum, maximum and amount of valid pixel of each band of a raster.
+        The rasters are clipped to the field polygon, so the valid pixel are the pixel within the polygon that are
+        finite and neither no_data_value nor the no data value of the band.
+
+        Parameters:
+            raster: The path to a geotiff file or the raster binary.
+            no_data_value (float): Value of the pixel outside the polygon, see RASTER_NO_DATA_VALUES.
+
+        Returns:
+            list: Tuples (band number starting with 1, mean, std, min, max, valid_count). The statistics are None
+            for bands without valid pixel.
+        """
+        with (rasterio.open(raster) if isinstance(raster, str) else MemoryFile(bytes(raster)).open()) as src:
+            bands = src.read()
+            band_nodata = src.nodatavals
+
+        band_stats = []
+        for index, band in enumerate(bands):
+            valid = np.isfinite(band) & (band != no_data_value)
+            if band_nodata[index] is not None:
+                valid &= band != band_nodata[index]
+
+            values = band[valid].astype(np.float64)
+            if values.size:
+                band_stats.append((index + 1, float(values.mean()), float(values.std()), float(values.min()),
+                                   float(values.max()), int(values.size)))
+            else:
+                band_stats.append((index + 1, None, None, None, None, 0))
+
+        return band_stats
+
+    @staticmethod
+    def raster_hash(raster):
+        """
+        Get the content hash of a raster, the SHA-256 of the geotiff file or of the raster binary.
+
+        Parameters:
+            raster: The path to a geotiff file or the raster binary.
+
+        Returns:
+            str: The hexadecimal hash.
+        """
+        digest = hashlib.sha256()
+
+        if isinstance(raster, str):
+            with open(raster, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+        else:
+            digest.update(bytes(raster))
+
+        return digest.hexdigest()
+
+    @staticmethod
+    def fetch_ingest_manifest(db_connector, table_name, paths):
+        """
+        Fetch the manifest entries of source files entered into a field_day table.
+
+        Parameters:
+            db_connector (psycopg2.extensions.connection): The database connection object.
+            table_name: The name of the field_day table.
+            paths (list): The paths of the source files.
+
+        Returns:
+            dict: (size, mtime, content_hash) of each path entered before. None is returned on error.
+        """
+        query = sql.SQL("SELECT path, size, mtime, content_hash FROM public.{} WHERE path = ANY(%s)").format(
+            sql.Identifier(AccessSql.ingest_manifest_name(table_name)))
+
+        try:
+            with db_connector.cursor() as cursor:
+                cursor.execute(query, (list(paths),))
+                return {path: (size, mtime, content_hash) for path, size, mtime, content_hash in cursor.fetchall()}
+
+        except psycopg2.Error as e:
+            logger.error("Error fetching ingest manifest: %s", e)
+            db_connector.rollback()
+            return None
+
+    @staticmethod
+    def enter_ingest_manifest(db_connector, table_name, rows, page_size=None):
+        """
+        Enter the source files of rows into the ingest manifest of a field_day table. Entries of a path entered
+        before are replaced. Nothing is committed, so the manifest is committed together with the rows.
+
+        Parameters:
+            db_connector (psycopg2.extensions.connection): The database connection object.
+            table_name: The name of the field_day table.
+            rows (list): The rows as dictionaries with "source_files" as list of (column, path, size, mtime,
+            content_hash) as returned by source_file_state(). Rows without source files are skipped.
+            page_size (int, optional): The amount of entries sent per statement. Defaults to DbConfig.upsert_page_size.
+
+        Returns:
+            int: The amount of entries entered.
+        """
+        page_size = page_size or DbConfig.upsert_page_size
+
+        entries = [(path, size, mtime, content_hash, row["field_id"], row["date"], column)
+                   for row in rows if row.get("field_id") and row.get("date")
+                   for column, path, size, mtime, content_hash in row.get("source_files") or ()]
+
+        if not entries:
+            return 0
+
+        query = sql.SQL("""
+            INSERT INTO public.{} (path, size, mtime, content_hash, field_id, date, column_name) VALUES %s
+            ON CONFLICT (path) DO UPDATE SET
+                size = EXCLUDED.size, mtime = EXCLUDED.mtime, content_hash = EXCLUDED.content_hash,
+                field_id = EXCLUDED.field_id, date = EXCLUDED.date, column_name = EXCLUDED.column_name,
+                entered_at = now()
+        """).format(sql.Identifier(AccessSql.ingest_manifest_name(table_name)))
+
+        with db_connector.cursor() as cursor:
+            execute_values(cursor, query.as_string(db_connector), entries, page_size=page_size)
+
+        return len(entries)
+
+    @staticmethod
+    def source_file_state(column, path, content=None):
+        """
+        Get the manifest entry of a source file.
+
+        Parameters:
+            column (str): The raster column the file is entered into.
+            path (str): The path of the file.
+            content (bytes, optional): The content of the file if already read, to hash it without reading it again.
+
+        Returns:
+            tuple: (column, path, size, mtime, content_hash)
+        """
+        stat = os.stat(path)
+        return (column, path, stat.st_size, stat.st_mtime,
+                AccessSql.raster_hash(content if content is not None else path))
+
+    @staticmethod
+    def source_file_changed(path, entry):
+        """
+        Check if a source file is new or changed since it was entered. Size and modification time are compared first,
+        the content is only hashed if just the modification time differs.
+
+        Parameters:
+            path (str): The path of the file.
+            entry (tuple or None): (size, mtime, content_hash) of the manifest, None if the file was not entered.
+
+        Returns:
+            bool: True if the file has to be entered.
+        """
+        if entry is None:
+            return True
+
+        size, mtime, content_hash = entry
+        stat = os.stat(path)
+
+        if stat.st_size != size:
+            return True
+        if stat.st_mtime == mtime:
+            return False
+
+        return AccessSql.raster_hash(path) != content_hash
+
+    @staticmethod
+    def resolve_raster_storage(storage=None):
+        """
+        Resolve and validate the raster storage.
+
+        Parameters:
+            storage (str, optional): One of RASTER_STORAGES. Defaults to DbConfig.raster_storage.
+
+        Returns:
+            str: The raster storage.
+        """
+        storage = storage or DbConfig.raster_storage
+        if storage not in AccessSql.RASTER_STORAGES:
+            raise ValueError(f"Unknown raster storage: {storage}")
+
+        return storage
+
+    @staticmethod
+    def outdb_path(path):
+        """
+        Get the absolute path of the COG to reference as out-db raster. If DbConfig.cog_directory is set, the GeoTIFF
+        is converted to a COG in that directory once, otherwise it is referenced as it is.
+        The path has to be readable by the database server as well.
+
+        Parameters:
+            path (str): The path to a GeoTIFF file.
+
+        Returns:
+            str: The absolute path of the COG.
+        """
+        if not isinstance(path, str):
+            raise ValueError("Out-db rasters have to be given as path to a geotiff file.")
+
+        if DbConfig.cog_directory:
+            cog_path = os.path.join(DbConfig.cog_directory, os.path.basename(path))
+
+            if not os.path.exists(cog_path):
+                # GDAL is only required to convert the files for out-db storage.
+                from modules.gdal_tiff_functions import GdalTiffFunctions
+                GdalTiffFunctions.cloud_optimize_gtiff(os.path.dirname(path) + os.sep, os.path.basename(path),
+                                                       DbConfig.cog_directory + os.sep, os.path.basename(path))
+            path = cog_path
+
+        return os.path.abspath(path)
+
     @staticmethod
     def save_raster_as_geotiff(raster_data, output_path):
         """
@@ -1020,9 +2430,9 @@ class AccessSql:
         try:
             with open(output_path, "wb") as f:
                 f.write(raster_data)
-            print(f"GeoTIFF saved successfully: {output_path}")
+            logger.info("GeoTIFF saved successfully: %s", output_path)
         except Exception as e:
-            print(f"Error saving GeoTIFF: {e}")
+            logger.error("Error saving GeoTIFF: %s", e)
 
     @staticmethod
     def process_row_to_geotiffs(row, path_to_geotiff):
@@ -1035,7 +2445,7 @@ class AccessSql:
 
         """
         if not row:
-            print("No data found for the given ID and date.")
+            logger.warning("No data found for the given ID and date.")
             return
 
         try:
@@ -1064,10 +2474,10 @@ class AccessSql:
                             # To save raster as GeoTIFF set the path to save to and active code
                             AccessSql.save_raster_as_geotiff(rasterio_raster, path_to_geotiff)
                 else:
-                    print(f"No raster data found for {column_name}.")
+                    logger.warning("No raster data found for %s.", column_name)
 
         except Exception as e:
-            print(f"Error processing row to GeoTIFFs: {e}")
+            logger.error("Error processing row to GeoTIFFs: %s", e)
 
     @staticmethod
     def insert_list_at_item(old_list, item, new_list):
@@ -1095,9 +2505,69 @@ class AccessSql:
             old_list[index:index] = new_list
 
         except ValueError:
-            print(f"Item '{item}' not found in the list")
+            logger.warning("Item '%s' not found in the list", item)
         return old_list
 
+    @staticmethod
+    def format_copy_line(row, columns, storage="indb"):
+        """
+        Format a row as a line of the COPY text format. Raster values given as path are read from file, out-db
+        rasters are entered as the absolute path of their COG.
+
+        Parameters:
+            row (dict): The column values of the row.
+            columns (list): The columns in the order of the COPY statement.
+            storage (str): The raster storage, one of RASTER_STORAGES.
+
+        Returns:
+            str: The tab separated line including the line break.
+        """
+        values = []
+        for column in columns:
+            value = row.get(column)
+
+            if value is not None and column in AccessSql.RASTER_COLUMNS and storage == "outdb":
+                value = AccessSql.outdb_path(value)
+
+            if value is None:
+                values.append("\\N")
+            elif column in AccessSql.RASTER_COLUMNS and storage == "indb":
+                if isinstance(value, str):
+                    with open(value, 'rb') as f:
+                        value = f.read()
+
+                # The bytea hex format, the backslash has to be escaped for COPY.
+                values.append("\\\\x" + bytes(value).hex())
+            elif isinstance(value, bool):
+                values.append("t" if value else "f")
+            else:
+                values.append(str(value).replace("\\", "\\\\").replace("\t", "\\t")
+                              .replace("\n", "\\n").replace("\r", "\\r"))
+
+        return "\t".join(values) + "\n"
+
+    @staticmethod
+    def copy_payload_size(row, columns, storage="indb"):
+        """
+        Get the amount of bytes of a row entered by format_copy_line(), without the hex encoding and escaping of the
+        COPY text format: in-db rasters by the size of their binary, all other values by the length of their text.
+
+        Returns:
+            int: The amount of bytes.
+        """
+        size = 0
+        for column in columns:
+            value = row.get(column)
+
+            if value is None:
+                continue
+            elif column in AccessSql.RASTER_COLUMNS and storage == "indb":
+                size += os.path.getsize(value) if isinstance(value, str) else len(value)
+            else:
+                size += len(str(value))
+
+        return size
+
     @staticmethod
     def read_geotiff_bin(filepath):
         """
@@ -1184,6 +2654,45 @@ class AccessSql:
                 WHERE field_id = %s;
             """, (band_num, raster_data.RasterXSize, raster_data.RasterYSize, float_band_nested, field_id))
 
-            print("Band " + str(band_num) + " added successfully.")
+            logger.info("Band %s added successfully.", band_num)
         else:
-            print("Band " + str(band_num) + " not added to current bsc item.")
+            logger.warning("Band %s not added to current bsc item.", band_num)
+
+
+class PreparedConnection(psycopg2.extensions.connection):
+    """
+    A pooled connection remembering the names of the statements prepared on it by AccessSql.execute_prepared().
+    Prepared statements live as long as the server session, so a replaced connection starts without any.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+
+class CopyRowStream:
+    """
+    A file-like object that hands lines of a generator to cursor.copy_expert() piece by piece, so the COPY text of a
+    batch of rows is never built as a whole. The rows themselves are held by the caller, which bounds their amount.
+    """
+
+    def __init__(self, lines):
+        self.lines = iter(lines)
+        self.buffer = ""
+        self.position = 0
+
+    def read(self, size=-1):
+        # Only append the next line when the remaining buffer is too short, to avoid copying long raster lines.
+        while size < 0 or len(self.buffer) - self.position < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.buffer = self.buffer[self.position:] + line
+            self.position = 0
+
+        if size < 0:
+            size = len(self.buffer) - self.position
+
+        chunk = self.buffer[self.position:self.position + size]
+        self.position += len(chunk)
+        return chunk
@@ -0,0 +1,213 @@
+#--------------------------------------------------------------------------------------------------------------------------------
+# Name:        async_access_sql
+# Purpose:
+#
+# Author:      jennifer.mcclelland
+#
+# Created:     2024
+# Copyright:   (c) jennifer.mcclelland 2024
+#
+#--------------------------------------------------------------------------------------------------------------------------------
+
+import asyncio
+import logging
+import datetime
+from itertools import islice
+from contextlib import asynccontextmanager
+
+import asyncpg
+from psycopg2.extensions import parse_dsn
+
+from modules.db_config import DbConfig
+from modules.access_sql import AccessSql
+
+logger = logging.getLogger(__name__)
+
+class AsyncAccessSql:
+    """
+    This is the asyncio counterpart of the read methods of AccessSql on the asyncpg driver.
+    Many rows are fetched concurrently over a bounded connection pool, so the latency of the single requests overlaps.
+    Rows are returned as tuples in the same column order as by AccessSql and can be decoded with
+    AccessSql.decode_raster().
+    """
+
+    # The pools and their locks by event loop, as an asyncpg pool and an asyncio lock can only be used in the loop they
+    # were created in. Pools of closed loops are dropped when the next pool is created.
+    db_pools = {}
+    db_pool_locks = {}
+
+    @staticmethod
+    async def get_db_pool():
+        """
+        This returns the asyncpg pool of the running event loop and creates it on first use in the loop.
+        The pool holds at most DbConfig.pool_max_connections connections, which bounds the amount of concurrent queries.
+        The GDAL drivers are activated once per connection with the server settings.
+        :return: db_pool
+        """
+        loop = asyncio.get_running_loop()
+        for closed_loop in [other for other in AsyncAccessSql.db_pool_locks if other.is_closed()]:
+            AsyncAccessSql.db_pool_locks.pop(closed_loop)
+            AsyncAccessSql.db_pools.pop(closed_loop, None)
+
+        db_pool_lock = AsyncAccessSql.db_pool_locks.setdefault(loop, asyncio.Lock())
+
+        async with db_pool_lock:
+            db_pool = AsyncAccessSql.db_pools.get(loop)
+            if db_pool is None or db_pool.is_closing():
+                db_pool = AsyncAccessSql.db_pools[loop] = await asyncpg.create_pool(
+                    min_size=DbConfig.pool_min_connections,
+                    max_size=DbConfig.pool_max_connections,
+                    server_settings={"postgis.gdal_enabled_drivers": "ENABLE_ALL",
+                                     "postgis.enable_outdb_rasters": "on"},
+                    **AsyncAccessSql.connect_parameters(DbConfig.dsn))
+
+            return db_pool
+
+    @staticmethod
+    async def close_db_pool():
+        """
+        This closes the asyncpg pool of the running event loop. It is created again on the next use.
+        """
+        loop = asyncio.get_running_loop()
+        AsyncAccessSql.db_pool_locks.pop(loop, None)
+
+        db_pool = AsyncAccessSql.db_pools.pop(loop, None)
+        if db_pool is not None:
+            await db_pool.close()
+
+    @staticmethod
+    @asynccontextmanager
+    async def db_session():
+        """
+        This opens the asyncpg pool of the running event loop for a block and closes it afterwards, so the pool does
+        not outlive its loop, e.g. in the coroutine run by asyncio.run().
+        :return: db_pool
+        """
+        try:
+            yield await AsyncAccessSql.get_db_pool()
+        finally:
+            await AsyncAccessSql.close_db_pool()
+
+    @staticmethod
+    def connect_parameters(dsn):
+        """
+        Convert a libpq connection string as used by psycopg2 to the connect parameters of asyncpg.
+
+        Parameters:
+            dsn (str): The connection string, e.g. "dbname=agriRef user=postgres host=localhost port=5432".
+
+        Returns:
+            dict: The parameters database, user, password, host and port that are given in the DSN.
+        """
+        parameters = parse_dsn(dsn)
+        names = {"dbname": "database", "user": "user", "password": "password", "host": "host", "port": "port"}
+
+        connect_parameters = {names[key]: value for key, value in parameters.items() if key in names}
+        if "port" in connect_parameters:
+            connect_parameters["port"] = int(connect_parameters["port"])
+
+        return connect_parameters
+
+    @staticmethod
+    def quote_table_name(table_name):
+        """
+        Quote a table name as AccessSql.table_identifier() for the queries of asyncpg, which has no psycopg2 connection
+        to render sql.Identifier.
+
+        Parameters:
+            table_name (str): The table name, e.g. "field_day_c" or "public.field_day_c".
+
+        Returns:
+            str: The quoted table name, e.g. '"public"."field_day_c"'.
+        """
+        return ".".join('"' + name.replace('"', '""') + '"'
+                        for name in AccessSql.table_identifier(table_name).strings)
+
+    @staticmethod
+    async def fetch_row(table_name, field_id, date, raster_format="gtiff", columns=None):
+        """
+        Fetch a row from the field_day table by field_id and date.
+
+        Parameters:
+            table_name: The name of the field_day table.
+            field_id: ID of the field.
+            date: Date of the data as datetime.date or "yyyy-mm-dd".
+            raster_format: The transfer format of the rasters, one of AccessSql.RASTER_FORMATS.
+            columns: The columns to fetch, "metadata" for all scalar columns. Defaults to all columns.
+
+        Returns:
+            tuple or None: The column values of the fetched row, None if the row does not exist or on error.
+        """
+        query = """
+            SELECT {}
+            FROM {}
+            WHERE field_id = $1 AND date = $2
+        """.format(AccessSql.field_day_select_list(raster_format, columns=columns),
+                   AsyncAccessSql.quote_table_name(table_name))
+
+        if isinstance(date, str):
+            date = datetime.date.fromisoformat(date)
+
+        try:
+            db_pool = await AsyncAccessSql.get_db_pool()
+            async with db_pool.acquire() as db_connector:
+                row = await db_connector.fetchrow(query, field_id, date)
+
+            return tuple(row) if row is not None else None
+
+        except (asyncpg.PostgresError, OSError) as e:
+            logger.error("Error fetching row from database: %s", e)
+            return None
+
+    @staticmethod
+    async def iter_rows_as_completed(table_name, keys, raster_format="gtiff", columns=None):
+        """
+        Fetch many rows concurrently and yield them in the order they complete.
+
+        Parameters:
+            table_name: The name of the field_day table.
+            keys: Iterable of (field_id, date).
+            raster_format: The transfer format of the rasters, one of AccessSql.RASTER_FORMATS.
+            columns: The columns to fetch, "metadata" for all scalar columns. Defaults to all columns.
+
+        Yields:
+            tuple: (key, row) with row None if it does not exist.
+        """
+        async def fetch_keyed(key):
+            return key, await AsyncAccessSql.fetch_row(table_name, key[0], key[1], raster_format, columns)
+
+        # Only as many rows as the pool has connections are requested at the same time, the next key is taken when a
+        # row completes. So the amount of tasks is bounded for any amount of keys.
+        keys = iter(keys)
+        limit = max(DbConfig.pool_max_connections, 1)
+        pending = set()
+
+        try:
+            while True:
+                pending.update(asyncio.ensure_future(fetch_keyed(key)) for key in islice(keys, limit - len(pending)))
+                if not pending:
+                    break
+
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    @staticmethod
+    async def fetch_rows(table_name, keys, raster_format="gtiff", columns=None):
+        """
+        Fetch many rows concurrently.
+
+        Parameters:
+            table_name: The name of the field_day table.
+            keys: Iterable of (field_id, date).
+            raster_format: The transfer format of the rasters, one of AccessSql.RASTER_FORMATS.
+            columns: The columns to fetch, "metadata" for all scalar columns. Defaults to all columns.
+
+        Returns:
+            dict: The fetched row of each key, None if it does not exist.
+        """
+        return {key: row async for key, row in
+                AsyncAccessSql.iter_rows_as_completed(table_name, keys, raster_format, columns)}
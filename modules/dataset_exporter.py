@@ -0,0 +1,265 @@
+#--------------------------------------------------------------------------------------------------------------------------------
+# Name:        dataset_exporter
+# Purpose:
+#
+# Author:      jennifer.mcclelland
+#
+# Created:     2024
+# Copyright:   (c) jennifer.mcclelland 2024
+#
+#--------------------------------------------------------------------------------------------------------------------------------
+
+import os
+import json
+import logging
+import hashlib
+import datetime
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+from modules.access_sql import AccessSql
+from modules.raster_wkb import RasterWkb
+
+logger = logging.getLogger(__name__)
+
+class DatasetExporter:
+    """
+    This exports a filter result of the field_day table to fixed-size shards on local disk, so training reads sequential
+    files instead of querying the database.
+    Each shard consists of an NPZ file with the band arrays of its rows and a Parquet file with the scalar columns of its
+    rows. The shards are written by parallel writers while the rows are streamed ordered by field_id and date.
+    A manifest records each finished shard with its row count, last key and SHA-256 checksums, an interrupted export
+    continues after the last shard in the manifest.
+    """
+
+    MANIFEST_NAME = "manifest.json"
+
+    @staticmethod
+    def export_filter_result(output_directory, bsc, coh, s2, s2_invalid, shard_size=256, workers=4, columns=None,
+                             compress=False):
+        """
+        Export the rows filtered as in AccessSql.connect_and_filter_by_complete() to shards.
+
+        Parameters:
+            output_directory (str): The directory of the shards and the manifest.
+            s2_invalid: The flag to define if s2 is retrieved with less than 50% valid pixel.
+            s2: The flag to define if s2 radar data must be available in table.
+            coh: The flag to define if coh radar data must be available in table.
+            bsc: The flag to define if bsc radar data must be available in table.
+            shard_size (int): The amount of rows per shard. The last shard may hold less rows.
+            workers (int): The amount of shards written at the same time.
+            columns: The columns to export, "metadata" for all scalar columns. Defaults to all columns.
+            compress (bool): The flag to compress the NPZ files. Uncompressed files are read faster.
+
+        Returns:
+            dict: The manifest of the export.
+        """
+        columns = AccessSql.resolve_columns(columns)
+        for key_column in ("field_id", "date"):
+            if key_column not in columns:
+                raise ValueError(f"The column {key_column} is needed to order the shards.")
+
+        query = {"bsc": bool(bsc), "coh": bool(coh), "s2": bool(s2), "s2_invalid": bool(s2_invalid),
+                 "columns": columns, "shard_size": shard_size}
+        manifest = DatasetExporter.load_manifest(output_directory, query)
+
+        after_key = None
+        if manifest["shards"]:
+            last_key = manifest["shards"][-1]["last_key"]
+            after_key = (last_key[0], datetime.date.fromisoformat(last_key[1]))
+
+        # The shards only continue after the last key of the manifest if the rows are ordered by field_id and date.
+        rows = AccessSql.stream_filter_by_complete(bsc, coh, s2, s2_invalid, raster_format="wkb", columns=columns,
+                                                   ordered=True, after_key=after_key)
+        pending = []
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                for shard_rows in DatasetExporter.iter_shards(rows, shard_size):
+                    shard_name = f"shard-{len(manifest['shards']) + len(pending):05d}"
+                    pending.append(executor.submit(DatasetExporter.write_shard, output_directory, shard_name,
+                                                   shard_rows, columns, compress))
+
+                    # At most two shards per writer are held in memory.
+                    if len(pending) >= 2 * workers:
+                        wait(pending, return_when=FIRST_COMPLETED)
+                    DatasetExporter.record_finished_shards(output_directory, manifest, pending)
+
+                wait(pending)
+                DatasetExporter.record_finished_shards(output_directory, manifest, pending)
+            finally:
+                rows.close()
+
+        manifest["complete"] = True
+        DatasetExporter.save_manifest(output_directory, manifest)
+        return manifest
+
+    @staticmethod
+    def iter_shards(rows, shard_size):
+        """
+        Group a row stream to lists of shard_size rows.
+        """
+        shard_rows = []
+        for row in rows:
+            shard_rows.append(row)
+            if len(shard_rows) == shard_size:
+                yield shard_rows
+                shard_rows = []
+
+        if shard_rows:
+            yield shard_rows
+
+    @staticmethod
+    def record_finished_shards(output_directory, manifest, pending):
+        """
+        Add the finished shards to the manifest. Shards are only recorded in order, so the manifest never holds a shard
+        after one that is still written and the export can continue after its last shard.
+        """
+        recorded = False
+        while pending and pending[0].done():
+            manifest["shards"].append(pending.pop(0).result())
+            recorded = True
+
+        if recorded:
+            DatasetExporter.save_manifest(output_directory, manifest)
+
+    @staticmethod
+    def write_shard(output_directory, shard_name, rows, columns, compress=False):
+        """
+        Decode the rasters of a shard and write its NPZ and Parquet file.
+        The band arrays of row i and raster column c are stored as "{i}/{c}" with shape (bands, height, width), rows
+        without the raster hold no array. The Parquet file holds the scalar columns, the position of the row in the shard
+        and the geotransform and srid of each raster column.
+
+        Returns:
+            dict: The shard entry of the manifest.
+        """
+        # pyarrow is only needed to write shards, so the module can be imported without it.
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        raster_columns = [column for column in columns if column in AccessSql.RASTER_COLUMNS]
+        scalar_columns = [column for column in columns if column not in AccessSql.RASTER_COLUMNS]
+
+        arrays = {}
+        index = {column: [] for column in scalar_columns}
+        index["shard_index"] = list(range(len(rows)))
+        for column in raster_columns:
+            index[column + "_geotransform"] = []
+            index[column + "_srid"] = []
+
+        for position, row in enumerate(rows):
+            values = dict(zip(columns, row))
+
+            for column in scalar_columns:
+                index[column].append(values[column])
+
+            for column in raster_columns:
+                raster = AccessSql.decode_raster(values[column], "wkb")
+                if raster is not None and any(outdb is not None for outdb in raster["outdb"]):
+                    raster = AccessSql.load_outdb_bands(raster)
+
+                bands = RasterWkb.stack_bands(raster) if raster is not None else None
+                if bands is not None:
+                    arrays[f"{position}/{column}"] = bands
+
+                index[column + "_geotransform"].append(list(raster["geotransform"]) if raster is not None else None)
+                index[column + "_srid"].append(raster["srid"] if raster is not None else None)
+
+        files = {shard_name + ".npz": lambda f: (np.savez_compressed if compress else np.savez)(f, **arrays),
+                 shard_name + ".parquet": lambda f: pq.write_table(pa.table(index), f)}
+
+        checksums = {}
+        for file_name, write in files.items():
+            DatasetExporter.write_file(os.path.join(output_directory, file_name), write)
+            checksums[file_name] = DatasetExporter.file_checksum(os.path.join(output_directory, file_name))
+
+        last_values = dict(zip(columns, rows[-1]))
+        return {"name": shard_name, "rows": len(rows), "last_key": [last_values["field_id"], str(last_values["date"])],
+                "files": checksums}
+
+    @staticmethod
+    def write_file(path, write):
+        """
+        Write a file to a temporary file in the same directory and move it in place, so no partial files are left after
+        an interruption.
+
+        Parameters:
+            path (str): The path of the file.
+            write: Function writing the content to a binary file object.
+        """
+        file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "wb") as f:
+                write(f)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    @staticmethod
+    def file_checksum(path):
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha256.update(block)
+
+        return sha256.hexdigest()
+
+    @staticmethod
+    def load_manifest(output_directory, query):
+        """
+        Load the manifest of an interrupted export or create a new one.
+        The shards of a loaded manifest are verified against their checksums, the export continues after the last shard
+        of the verified prefix.
+
+        Parameters:
+            output_directory (str): The directory of the shards and the manifest.
+            query (dict): The filter, columns and shard size of the export.
+
+        Returns:
+            dict: The manifest.
+        """
+        os.makedirs(output_directory, exist_ok=True)
+        manifest_path = os.path.join(output_directory, DatasetExporter.MANIFEST_NAME)
+
+        if not os.path.exists(manifest_path):
+            return {"query": query, "complete": False, "shards": []}
+
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+        if manifest["query"] != query:
+            raise ValueError(f"The directory {output_directory} holds an export of another query: {manifest['query']}")
+
+        for position, shard in enumerate(manifest["shards"]):
+            if not DatasetExporter.verify_shard(output_directory, shard):
+                logger.warning("Shard %s is damaged, the export continues before it.", shard["name"])
+                manifest["shards"] = manifest["shards"][:position]
+                manifest["complete"] = False
+                break
+
+        return manifest
+
+    @staticmethod
+    def save_manifest(output_directory, manifest):
+        DatasetExporter.write_file(os.path.join(output_directory, DatasetExporter.MANIFEST_NAME),
+                                   lambda f: f.write(json.dumps(manifest, indent=2).encode()))
+
+    @staticmethod
+    def verify_shard(output_directory, shard):
+        """
+        Verify the files of a shard against the checksums of the manifest.
+
+        Returns:
+            bool: True if all files exist and are unchanged.
+        """
+        for file_name, checksum in shard["files"].items():
+            path = os.path.join(output_directory, file_name)
+            if not os.path.exists(path) or DatasetExporter.file_checksum(path) != checksum:
+                return False
+
+        return True
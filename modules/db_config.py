@@ -0,0 +1,96 @@
+#--------------------------------------------------------------------------------------------------------------------------------
+# Name:        db_config
+# Purpose:
+#
+# Author:      jennifer.mcclelland
+#
+# Created:     2024
+# Copyright:   (c) jennifer.mcclelland 2024
+#
+#--------------------------------------------------------------------------------------------------------------------------------
+
+import os
+
+
+class DbConfig:
+    """
+    This holds the configuration to access the agriRef PostGreSql database. Each value can be overwritten by an
+    environment variable before the modules are imported.
+    """
+
+    # Connection string of the database, e.g. "dbname=agriRef user=postgres host=localhost port=5432".
+    # The password should be given with PGPASSWORD or a .pgpass file and not be written into the DSN.
+    dsn = os.environ.get("AGRIREF_DSN", "dbname=agriRef user=postgres host=localhost port=5432")
+
+    # Amount of connections the shared pool keeps open and the maximum amount handed out at the same time.
+    pool_min_connections = int(os.environ.get("AGRIREF_POOL_MIN", 2))
+    pool_max_connections = int(os.environ.get("AGRIREF_POOL_MAX", 16))
+
+    # Server settings applied once when a pooled connection is opened.
+    # Very important setting to activate the GDAL drivers for all Postgis raster commands.
+    # Out-db rasters have to be enabled for the server to read the pixels of COGs referenced by the tables.
+    session_options = "-c postgis.gdal_enabled_drivers=ENABLE_ALL -c postgis.enable_outdb_rasters=on"
+
+    # Amount of rows committed at once and amount of rows sent per statement when entering rows in batches.
+    upsert_batch_size = int(os.environ.get("AGRIREF_UPSERT_BATCH_SIZE", 500))
+    upsert_page_size = int(os.environ.get("AGRIREF_UPSERT_PAGE_SIZE", 50))
+
+    # Amount of rows fetched at once from the server when streaming query results with a named cursor.
+    stream_itersize = int(os.environ.get("AGRIREF_STREAM_ITERSIZE", 100))
+
+    # Amount of keys sent as one array when fetching many rows or polygons at once.
+    fetch_chunk_size = int(os.environ.get("AGRIREF_FETCH_CHUNK_SIZE", 1000))
+
+    # Storage of entered rasters: "indb" to copy the pixels into the tables, "outdb" to reference COG files.
+    raster_storage = os.environ.get("AGRIREF_RASTER_STORAGE", "indb")
+
+    # Directory the GeoTIFFs are converted to COGs in for out-db storage. If empty, the files are referenced as they are.
+    cog_directory = os.environ.get("AGRIREF_COG_DIR", "")
+
+    # Date interval of the chunks of the field_day hypertable, only applied to chunks created afterwards.
+    chunk_interval = os.environ.get("AGRIREF_CHUNK_INTERVAL", "90 days")
+
+    # Age of the chunks of the field_day hypertable compressed by the compression policy.
+    compress_after = os.environ.get("AGRIREF_COMPRESS_AFTER", "365 days")
+
+    # Factor converting the stored temperature and precipitation integers to degree Celsius and mm, e.g. 0.1 for the
+    # tenths of the DWD grids, and the base temperature in degree Celsius of the growing degree days.
+    meteo_scale = float(os.environ.get("AGRIREF_METEO_SCALE", 1.0))
+    gdd_base_temperature = float(os.environ.get("AGRIREF_GDD_BASE_TEMPERATURE", 5.0))
+
+    # Flag to compute the band statistics of each raster when entering rows into tables with the side table of schema
+    # migration 5.
+    band_stats = os.environ.get("AGRIREF_BAND_STATS", "1") == "1"
+
+    # Flag to prepare the hot read queries once per pooled connection and execute them as prepared statements.
+    prepare_statements = os.environ.get("AGRIREF_PREPARE_STATEMENTS", "1") == "1"
+
+    # Budget in bytes of the in-process cache of decoded rows, 0 disables the cache.
+    row_cache_bytes = int(os.environ.get("AGRIREF_ROW_CACHE_BYTES", 0))
+
+    # Directory and budget in bytes of the local disk cache of decoded rasters, an empty directory disables the cache.
+    raster_cache_directory = os.environ.get("AGRIREF_RASTER_CACHE_DIR", "")
+    raster_cache_bytes = int(os.environ.get("AGRIREF_RASTER_CACHE_BYTES", 10 * 1024 ** 3))
+
+    # Amount of worker processes ingesting field series in parallel, 1 ingests all fields in the calling process.
+    ingest_workers = int(os.environ.get("AGRIREF_INGEST_WORKERS", os.cpu_count() or 1))
+
+    # Amount of days waiting in front of each stage of the ingest pipeline and amount of threads of each stage.
+    ingest_queue_size = int(os.environ.get("AGRIREF_INGEST_QUEUE_SIZE", 16))
+    ingest_stage_workers = {"read": 2, "validate": 2, "interpolate": 2, "encode": 1}
+
+    # Maximum amount of raster bytes the write stage of the ingest pipeline loads with one COPY. A batch also ends after
+    # upsert_batch_size days.
+    ingest_batch_bytes = int(os.environ.get("AGRIREF_INGEST_BATCH_BYTES", 64 * 1024 ** 2))
+
+    # Flag to skip the days whose source files are unchanged in the ingest manifest of tables with the manifest table of
+    # schema migration 6.
+    ingest_incremental = os.environ.get("AGRIREF_INGEST_INCREMENTAL", "1") == "1"
+
+    # Flag to record the counters and timers of modules.metrics, and the level of the log messages of the scripts.
+    # The log messages below WARNING are off by default.
+    metrics = os.environ.get("AGRIREF_METRICS", "1") == "1"
+    log_level = os.environ.get("AGRIREF_LOG_LEVEL", "WARNING")
+
+    # File the metrics of an ingest are written to, in the Prometheus text format if it ends with ".prom", else as JSON.
+    metrics_file = os.environ.get("AGRIREF_METRICS_FILE", "")
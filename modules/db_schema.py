@@ -0,0 +1,480 @@
+#--------------------------------------------------------------------------------------------------------------------------------
+# Name:        db_schema
+# Purpose:
+#
+# Author:      jennifer.mcclelland
+#
+# Created:     2024
+# Copyright:   (c) jennifer.mcclelland 2024
+#
+#--------------------------------------------------------------------------------------------------------------------------------
+
+import logging
+
+import psycopg2
+from psycopg2 import sql
+
+from modules.access_sql import AccessSql
+from modules.db_config import DbConfig
+
+logger = logging.getLogger(__name__)
+
+class DbSchema:
+    """
+    This class maintains the schema of existing field and field_day tables with versioned migrations.
+    Each migration is applied once per field_day table and recorded in the schema_migrations table.
+    The chunking and compression of the field_day hypertable are configured separately.
+    """
+
+    MIGRATIONS_TABLE = "schema_migrations"
+
+    # The migrations as (version, description, [(statement, index name)]). Statements use the placeholders {field},
+    # {field_day}, {raster_store}, {band_stats}, {ingest_manifest} for the tables and {index} for the index name, which
+    # is formatted with the table names.
+    MIGRATIONS = [
+        (1, "Unique key on field_day (field_id, date)", AccessSql.FIELD_DAY_UNIQUE_KEY_STATEMENTS),
+        (2, "Btree index on field (field_id) and GiST index on field (geom)", [
+            ("CREATE INDEX IF NOT EXISTS {index} ON public.{field} (field_id)", "{field}_field_id_idx"),
+            ("CREATE INDEX IF NOT EXISTS {index} ON public.{field} USING GIST (geom)", "{field}_geom_idx")
+        ]),
+        (3, "Partial indexes for the bsc_valid, coh_valid and s2_valid filters", [
+            ("CREATE INDEX IF NOT EXISTS {index} ON public.{field_day} (field_id, date) WHERE bsc_valid",
+             "{field_day}_bsc_valid_idx"),
+            ("CREATE INDEX IF NOT EXISTS {index} ON public.{field_day} (field_id, date) WHERE coh_valid",
+             "{field_day}_coh_valid_idx"),
+            ("CREATE INDEX IF NOT EXISTS {index} ON public.{field_day} (field_id, date) WHERE s2_valid",
+             "{field_day}_s2_valid_idx")
+        ]),
+        (4, "Content addressed raster store and raster hash columns on field_day", [
+            ("""CREATE TABLE IF NOT EXISTS public.{raster_store} (
+                    hash TEXT PRIMARY KEY,
+                    rast raster,
+                    created_at TIMESTAMPTZ DEFAULT now()
+                )""", None),
+            ("""ALTER TABLE public.{field_day}
+                    ADD COLUMN IF NOT EXISTS bsc_data_hash TEXT,
+                    ADD COLUMN IF NOT EXISTS bsc_interp_data_hash TEXT,
+                    ADD COLUMN IF NOT EXISTS coh_data_hash TEXT,
+                    ADD COLUMN IF NOT EXISTS coh_interp_data_hash TEXT,
+                    ADD COLUMN IF NOT EXISTS s2_data_hash TEXT,
+                    ADD COLUMN IF NOT EXISTS s2_interp_data_hash TEXT""", None)
+        ]),
+        (5, "Side table of the band statistics of each field_day raster", [
+            ("""CREATE TABLE IF NOT EXISTS public.{band_stats} (
+                    field_id BIGINT,
+                    date DATE,
+                    raster_column TEXT,
+                    band SMALLINT,
+                    mean REAL,
+                    std REAL,
+                    min REAL,
+                    max REAL,
+                    valid_count INTEGER,
+                    PRIMARY KEY (field_id, raster_column, band, date)
+                )""", None)
+        ]),
+        (6, "Manifest of the source files entered into field_day", [
+            ("""CREATE TABLE IF NOT EXISTS public.{ingest_manifest} (
+                    path TEXT PRIMARY KEY,
+                    size BIGINT,
+                    mtime DOUBLE PRECISION,
+                    content_hash TEXT,
+                    field_id BIGINT,
+                    date DATE,
+                    column_name TEXT,
+                    entered_at TIMESTAMPTZ DEFAULT now()
+                )""", None)
+        ])
+    ]
+
+    # The hot queries whose plan cost is reported before and after migrating.
+    HOT_QUERIES = {
+        "fetch_row_from_db": "SELECT * FROM public.{field_day} WHERE field_id = %s AND date = %s",
+        "enter_partial_row": "SELECT 1 FROM public.{field_day} WHERE field_id = %s AND date = %s",
+        "get_polygon_by_field_id": "SELECT ST_AsGeoJSON(geom) FROM public.{field} WHERE field_id = %s",
+        "query_by_geojson_polygon": """WITH region AS (SELECT geom FROM public.{field} LIMIT 1)
+                                       SELECT f.field_id FROM public.{field} f, region
+                                       WHERE f.geom && region.geom AND ST_Intersects(f.geom, region.geom)""",
+        "search_fields": """WITH region AS (SELECT ST_Envelope(geom) AS geom FROM public.{field} LIMIT 1)
+                            SELECT d.field_id, d.date FROM public.{field} f CROSS JOIN region
+                            JOIN public.{field_day} d ON d.field_id = f.field_id AND d.s2_valid
+                            WHERE f.geom && region.geom AND ST_Intersects(f.geom, region.geom)""",
+        "filter_bsc_valid": "SELECT field_id, date FROM public.{field_day} WHERE bsc_valid = TRUE",
+        "filter_coh_valid": "SELECT field_id, date FROM public.{field_day} WHERE coh_valid = TRUE",
+        "filter_s2_valid": "SELECT field_id, date FROM public.{field_day} WHERE s2_valid = TRUE"
+    }
+
+    @staticmethod
+    def migrate(field_table_name, field_day_table_name, report=True):
+        """
+        Apply all pending migrations to the given tables. Each migration runs in its own transaction.
+
+        Parameters:
+            field_table_name: The table holding all relevant areas as geojson polygons.
+            field_day_table_name: The table holding the data for each day and field available.
+            report: Flag to print the plan cost of the hot queries before and after migrating.
+
+        Returns:
+            dict: The plan cost of each hot query as (cost before, cost after). Empty if not reported.
+        """
+        plan_costs = {}
+
+        with AccessSql.db_session() as (db_connector, db_cursor):
+            DbSchema.create_migrations_table(db_connector)
+            applied_versions = DbSchema.get_applied_versions(db_cursor, field_day_table_name)
+
+            pending = [migration for migration in DbSchema.MIGRATIONS if migration[0] not in applied_versions]
+            if not pending:
+                logger.info("Schema of %s is up to date.", field_day_table_name)
+
+            if report:
+                plan_costs = {name: (cost, None) for name, cost in
+                              DbSchema.get_hot_query_costs(db_connector, field_table_name, field_day_table_name).items()}
+
+            for version, description, statements in pending:
+                try:
+                    for statement, index_name in statements:
+                        db_cursor.execute(DbSchema.format_statement(statement, index_name,
+                                                                    field_table_name, field_day_table_name))
+
+                    db_cursor.execute(sql.SQL("INSERT INTO public.{} (field_day_table, version, description) "
+                                              "VALUES (%s, %s, %s)").format(sql.Identifier(DbSchema.MIGRATIONS_TABLE)),
+                                      (field_day_table_name, version, description))
+                    db_connector.commit()
+                    logger.info("Applied migration %s: %s", version, description)
+
+                except psycopg2.Error as e:
+                    logger.error("Error applying migration %s: %s", version, e)
+                    db_connector.rollback()
+                    break
+
+            # Update the planner statistics, so the new indexes are taken into account.
+            db_cursor.execute(sql.SQL("ANALYZE public.{}").format(sql.Identifier(field_table_name)))
+            db_cursor.execute(sql.SQL("ANALYZE public.{}").format(sql.Identifier(field_day_table_name)))
+            db_connector.commit()
+
+            if report:
+                costs_after = DbSchema.get_hot_query_costs(db_connector, field_table_name, field_day_table_name)
+                plan_costs = {name: (costs[0], costs_after.get(name)) for name, costs in plan_costs.items()}
+
+                for name, (cost_before, cost_after) in plan_costs.items():
+                    logger.info("Plan cost %s: %s -> %s", name, cost_before, cost_after)
+
+        return plan_costs
+
+    @staticmethod
+    def create_migrations_table(db_connector):
+        """
+        Create the table recording the applied migrations if it does not exist yet.
+
+        Parameters:
+            db_connector (psycopg2.extensions.connection): The database connection object.
+        """
+        with db_connector.cursor() as cursor:
+            cursor.execute(sql.SQL("""
+                CREATE TABLE IF NOT EXISTS public.{} (
+                    field_day_table TEXT,
+                    version INTEGER,
+                    description TEXT,
+                    applied_at TIMESTAMPTZ DEFAULT now(),
+                    PRIMARY KEY (field_day_table, version)
+                )
+            """).format(sql.Identifier(DbSchema.MIGRATIONS_TABLE)))
+        db_connector.commit()
+
+    @staticmethod
+    def get_applied_versions(db_cursor, field_day_table_name):
+        """
+        Get the versions of the migrations already applied to a field_day table.
+
+        Parameters:
+            db_cursor (psycopg2.extensions.cursor): The database cursor object.
+            field_day_table_name: The name of the field_day table.
+
+        Returns:
+            set: The applied versions.
+        """
+        db_cursor.execute(sql.SQL("SELECT version FROM public.{} WHERE field_day_table = %s").format(
+            sql.Identifier(DbSchema.MIGRATIONS_TABLE)), (field_day_table_name,))
+        return {row[0] for row in db_cursor.fetchall()}
+
+    @staticmethod
+    def format_statement(statement, index_name, field_table_name, field_day_table_name):
+        """
+        Insert the table and index names into a migration statement as quoted identifiers.
+
+        Parameters:
+            statement: The statement with the placeholders {field}, {field_day}, {raster_store}, {band_stats},
+            {ingest_manifest} and {index}.
+            index_name: The name of the index with the placeholders {field} and {field_day}, or None.
+            field_table_name: The name of the field table.
+            field_day_table_name: The name of the field_day table.
+
+        Returns:
+            sql.Composed: The statement to execute.
+        """
+        names = {"field": sql.Identifier(field_table_name), "field_day": sql.Identifier(field_day_table_name),
+                 "raster_store": sql.Identifier(AccessSql.RASTER_STORE_TABLE),
+                 "band_stats": sql.Identifier(AccessSql.band_stats_name(field_day_table_name)),
+                 "ingest_manifest": sql.Identifier(AccessSql.ingest_manifest_name(field_day_table_name))}
+        if index_name:
+            names["index"] = sql.Identifier(index_name.format(field=field_table_name, field_day=field_day_table_name))
+
+        return sql.SQL(statement).format(**names)
+
+    @staticmethod
+    def get_hot_query_costs(db_connector, field_table_name, field_day_table_name):
+        """
+        Get the estimated total plan cost of each of the HOT_QUERIES with EXPLAIN.
+        The query parameters are taken from the first row of the field_day table.
+
+        Parameters:
+            db_connector (psycopg2.extensions.connection): The database connection object.
+            field_table_name: The name of the field table.
+            field_day_table_name: The name of the field_day table.
+
+        Returns:
+            dict: The total plan cost of each query by name.
+        """
+        costs = {}
+
+        with db_connector.cursor() as cursor:
+            cursor.execute(sql.SQL("SELECT field_id, date FROM public.{} LIMIT 1").format(
+                sql.Identifier(field_day_table_name)))
+            sample = cursor.fetchone() or (0, "2018-01-01")
+
+            for name, query in DbSchema.HOT_QUERIES.items():
+                params = sample[:query.count("%s")]
+                explain = sql.SQL("EXPLAIN (FORMAT JSON) ") + DbSchema.format_statement(
+                    query, None, field_table_name, field_day_table_name)
+
+                try:
+                    cursor.execute(explain, params)
+                    costs[name] = cursor.fetchone()[0][0]["Plan"]["Total Cost"]
+                except psycopg2.Error as e:
+                    logger.error("Error explaining %s: %s", name, e)
+                    db_connector.rollback()
+
+        db_connector.rollback()
+        return costs
+
+    @staticmethod
+    def configure_hypertable(field_day_table_name, chunk_interval=None, compress_after=None):
+        """
+        Set the chunk interval and the native compression of the field_day hypertable and add a policy compressing
+        the chunks older than compress_after. The compressed chunks are segmented by field_id and ordered by date,
+        so the time series of a field stays together. Entering rows into compressed chunks requires TimescaleDB 2.11.
+
+        Parameters:
+            field_day_table_name: The name of the field_day hypertable.
+            chunk_interval (str, optional): The date interval of new chunks. Defaults to DbConfig.chunk_interval.
+            compress_after (str, optional): The age of the chunks to compress. Defaults to DbConfig.compress_after.
+
+        Returns:
+            bool: True if the hypertable was configured.
+        """
+        chunk_interval = chunk_interval or DbConfig.chunk_interval
+        compress_after = compress_after or DbConfig.compress_after
+        table = "public." + field_day_table_name
+
+        with AccessSql.db_session() as (db_connector, db_cursor):
+            try:
+                db_cursor.execute("SELECT set_chunk_time_interval(%s, %s::interval)", (table, chunk_interval))
+
+                db_cursor.execute(sql.SQL("""
+                    ALTER TABLE public.{} SET (
+                        timescaledb.compress,
+                        timescaledb.compress_segmentby = 'field_id',
+                        timescaledb.compress_orderby = 'date'
+                    )
+                """).format(sql.Identifier(field_day_table_name)))
+
+                db_cursor.execute("SELECT add_compression_policy(%s, %s::interval, if_not_exists => TRUE)",
+                                  (table, compress_after))
+                db_connector.commit()
+
+                logger.info("Hypertable %s configured with chunk interval %s, compression after %s",
+                            field_day_table_name, chunk_interval, compress_after)
+                return True
+
+            except psycopg2.Error as e:
+                logger.error("Error configuring hypertable: %s", e)
+                db_connector.rollback()
+                return False
+
+    @staticmethod
+    def compress_chunks(field_day_table_name, compress_after=None, report=True):
+        """
+        Compress the chunks of the field_day hypertable older than compress_after right away instead of waiting for
+        the compression policy.
+
+        Parameters:
+            field_day_table_name: The name of the field_day hypertable.
+            compress_after (str, optional): The age of the chunks to compress. Defaults to DbConfig.compress_after.
+            report: Flag to print the size of each chunk before and after compressing.
+
+        Returns:
+            int: The amount of chunks compressed.
+        """
+        compress_after = compress_after or DbConfig.compress_after
+        table = "public." + field_day_table_name
+
+        with AccessSql.db_session() as (db_connector, db_cursor):
+            try:
+                db_cursor.execute("""
+                    SELECT compress_chunk(chunk, if_not_compressed => TRUE)
+                    FROM show_chunks(%s, older_than => %s::interval) chunk
+                """, (table, compress_after))
+                amount_chunks = db_cursor.rowcount
+                db_connector.commit()
+
+            except psycopg2.Error as e:
+                logger.error("Error compressing chunks: %s", e)
+                db_connector.rollback()
+                return 0
+
+        logger.info("Chunks compressed: %s", amount_chunks)
+
+        if report:
+            DbSchema.report_chunk_sizes(field_day_table_name)
+
+        return amount_chunks
+
+    @staticmethod
+    def get_chunk_sizes(field_day_table_name):
+        """
+        Get the size of each chunk of the field_day hypertable before and after compression.
+
+        Parameters:
+            field_day_table_name: The name of the field_day hypertable.
+
+        Returns:
+            list: Tuples of (chunk name, range start, range end, compressed, bytes before, bytes after) in date order.
+            The bytes after compression are None for uncompressed chunks.
+        """
+        table = "public." + field_day_table_name
+
+        with AccessSql.db_session() as (db_connector, db_cursor):
+            db_cursor.execute("""
+                SELECT chunk.chunk_name, chunk.range_start, chunk.range_end, chunk.is_compressed,
+                       COALESCE(stats.before_compression_total_bytes, size.total_bytes),
+                       stats.after_compression_total_bytes
+                FROM timescaledb_information.chunks chunk
+                JOIN chunks_detailed_size(%s) size
+                    ON size.chunk_schema = chunk.chunk_schema AND size.chunk_name = chunk.chunk_name
+                LEFT JOIN chunk_compression_stats(%s) stats
+                    ON stats.chunk_schema = chunk.chunk_schema AND stats.chunk_name = chunk.chunk_name
+                WHERE chunk.hypertable_schema = 'public' AND chunk.hypertable_name = %s
+                ORDER BY chunk.range_start, chunk.chunk_name
+            """, (table, table, field_day_table_name))
+            chunk_sizes = db_cursor.fetchall()
+            db_connector.rollback()
+
+        return chunk_sizes
+
+    @staticmethod
+    def report_chunk_sizes(field_day_table_name):
+        """
+        Print the size of each chunk of the field_day hypertable before and after compression and the totals.
+
+        Parameters:
+            field_day_table_name: The name of the field_day hypertable.
+
+        Returns:
+            tuple: The total bytes before and after compression. Uncompressed chunks count with their size in both.
+        """
+        total_before = total_after = 0
+
+        for chunk_name, range_start, range_end, compressed, bytes_before, bytes_after in (
+                DbSchema.get_chunk_sizes(field_day_table_name)):
+            bytes_after = bytes_after if compressed and bytes_after is not None else bytes_before
+            total_before += bytes_before or 0
+            total_after += bytes_after or 0
+
+            logger.info("Chunk %s (%s - %s): %s -> %s bytes%s", chunk_name, range_start, range_end, bytes_before,
+                        bytes_after, "" if compressed else ", uncompressed")
+
+        logger.info("Total size of %s: %s -> %s bytes", field_day_table_name, total_before, total_after)
+        return total_before, total_after
+
+    @staticmethod
+    def create_meteo_aggregate(field_day_table_name, scale=None, base_temperature=None):
+        """
+        Create the continuous aggregate of the weekly agro-meteorological features of each field and the policy
+        refreshing it. Only the weeks invalidated by entered rows are materialised again, the latest rows are added at
+        query time. The features are the mean, minimum and maximum temperature, the precipitation sum, the growing
+        degree days and the amount of days with temperature.
+
+        Parameters:
+            field_day_table_name: The name of the field_day hypertable.
+            scale (float, optional): Factor converting the stored values to degree Celsius and mm.
+            Defaults to DbConfig.meteo_scale.
+            base_temperature (float, optional): The base temperature of the growing degree days in degree Celsius.
+            Defaults to DbConfig.gdd_base_temperature.
+
+        Returns:
+            bool: True if the aggregate exists.
+        """
+        scale = DbConfig.meteo_scale if scale is None else scale
+        base_temperature = DbConfig.gdd_base_temperature if base_temperature is None else base_temperature
+        view_name = AccessSql.meteo_aggregate_name(field_day_table_name)
+
+        with AccessSql.db_session() as (db_connector, db_cursor):
+            try:
+                db_cursor.execute(sql.SQL("""
+                    CREATE MATERIALIZED VIEW IF NOT EXISTS public.{view}
+                    WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+                    SELECT field_id,
+                           time_bucket(INTERVAL '7 days', date) AS week,
+                           avg(temp_mean) * {scale} AS temp_mean,
+                           min(temp_min) * {scale} AS temp_min,
+                           max(temp_max) * {scale} AS temp_max,
+                           sum(precip) * {scale} AS precip,
+                           sum(GREATEST(temp_mean * {scale} - {base}, 0)) AS gdd,
+                           count(temp_mean) AS days
+                    FROM public.{table}
+                    GROUP BY field_id, week
+                    WITH NO DATA
+                """).format(view=sql.Identifier(view_name), table=sql.Identifier(field_day_table_name),
+                            scale=sql.Literal(scale), base=sql.Literal(base_temperature)))
+
+                # Historical rows are entered late, so the whole range is refreshed where it was invalidated.
+                db_cursor.execute("""
+                    SELECT add_continuous_aggregate_policy(%s, start_offset => NULL, end_offset => INTERVAL '1 day',
+                                                           schedule_interval => INTERVAL '1 hour',
+                                                           if_not_exists => TRUE)
+                """, ("public." + view_name,))
+                db_connector.commit()
+
+                logger.info("Continuous aggregate %s created.", view_name)
+                return True
+
+            except psycopg2.Error as e:
+                logger.error("Error creating continuous aggregate: %s", e)
+                db_connector.rollback()
+                return False
+
+    @staticmethod
+    def refresh_meteo_aggregate(field_day_table_name, start_date=None, end_date=None):
+        """
+        Materialise the continuous aggregate of the weekly agro-meteorological features right away, e.g. after
+        entering historical rows, instead of waiting for the refresh policy.
+
+        Parameters:
+            field_day_table_name: The name of the field_day hypertable.
+            start_date (str, optional): The first date to refresh. Defaults to the first date entered.
+            end_date (str, optional): The last date to refresh. Defaults to the last date entered.
+        """
+        with AccessSql.db_session() as (db_connector, db_cursor):
+            # The refresh can not run inside a transaction.
+            db_connector.autocommit = True
+            try:
+                db_cursor.execute("CALL refresh_continuous_aggregate(%s, %s::date, %s::date)",
+                                  ("public." + AccessSql.meteo_aggregate_name(field_day_table_name),
+                                   start_date, end_date))
+                logger.info("Continuous aggregate refreshed.")
+
+            except psycopg2.Error as e:
+                logger.error("Error refreshing continuous aggregate: %s", e)
+            finally:
+                db_connector.autocommit = False
@@ -0,0 +1,168 @@
+#--------------------------------------------------------------------------------------------------------------------------------
+# Name:        field_day_dataset
+# Purpose:
+#
+# Author:      jennifer.mcclelland
+#
+# Created:     2024
+# Copyright:   (c) jennifer.mcclelland 2024
+#
+#--------------------------------------------------------------------------------------------------------------------------------
+
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from modules.access_sql import AccessSql
+
+
+class FieldDayDataset:
+    """
+    An iterable dataset of the field_day rows of a filter as in AccessSql.connect_and_filter_by_complete() for
+    training loops.
+    The keys of the filter result are listed once. Batches of keys are fetched and decoded by a thread pool in the
+    background, up to prefetch batches ahead of the training loop, so the next batches are ready while the current
+    one is processed. The order of the keys can be shuffled deterministically by a seed and the epoch.
+
+    Each batch is a list of rows as dict of column name and value, raster columns are decoded with
+    AccessSql.decode_raster() and out-db bands are read.
+    """
+
+    def __init__(self, bsc, coh, s2, s2_invalid, table_name="field_day_c", batch_size=32, prefetch=4, workers=4,
+                 shuffle=False, seed=0, columns=None, drop_last=False):
+        """
+        Parameters:
+            s2_invalid: The flag to define if s2 is retrieved with less than 50% valid pixel.
+            s2: The flag to define if s2 radar data must be available in table.
+            coh: The flag to define if coh radar data must be available in table.
+            bsc: The flag to define if bsc radar data must be available in table.
+            table_name: The name of the field_day table the filter is applied to.
+            batch_size (int): The amount of rows per batch.
+            prefetch (int): The amount of batches fetched ahead. This bounds the memory used by the dataset.
+            workers (int): The amount of batches fetched and decoded at the same time.
+            shuffle (bool): The flag to shuffle the rows each epoch.
+            seed (int): The seed of the shuffling. The same seed and epoch give the same order.
+            columns: The columns to fetch, "metadata" for all scalar columns. Defaults to all columns.
+            drop_last (bool): The flag to drop the last batch if it holds less than batch_size rows.
+        """
+        self.filter = {"bsc": bsc, "coh": coh, "s2": s2, "s2_invalid": s2_invalid}
+        self.table_name = table_name
+        self.batch_size = batch_size
+        self.prefetch = max(prefetch, 1)
+        self.workers = workers
+        self.shuffle = shuffle
+        self.seed = seed
+        self.columns = AccessSql.resolve_columns(columns)
+        self.drop_last = drop_last
+        self.epoch = 0
+        self.keys = None
+
+    def set_epoch(self, epoch):
+        """
+        Set the epoch, which changes the shuffled order of the next iteration.
+        """
+        self.epoch = epoch
+
+    def list_keys(self):
+        """
+        List the (field_id, date) keys of the filter result ordered by field_id and date. The keys are listed once and
+        kept for all epochs.
+
+        Returns:
+            list: The keys.
+        """
+        if self.keys is None:
+            self.keys = [tuple(row) for row in AccessSql.stream_filter_by_complete(
+                columns=["field_id", "date"], ordered=True, itersize=10000, table_name=self.table_name,
+                **self.filter)]
+
+        return self.keys
+
+    def __len__(self):
+        return len(FieldDayDataset.batch_keys(self.list_keys(), self.batch_size, self.drop_last))
+
+    def __iter__(self):
+        keys = FieldDayDataset.order_keys(self.list_keys(), self.shuffle, self.seed, self.epoch)
+        batches = iter(FieldDayDataset.batch_keys(keys, self.batch_size, self.drop_last))
+        pending = collections.deque()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                for batch in batches:
+                    pending.append(executor.submit(self.fetch_batch, batch))
+                    if len(pending) >= self.prefetch:
+                        break
+
+                while pending:
+                    rows = pending.popleft().result()
+
+                    # The freed place is taken by the next batch before the current one is handed out.
+                    batch = next(batches, None)
+                    if batch is not None:
+                        pending.append(executor.submit(self.fetch_batch, batch))
+
+                    yield rows
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def fetch_batch(self, keys):
+        """
+        Fetch and decode the rows of a batch of keys.
+
+        Returns:
+            list: The rows in the order of the keys as dict of column name and value. Rows deleted since the keys were
+            listed are left out.
+        """
+        with AccessSql.db_session() as (db_connector, _):
+            rows = AccessSql.fetch_rows(db_connector, self.table_name, keys, "wkb", self.columns)
+
+        if rows is None:
+            raise RuntimeError(f"Error fetching a batch of {len(keys)} rows from {self.table_name}")
+
+        return [FieldDayDataset.decode_row(self.columns, rows[key]) for key in keys if rows[key] is not None]
+
+    @staticmethod
+    def decode_row(columns, row):
+        """
+        Convert a row fetched with raster_format "wkb" to a dict and decode its rasters.
+        """
+        values = dict(zip(columns, row))
+
+        for column in columns:
+            if column in AccessSql.RASTER_COLUMNS and values[column] is not None:
+                raster = AccessSql.decode_raster(values[column], "wkb")
+                if any(outdb is not None for outdb in raster["outdb"]):
+                    raster = AccessSql.load_outdb_bands(raster)
+                values[column] = raster
+
+        return values
+
+    @staticmethod
+    def order_keys(keys, shuffle=False, seed=0, epoch=0):
+        """
+        Get the order of the keys for an epoch. Shuffled orders only depend on the seed and the epoch.
+
+        Returns:
+            list: The keys.
+        """
+        if not shuffle:
+            return list(keys)
+
+        permutation = np.random.default_rng([seed, epoch]).permutation(len(keys))
+        return [keys[index] for index in permutation]
+
+    @staticmethod
+    def batch_keys(keys, batch_size, drop_last=False):
+        """
+        Split the keys to batches of batch_size keys.
+
+        Returns:
+            list: The batches as lists of keys.
+        """
+        batches = [keys[start:start + batch_size] for start in range(0, len(keys), batch_size)]
+        if drop_last and batches and len(batches[-1]) < batch_size:
+            batches.pop()
+
+        return batches
@@ -16,12 +16,11 @@ class GeoJsonCreator:
     @staticmethod
     def get_polygons_from_field_ids(field_ids, table_name):
         """
-        Queries the AccessSql class for each field ID to retrieve polygons.
-        Returns a list of polygons.
+        Queries the AccessSql class for the polygons of all field IDs at once.
+        Returns a list of polygons in the order of the field IDs.
         """
         polygons = []
-        for field_id in field_ids:
-            polygon_geojson = AccessSql.get_polygon_by_field_id(field_id, table_name)
+        for polygon_geojson in AccessSql.get_polygons(field_ids, table_name).values():
             if polygon_geojson:
                 polygons.append(shape(json.loads(polygon_geojson)))  # Convert GeoJSON to Shapely geometry
         return polygons
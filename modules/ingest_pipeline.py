@@ -0,0 +1,181 @@
+#--------------------------------------------------------------------------------------------------------------------------------
+# Name:        ingest_pipeline
+# Purpose:
+#
+# Author:      jennifer.mcclelland
+#
+# Created:     2024
+# Copyright:   (c) jennifer.mcclelland 2024
+#
+#--------------------------------------------------------------------------------------------------------------------------------
+
+import time
+import queue
+import threading
+
+from modules.metrics import metrics
+
+
+class IngestPipeline:
+    """
+    A pipeline of stages connected by bounded queues. Each stage runs its function on the items of its input queue with
+    its own amount of worker threads and puts the results into the queue of the next stage. A full queue blocks the
+    stages before it, so a slow stage holds back the others and only a bounded amount of items is in memory.
+    Disk access, computation and database writes of different items overlap.
+
+    A stage function returns the processed item or None to drop it. Errors of an item are recorded in errors and the
+    item is dropped, the other items are processed further. The order of the items is not kept.
+    The duration of each stage and the amount of items and errors are recorded in modules.metrics with the label stage.
+    """
+
+    # Marks the end of the items in a queue.
+    END = object()
+
+    def __init__(self, queue_size=16):
+        """
+        Parameters:
+            queue_size (int): The maximum amount of items waiting in front of each stage.
+        """
+        self.queue_size = queue_size
+        self.stages = []
+        self.errors = []
+        self.errors_lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def add_stage(self, name, function, workers=1):
+        """
+        Add a stage after the stages added before.
+
+        Parameters:
+            name (str): The name of the stage used in the error messages.
+            function: Function processing an item, returns the processed item or None to drop it.
+            workers (int): The amount of threads running the stage.
+
+        Returns:
+            IngestPipeline: The pipeline, so stages can be chained.
+        """
+        self.stages.append((name, function, max(workers, 1)))
+        return self
+
+    def run(self, items):
+        """
+        Run the items through all stages.
+
+        Parameters:
+            items: Iterable of the items, e.g. a generator discovering them. It is consumed by a thread of its own.
+
+        Yields:
+            The items processed by the last stage in the order they are finished.
+        """
+        queues = [queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self.feed, args=(items, queues[0]), daemon=True)]
+
+        for index, (name, function, workers) in enumerate(self.stages):
+            # The last worker of a stage to finish passes the end on to the next stage.
+            remaining = [workers]
+            remaining_lock = threading.Lock()
+
+            for _ in range(workers):
+                threads.append(threading.Thread(target=self.work, daemon=True,
+                                                args=(name, function, queues[index], queues[index + 1], remaining,
+                                                      remaining_lock)))
+
+        self.stopped.clear()
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = queues[-1].get()
+                if item is IngestPipeline.END:
+                    break
+                yield item
+        finally:
+            # The consumer stopped early or failed, the stages are stopped at their next item.
+            self.stopped.set()
+            for thread in threads:
+                thread.join()
+
+    def feed(self, items, output_queue):
+        try:
+            for item in items:
+                if not self.put(output_queue, item):
+                    return
+        except Exception as e:
+            self.record_error("discover", e)
+
+        self.put(output_queue, IngestPipeline.END)
+
+    def work(self, name, function, input_queue, output_queue, remaining, remaining_lock):
+        while not self.stopped.is_set():
+            try:
+                item = input_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            if item is IngestPipeline.END:
+                # The other workers of the stage need the end as well.
+                input_queue.put(item)
+                break
+
+            start = time.perf_counter()
+            try:
+                result = function(item)
+            except Exception as e:
+                self.record_error(name, e)
+                continue
+            finally:
+                metrics.observe("agriref_ingest_stage_seconds", time.perf_counter() - start, {"stage": name})
+
+            metrics.count("agriref_ingest_stage_items", labels={"stage": name})
+
+            if result is not None and not self.put(output_queue, result):
+                return
+
+        with remaining_lock:
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                self.put(output_queue, IngestPipeline.END)
+
+    def put(self, output_queue, item):
+        # Waits for space in the queue as long as the pipeline is running.
+        while not self.stopped.is_set():
+            try:
+                output_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+
+        return False
+
+    def record_error(self, name, error):
+        metrics.count("agriref_ingest_stage_errors", labels={"stage": name})
+        with self.errors_lock:
+            self.errors.append((name, f"{type(error).__name__}: {error}"))
+
+    @staticmethod
+    def batches(items, batch_size, max_bytes=None, item_bytes=None):
+        """
+        Group a stream of items to lists of batch_size items. With max_bytes a batch also ends as soon as its items
+        hold max_bytes, so batches of large items stay bounded in memory.
+
+        Parameters:
+            items: Iterable of the items.
+            batch_size (int): The maximum amount of items per batch.
+            max_bytes (int, optional): The amount of bytes ending a batch.
+            item_bytes: Function returning the amount of bytes of an item, needed with max_bytes.
+        """
+        batch = []
+        batch_bytes = 0
+        for item in items:
+            batch.append(item)
+            if max_bytes:
+                batch_bytes += item_bytes(item)
+
+            if len(batch) == batch_size or (max_bytes and batch_bytes >= max_bytes):
+                yield batch
+                batch = []
+                batch_bytes = 0
+
+        if batch:
+            yield batch
@@ -11,15 +11,21 @@
 
 import os
 import json
+import logging
 import numpy as np
 import rasterio
 from rasterio.mask import mask
+from rasterio.io import MemoryFile
 from shapely.geometry import shape
 from scipy.interpolate import griddata
 from contextlib import contextmanager
 from rasterio.plot import show
 import matplotlib.pyplot as plt
 
+from modules.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
 
 class InterpolateGeotiffs:
     """
@@ -110,13 +116,14 @@ class InterpolateGeotiffs:
                 yield src, json_file
 
     @staticmethod
+    @metrics.timed("agriref_raster_seconds", {"operation": "valid_pixel_in_poly"})
     def valid_pixel_in_poly(path_to_geojson, path_to_geotiff, no_data_value=6.9055e-41):
         """
             Calculates the amount of raster pixel that are not no_data_value and inside the given geojson borders.
 
             Parameters:
                 path_to_geojson (str): Path to the GoeJSON border object.
-                path_to_geotiff (str): Path to the GeoTIFF file.
+                path_to_geotiff (str or file object): Path to the GeoTIFF file or the GeoTIFF opened in memory.
 
             Yields:
                 tuple: A tuple containing the opened raster and GeoJSON files.
@@ -144,10 +151,8 @@ class InterpolateGeotiffs:
                 band = opened_data_tiff.read(1)
                 amount_pixel_data = np.count_nonzero(band != no_data_value)
 
-            with rasterio.open("mask", 'w', **meta) as dest:
-                print("Mask created")
-
-            with rasterio.open("mask", 'r+', **meta) as dest1:
+            # The mask is created in memory, so it is not shared by threads or processes running at the same time.
+            with MemoryFile() as memfile, memfile.open(**meta) as dest1:
                 data = dest1.read()
                 data[data == no_data_value] = 1
 
@@ -186,7 +191,7 @@ class InterpolateGeotiffs:
             rel = pixel_data / pixel_mask
 
             if min_amount_pixel < rel < 1:
-                print(str(geotiff_list[j]) + " can be interpolated.")
+                logger.info("%s can be interpolated.", geotiff_list[j])
 
                 src = rasterio.open(current_field_item)
                 meta = src.meta
@@ -205,6 +210,7 @@ class InterpolateGeotiffs:
                         dest1.write(arr_orig[i], i + 1)
 
     @staticmethod
+    @metrics.timed("agriref_raster_seconds", {"operation": "interpolate_tiff"})
     def interpolate_tiff(geotiff, output_folder):
         """
             Interpolates a geotiff and saves in a folder. Name the output file with extension ":interp"
@@ -233,6 +239,8 @@ class InterpolateGeotiffs:
         with rasterio.open(output_path, 'w', **meta) as dest1:
             for i in range(len(src.indexes)):
                 dest1.write(arr_orig[i], i + 1)
+
+        metrics.count("agriref_rasters_interpolated")
         return output_path
 
     @staticmethod
@@ -335,7 +343,7 @@ class InterpolateGeotiffs:
                     # Plot the RGB image on the current subplot
                     ax = axes[i] if num_plots > 1 else axes
 
-                    print("2 Band:" + str(axes[i]))
+                    logger.debug("2 Band: %s", axes[i])
                     ax.imshow(rgb)
 
                 elif amount_bands >= 2:
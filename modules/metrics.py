@@ -0,0 +1,244 @@
+#--------------------------------------------------------------------------------------------------------------------------------
+# Name:        metrics
+# Purpose:
+#
+# Author:      jennifer.mcclelland
+#
+# Created:     2024
+# Copyright:   (c) jennifer.mcclelland 2024
+#
+#--------------------------------------------------------------------------------------------------------------------------------
+
+import json
+import time
+import bisect
+import threading
+import functools
+from contextlib import contextmanager
+
+from modules.db_config import DbConfig
+
+
+class Metrics:
+    """
+    A lightweight registry of counters and histograms, e.g. of the rows and bytes entered, cache hits and the duration
+    of each stage of ingest and queries. Timers are histograms of seconds.
+    The values can be exported as JSON or in the Prometheus text format. Each metric can have labels, e.g. the stage.
+    A disabled registry records nothing.
+    """
+
+    # Upper bounds of the histogram buckets, suited for durations in seconds.
+    DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+
+    def __init__(self, enabled=True, buckets=None):
+        self.enabled = enabled
+        self.buckets = tuple(buckets or Metrics.DEFAULT_BUCKETS)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+            self.started_at = time.time()
+
+    @staticmethod
+    def make_key(name, labels=None):
+        return name, tuple(sorted((labels or {}).items()))
+
+    def count(self, name, value=1, labels=None):
+        """
+        Add a value to a counter.
+
+        Parameters:
+            name (str): The name of the counter, e.g. "agriref_rows_entered".
+            value: The value to add.
+            labels (dict, optional): The labels of the counter.
+        """
+        if not self.enabled:
+            return
+
+        key = Metrics.make_key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        """
+        Add a value to a histogram.
+
+        Parameters:
+            name (str): The name of the histogram, e.g. "agriref_stage_seconds".
+            value: The observed value.
+            labels (dict, optional): The labels of the histogram.
+        """
+        if not self.enabled:
+            return
+
+        key = Metrics.make_key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0,
+                                                    "min": value, "max": value}
+
+            # Only the first bucket holding the value is counted, the export accumulates them.
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                histogram["buckets"][index] += 1
+
+            histogram["count"] += 1
+            histogram["sum"] += value
+            histogram["min"] = min(histogram["min"], value)
+            histogram["max"] = max(histogram["max"], value)
+
+    @contextmanager
+    def timer(self, name, labels=None):
+        """
+        Measure the duration of a with block in seconds into a histogram. The duration is recorded on errors as well.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, labels)
+
+    def timed(self, name, labels=None):
+        """
+        Decorator measuring the duration of each call of a function in seconds into a histogram.
+        Generators are not measured, as they run after the call returns.
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, labels):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def drain(self):
+        """
+        Take all values recorded since the last drain and reset them, e.g. to hand the metrics of a worker process to
+        the parent process.
+
+        Returns:
+            dict: The raw counters and histograms, to be added to another registry with merge().
+        """
+        with self.lock:
+            values = {"counters": self.counters, "histograms": self.histograms}
+            self.counters = {}
+            self.histograms = {}
+
+        return values
+
+    def merge(self, values):
+        """
+        Add the values taken from another registry with drain(). Both registries need the same buckets.
+        """
+        if not self.enabled:
+            return
+
+        with self.lock:
+            for key, value in values["counters"].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+
+            for key, other in values["histograms"].items():
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    self.histograms[key] = dict(other, buckets=list(other["buckets"]))
+                    continue
+
+                histogram["buckets"] = [a + b for a, b in zip(histogram["buckets"], other["buckets"])]
+                histogram["count"] += other["count"]
+                histogram["sum"] += other["sum"]
+                histogram["min"] = min(histogram["min"], other["min"])
+                histogram["max"] = max(histogram["max"], other["max"])
+
+    def to_dict(self):
+        """
+        Get all metrics. Counters also hold their rate per second since the registry was created or reset.
+
+        Returns:
+            dict: "counters" and "histograms" as lists of dicts with name, labels and values, and "elapsed_seconds".
+        """
+        with self.lock:
+            elapsed = max(time.time() - self.started_at, 1e-9)
+
+            counters = [{"name": name, "labels": dict(labels), "value": value, "rate_per_second": value / elapsed}
+                        for (name, labels), value in sorted(self.counters.items())]
+
+            histograms = []
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                histograms.append({"name": name, "labels": dict(labels), "count": histogram["count"],
+                                   "sum": histogram["sum"], "min": histogram["min"], "max": histogram["max"],
+                                   "mean": histogram["sum"] / histogram["count"],
+                                   "buckets": dict(zip(map(str, self.buckets), histogram["buckets"]))})
+
+        return {"elapsed_seconds": elapsed, "counters": counters, "histograms": histograms}
+
+    def to_json(self, indent=None):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_prometheus(self):
+        """
+        Get all metrics in the Prometheus text exposition format. Counters get the suffix "_total", histograms
+        cumulative "_bucket" lines and "_sum" and "_count".
+
+        Returns:
+            str: The metrics.
+        """
+        lines = []
+        metrics = self.to_dict()
+
+        for name in sorted({counter["name"] for counter in metrics["counters"]}):
+            lines.append(f"# TYPE {name}_total counter")
+            for counter in metrics["counters"]:
+                if counter["name"] == name:
+                    lines.append(f"{name}_total{Metrics.format_labels(counter['labels'])} {counter['value']}")
+
+        for name in sorted({histogram["name"] for histogram in metrics["histograms"]}):
+            lines.append(f"# TYPE {name} histogram")
+            for histogram in metrics["histograms"]:
+                if histogram["name"] != name:
+                    continue
+
+                cumulative = 0
+                for bound, amount in zip(self.buckets, histogram["buckets"].values()):
+                    cumulative += amount
+                    labels = Metrics.format_labels(dict(histogram["labels"], le=repr(float(bound))))
+                    lines.append(f"{name}_bucket{labels} {cumulative}")
+
+                lines.append(f"{name}_bucket{Metrics.format_labels(dict(histogram['labels'], le='+Inf'))} "
+                             f"{histogram['count']}")
+                lines.append(f"{name}_sum{Metrics.format_labels(histogram['labels'])} {histogram['sum']}")
+                lines.append(f"{name}_count{Metrics.format_labels(histogram['labels'])} {histogram['count']}")
+
+        return "\n".join(lines) + "\n" if lines else ""
+
+    @staticmethod
+    def format_labels(labels):
+        if not labels:
+            return ""
+
+        escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+                   for value in labels.values())
+        return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+    def write(self, path, output_format="json"):
+        """
+        Write all metrics to a file, e.g. for the textfile collector of the Prometheus node exporter.
+
+        Parameters:
+            path (str): The path of the file.
+            output_format (str): "json" or "prometheus".
+        """
+        if output_format not in ("json", "prometheus"):
+            raise ValueError(f"Unknown metrics format: {output_format}")
+
+        with open(path, "w") as f:
+            f.write(self.to_json(indent=2) if output_format == "json" else self.to_prometheus())
+
+
+# The registry shared by AccessSql, InterpolateGeotiffs and the ingest.
+metrics = Metrics(enabled=DbConfig.metrics)
@@ -0,0 +1,211 @@
+#--------------------------------------------------------------------------------------------------------------------------------
+# Name:        raster_disk_cache
+# Purpose:
+#
+# Author:      jennifer.mcclelland
+#
+# Created:     2024
+# Copyright:   (c) jennifer.mcclelland 2024
+#
+#--------------------------------------------------------------------------------------------------------------------------------
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class RasterDiskCache:
+    """
+    A local disk cache of decoded rasters shared by all processes on a machine.
+    Each raster is stored as .npy file of its stacked bands and opened memory-mapped, so worker processes share hot
+    rasters through the page cache. A sqlite manifest holds the key, size and last access of each file, the least
+    recently used files are removed when the cache grows beyond its budget. Files are written to a temporary file and
+    moved in place, so readers never see partial files.
+    """
+
+    MANIFEST_NAME = "manifest.sqlite"
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        with self.connect_manifest() as manifest:
+            manifest.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    table_name TEXT,
+                    field_id INTEGER,
+                    date TEXT,
+                    column_name TEXT,
+                    file_name TEXT,
+                    size INTEGER,
+                    last_access REAL,
+                    meta TEXT,
+                    PRIMARY KEY (table_name, field_id, date, column_name)
+                )
+            """)
+
+    @contextmanager
+    def connect_manifest(self):
+        """
+        Open the manifest for the duration of a with block and commit the changes afterwards.
+        A connection is opened per use, so the cache can be used by threads and forked processes.
+        """
+        manifest = sqlite3.connect(os.path.join(self.directory, RasterDiskCache.MANIFEST_NAME), timeout=30)
+        try:
+            with manifest:
+                yield manifest
+        finally:
+            manifest.close()
+
+    @staticmethod
+    def make_key(table_name, field_id, date, column):
+        """
+        Create the key of a raster. Tables in public may be given with or without schema, dates as date or string.
+        """
+        table_name = table_name[len("public."):] if table_name.startswith("public.") else table_name
+        return table_name, int(field_id), str(date), column
+
+    def get(self, table_name, field_id, date, column):
+        """
+        Get a cached raster.
+
+        Returns:
+            dict or None: The raster as returned by AccessSql.decode_raster() with read-only memory-mapped bands.
+            None if the raster is not cached.
+        """
+        key = RasterDiskCache.make_key(table_name, field_id, date, column)
+
+        with self.connect_manifest() as manifest:
+            entry = manifest.execute("SELECT file_name, meta FROM entries WHERE table_name = ? AND field_id = ? "
+                                     "AND date = ? AND column_name = ?", key).fetchone()
+            if entry is None:
+                return None
+
+            try:
+                bands = np.load(os.path.join(self.directory, entry[0]), mmap_mode="r")
+            except OSError:
+                # The file was evicted by another process in the meantime.
+                return None
+
+            manifest.execute("UPDATE entries SET last_access = ? WHERE table_name = ? AND field_id = ? AND date = ? "
+                             "AND column_name = ?", (time.time(),) + key)
+
+        raster = json.loads(entry[1])
+        raster["geotransform"] = tuple(raster["geotransform"])
+        raster["bands"] = list(bands)
+        raster["outdb"] = [None] * len(raster["bands"])
+        return raster
+
+    def put(self, table_name, field_id, date, column, raster):
+        """
+        Cache a decoded raster. Rasters with out-db bands are not cached.
+
+        Parameters:
+            raster (dict): The raster as returned by AccessSql.decode_raster().
+
+        Returns:
+            bool: True if the raster is cached.
+        """
+        if raster is None or not raster["bands"] or any(band is None for band in raster["bands"]):
+            return False
+
+        key = RasterDiskCache.make_key(table_name, field_id, date, column)
+        file_name = hashlib.sha1(repr(key).encode()).hexdigest() + ".npy"
+        bands = np.stack(raster["bands"])
+
+        if bands.nbytes > self.max_bytes:
+            return False
+
+        # The temporary file is in the same directory, so it is moved in place atomically.
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "wb") as f:
+                np.save(f, bands)
+            os.replace(temp_path, os.path.join(self.directory, file_name))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        meta = {name: raster[name] for name in ("width", "height", "srid", "geotransform", "nodata")}
+
+        with self.connect_manifest() as manifest:
+            manifest.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             key + (file_name, os.path.getsize(os.path.join(self.directory, file_name)), time.time(),
+                                    json.dumps(meta)))
+
+        self.evict()
+        return True
+
+    def evict(self):
+        """
+        Remove the least recently used rasters until the cache fits into its budget.
+
+        Returns:
+            int: The amount of rasters removed.
+        """
+        removed = 0
+
+        with self.connect_manifest() as manifest:
+            total_size = manifest.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total_size <= self.max_bytes:
+                return 0
+
+            for entry in manifest.execute("SELECT table_name, field_id, date, column_name, file_name, size "
+                                          "FROM entries ORDER BY last_access").fetchall():
+                self.remove_entry(manifest, entry)
+                total_size -= entry[5]
+                removed += 1
+
+                if total_size <= self.max_bytes:
+                    break
+
+        return removed
+
+    def invalidate(self, table_name, field_id, date=None):
+        """
+        Remove the cached rasters of a field_id, or only of one date of it.
+
+        Returns:
+            int: The amount of rasters removed.
+        """
+        table_name, field_id, _, _ = RasterDiskCache.make_key(table_name, field_id, date, None)
+        date = None if date is None else str(date)
+
+        with self.connect_manifest() as manifest:
+            entries = manifest.execute("SELECT table_name, field_id, date, column_name, file_name, size FROM entries "
+                                       "WHERE table_name = ? AND field_id = ? AND (? IS NULL OR date = ?)",
+                                       (table_name, field_id, date, date)).fetchall()
+            for entry in entries:
+                self.remove_entry(manifest, entry)
+
+        return len(entries)
+
+    def remove_entry(self, manifest, entry):
+        manifest.execute("DELETE FROM entries WHERE table_name = ? AND field_id = ? AND date = ? AND column_name = ?",
+                         entry[:4])
+
+        # Processes that still map the file keep their mapping until they close it.
+        try:
+            os.remove(os.path.join(self.directory, entry[4]))
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        """
+        Get the amount of cached rasters and their size.
+
+        Returns:
+            dict: entries, size_bytes and max_bytes.
+        """
+        with self.connect_manifest() as manifest:
+            entries, size_bytes = manifest.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+
+        return {"entries": entries, "size_bytes": size_bytes, "max_bytes": self.max_bytes}
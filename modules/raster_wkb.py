@@ -0,0 +1,120 @@
+#--------------------------------------------------------------------------------------------------------------------------------
+# Name:        raster_wkb
+# Purpose:
+#
+# Author:      jennifer.mcclelland
+#
+# Created:     2024
+# Copyright:   (c) jennifer.mcclelland 2024
+#
+#--------------------------------------------------------------------------------------------------------------------------------
+
+import struct
+import numpy as np
+
+
+class RasterWkb:
+    """
+    This class decodes the native Postgis raster binary as returned by ST_AsBinary(raster) with NumPy only.
+    No GeoTIFF has to be encoded by the server or opened again with GDAL by the client.
+    """
+
+    # Postgis pixel types mapped to NumPy types. 1, 2 and 4 bit pixel are stored in one byte each.
+    PIXEL_TYPES = {
+        0: np.uint8,    # 1BB
+        1: np.uint8,    # 2BUI
+        2: np.uint8,    # 4BUI
+        3: np.int8,     # 8BSI
+        4: np.uint8,    # 8BUI
+        5: np.int16,    # 16BSI
+        6: np.uint16,   # 16BUI
+        7: np.int32,    # 32BSI
+        8: np.uint32,   # 32BUI
+        9: np.float16,  # 16BF
+        10: np.float32, # 32BF
+        11: np.float64  # 64BF
+    }
+
+    # Byte order, version, amount bands, scale x/y, upper left x/y, skew x/y, srid, width, height
+    HEADER_FORMAT = "HHddddddiHH"
+    HEADER_SIZE = 1 + struct.calcsize("<" + HEADER_FORMAT)
+
+    BAND_IS_OFFLINE = 0x80
+    BAND_HAS_NODATA = 0x40
+
+    @staticmethod
+    def decode(data):
+        """
+        Decode a Postgis raster binary.
+
+        Parameters:
+            data (bytes or memoryview): The raster binary.
+
+        Returns:
+            dict or None: The raster with the keys
+                - "width", "height", "srid"
+                - "geotransform": The GDAL geotransform (upper left x, scale x, skew x, upper left y, skew y, scale y).
+                - "bands": List of 2D NumPy arrays, None for out-db bands.
+                - "nodata": List of the no data value of each band, None if not set.
+                - "outdb": List of (band number starting with 1, file path) of out-db bands, None for in-db bands.
+            None is returned if no data is given.
+        """
+        if data is None:
+            return None
+
+        data = bytes(data)
+        byte_order = "<" if data[0] == 1 else ">"
+
+        (version, amount_bands, scale_x, scale_y, upper_left_x, upper_left_y, skew_x, skew_y, srid, width,
+         height) = struct.unpack_from(byte_order + RasterWkb.HEADER_FORMAT, data, 1)
+
+        raster = {"width": width, "height": height, "srid": srid,
+                  "geotransform": (upper_left_x, scale_x, skew_x, upper_left_y, skew_y, scale_y),
+                  "bands": [], "nodata": [], "outdb": []}
+
+        offset = RasterWkb.HEADER_SIZE
+        for _ in range(amount_bands):
+            band_type = data[offset]
+            offset += 1
+
+            if band_type & 0x0F not in RasterWkb.PIXEL_TYPES:
+                raise ValueError(f"Unknown Postgis pixel type: {band_type & 0x0F}")
+
+            dtype = np.dtype(RasterWkb.PIXEL_TYPES[band_type & 0x0F]).newbyteorder(byte_order)
+
+            # The no data value is always stored, but only valid if the flag is set.
+            nodata = np.frombuffer(data, dtype=dtype, count=1, offset=offset)[0].item()
+            offset += dtype.itemsize
+            raster["nodata"].append(nodata if band_type & RasterWkb.BAND_HAS_NODATA else None)
+
+            if band_type & RasterWkb.BAND_IS_OFFLINE:
+                band_number = struct.unpack_from("b", data, offset)[0] + 1
+                path_end = data.index(b"\0", offset + 1)
+                raster["outdb"].append((band_number, data[offset + 1:path_end].decode()))
+                raster["bands"].append(None)
+                offset = path_end + 1
+            else:
+                amount_pixel = width * height
+                band = np.frombuffer(data, dtype=dtype, count=amount_pixel, offset=offset).reshape(height, width)
+
+                # Big endian rasters are converted to the native byte order, otherwise the buffer is used as it is.
+                band = band.astype(dtype.newbyteorder("="), copy=False)
+                raster["bands"].append(band)
+                raster["outdb"].append(None)
+                offset += amount_pixel * dtype.itemsize
+
+        return raster
+
+    @staticmethod
+    def stack_bands(raster):
+        """
+        Stack the in-db bands of a decoded raster to one array of shape (bands, height, width).
+
+        Parameters:
+            raster (dict): The raster as returned by decode().
+
+        Returns:
+            numpy.ndarray or None: The stacked bands, None if no in-db band is contained.
+        """
+        bands = [band for band in raster["bands"] if band is not None] if raster else []
+        return np.stack(bands) if bands else None
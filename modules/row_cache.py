@@ -0,0 +1,144 @@
+#--------------------------------------------------------------------------------------------------------------------------------
+# Name:        row_cache
+# Purpose:
+#
+# Author:      jennifer.mcclelland
+#
+# Created:     2024
+# Copyright:   (c) jennifer.mcclelland 2024
+#
+#--------------------------------------------------------------------------------------------------------------------------------
+
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class RowCache:
+    """
+    An in-process LRU cache of decoded field_day rows with a budget in bytes.
+    The rows are keyed by table, field_id, date and a variant, e.g. the raster format and selected columns.
+    All rows of a field_id and date can be invalidated at once when the row is changed in the database.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.keys_by_field = {}
+        self.size_bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(table_name, field_id, date, variant=None):
+        """
+        Create the key of a row. Tables in public may be given with or without schema, dates as date or string.
+        """
+        return RowCache.table_key(table_name), field_id, str(date), variant
+
+    @staticmethod
+    def table_key(table_name):
+        return table_name[len("public."):] if table_name.startswith("public.") else table_name
+
+    @staticmethod
+    def value_size(value):
+        """
+        Estimate the size of a cached value in bytes. NumPy arrays count with their data, containers with their items.
+        """
+        if isinstance(value, np.ndarray):
+            # Views do not own their data, so it is not contained in their size.
+            return sys.getsizeof(value) + (value.nbytes if value.base is not None else 0)
+        if isinstance(value, dict):
+            return sys.getsizeof(value) + sum(RowCache.value_size(item) for item in value.values())
+        if isinstance(value, (list, tuple)):
+            return sys.getsizeof(value) + sum(RowCache.value_size(item) for item in value)
+
+        return sys.getsizeof(value)
+
+    def get(self, key):
+        """
+        Get a cached value and mark it as recently used.
+
+        Returns:
+            The cached value or None if the key is not cached.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        """
+        Cache a value and evict the least recently used values until it fits into the budget.
+        Values larger than the whole budget are not cached.
+
+        Returns:
+            bool: True if the value is cached.
+        """
+        size = RowCache.value_size(value) if size is None else size
+
+        with self.lock:
+            self.remove(key)
+            if size > self.max_bytes:
+                return False
+
+            while self.size_bytes + size > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+                self.evictions += 1
+
+            self.entries[key] = (value, size)
+            self.size_bytes += size
+            self.keys_by_field.setdefault(key[:2], set()).add(key)
+            return True
+
+    def invalidate(self, table_name, field_id, date=None):
+        """
+        Remove all cached values of a field_id, or only of one date of it.
+
+        Returns:
+            int: The amount of values removed.
+        """
+        with self.lock:
+            keys = [key for key in self.keys_by_field.get((RowCache.table_key(table_name), field_id), ())
+                    if date is None or key[2] == str(date)]
+
+            for key in keys:
+                self.remove(key)
+
+            return len(keys)
+
+    def remove(self, key):
+        # Has to be called holding the lock.
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+
+        self.size_bytes -= entry[1]
+        field_keys = self.keys_by_field[key[:2]]
+        field_keys.discard(key)
+        if not field_keys:
+            del self.keys_by_field[key[:2]]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.keys_by_field.clear()
+            self.size_bytes = 0
+
+    def stats(self):
+        """
+        Get the counters of the cache.
+
+        Returns:
+            dict: hits, misses, evictions, entries, size_bytes and max_bytes.
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self.entries), "size_bytes": self.size_bytes, "max_bytes": self.max_bytes}
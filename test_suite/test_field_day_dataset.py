@@ -0,0 +1,45 @@
+#--------------------------------------------------------------------------------------------------------------------------------
+# Name:        test_field_day_dataset
+# Purpose:
+#
+# Author:      jennifer.mcclelland
+#
+# Created:     2024
+# Copyright:   (c) jennifer.mcclelland 2024
+#
+#--------------------------------------------------------------------------------------------------------------------------------
+
+import datetime
+
+from modules.field_day_dataset import FieldDayDataset
+
+
+# Test scenarios including corner cases
+def test_functions():
+
+    keys = [(field_id, datetime.date(2020, 1, day)) for field_id in range(1, 4) for day in range(1, 11)]
+
+    # Test order_keys function
+    assert FieldDayDataset.order_keys(keys) == keys
+
+    shuffled = FieldDayDataset.order_keys(keys, shuffle=True, seed=7, epoch=0)
+    assert shuffled != keys
+    assert sorted(shuffled) == keys
+    assert FieldDayDataset.order_keys(keys, shuffle=True, seed=7, epoch=0) == shuffled
+    assert FieldDayDataset.order_keys(keys, shuffle=True, seed=7, epoch=1) != shuffled
+    assert FieldDayDataset.order_keys(keys, shuffle=True, seed=8, epoch=0) != shuffled
+    assert FieldDayDataset.order_keys([], shuffle=True) == []
+
+    # Test batch_keys function
+    batches = FieldDayDataset.batch_keys(keys, 8)
+    assert [len(batch) for batch in batches] == [8, 8, 8, 6]
+    assert sum(batches, []) == keys
+    assert [len(batch) for batch in FieldDayDataset.batch_keys(keys, 8, drop_last=True)] == [8, 8, 8]
+    assert len(FieldDayDataset.batch_keys(keys, 10, drop_last=True)) == 3
+    assert FieldDayDataset.batch_keys([], 8) == []
+
+    print("All tests passed successfully!")
+
+
+if __name__ == "__main__":
+    test_functions()
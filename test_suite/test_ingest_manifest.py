@@ -0,0 +1,55 @@
+#--------------------------------------------------------------------------------------------------------------------------------
+# Name:        test_ingest_manifest
+# Purpose:
+#
+# Author:      jennifer.mcclelland
+#
+# Created:     2024
+# Copyright:   (c) jennifer.mcclelland 2024
+#
+#--------------------------------------------------------------------------------------------------------------------------------
+
+import os
+import tempfile
+
+from modules.access_sql import AccessSql
+
+
+# Test scenarios including corner cases
+def test_functions():
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "20180110_S2_ZEPP_17472362.tif")
+        with open(path, "wb") as f:
+            f.write(b"raster")
+
+        # Test source_file_state function
+        column, state_path, size, mtime, content_hash = AccessSql.source_file_state("s2_data", path)
+        assert (column, state_path, size) == ("s2_data", path, 6)
+        assert AccessSql.source_file_state("s2_data", path, b"raster") == (column, path, size, mtime, content_hash)
+        entry = (size, mtime, content_hash)
+
+        # Test source_file_changed function
+        assert AccessSql.source_file_changed(path, None)
+        assert not AccessSql.source_file_changed(path, entry)
+
+        # A file touched without changing its content is not entered again.
+        os.utime(path, (mtime + 10, mtime + 10))
+        assert not AccessSql.source_file_changed(path, entry)
+
+        with open(path, "wb") as f:
+            f.write(b"Raster")
+        os.utime(path, (mtime, mtime))
+        assert not AccessSql.source_file_changed(path, entry)
+        os.utime(path, (mtime + 20, mtime + 20))
+        assert AccessSql.source_file_changed(path, entry)
+
+        with open(path, "wb") as f:
+            f.write(b"raster data")
+        assert AccessSql.source_file_changed(path, entry)
+
+    print("All tests passed successfully!")
+
+
+if __name__ == "__main__":
+    test_functions()
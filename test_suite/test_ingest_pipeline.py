@@ -0,0 +1,75 @@
+#--------------------------------------------------------------------------------------------------------------------------------
+# Name:        test_ingest_pipeline
+# Purpose:
+#
+# Author:      jennifer.mcclelland
+#
+# Created:     2024
+# Copyright:   (c) jennifer.mcclelland 2024
+#
+#--------------------------------------------------------------------------------------------------------------------------------
+
+import threading
+
+from modules.ingest_pipeline import IngestPipeline
+
+
+def fail_on_seven(item):
+    if item == 7:
+        raise ValueError("item 7")
+    return item
+
+
+# Test scenarios including corner cases
+def test_functions():
+
+    amount_threads = threading.active_count()
+
+    # Test stages with several workers, dropped items and errors
+    pipeline = IngestPipeline(queue_size=2)
+    pipeline.add_stage("double", lambda item: item * 2, 3)
+    pipeline.add_stage("drop", lambda item: item if item % 4 else None, 2)
+    pipeline.add_stage("fail", fail_on_seven).add_stage("add", lambda item: item + 1, 2)
+
+    results = list(pipeline.run(range(20)))
+    assert sorted(results) == [item * 2 + 1 for item in range(20) if item % 2]
+    assert pipeline.errors == []
+
+    pipeline = IngestPipeline(queue_size=2).add_stage("fail", fail_on_seven, 2)
+    assert sorted(pipeline.run(range(10))) == [0, 1, 2, 3, 4, 5, 6, 8, 9]
+    assert pipeline.errors == [("fail", "ValueError: item 7")]
+
+    # Test an empty input and a failing discovery
+    assert list(IngestPipeline().add_stage("copy", lambda item: item).run([])) == []
+
+    def discover():
+        yield 1
+        raise OSError("folder missing")
+
+    pipeline = IngestPipeline().add_stage("copy", lambda item: item)
+    assert list(pipeline.run(discover())) == [1]
+    assert pipeline.errors == [("discover", "OSError: folder missing")]
+
+    # Test back-pressure: a consumer that does not read holds back the discovery.
+    discovered = []
+    pipeline = IngestPipeline(queue_size=1).add_stage("copy", lambda item: item)
+    results = pipeline.run(discovered.append(item) or item for item in range(100))
+    assert next(results) == 0
+    threading.Event().wait(0.3)
+    assert len(discovered) <= 5
+
+    # Test stopping early: all threads end.
+    results.close()
+    assert threading.active_count() == amount_threads
+
+    # Test batches function
+    assert list(IngestPipeline.batches(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(IngestPipeline.batches([], 2)) == []
+    assert list(IngestPipeline.batches([b"a" * 3, b"b", b"c" * 5, b"d"], 10, max_bytes=4, item_bytes=len)) == \
+        [[b"aaa", b"b"], [b"ccccc"], [b"d"]]
+
+    print("All tests passed successfully!")
+
+
+if __name__ == "__main__":
+    test_functions()
@@ -0,0 +1,99 @@
+#--------------------------------------------------------------------------------------------------------------------------------
+# Name:        test_metrics
+# Purpose:
+#
+# Author:      jennifer.mcclelland
+#
+# Created:     2024
+# Copyright:   (c) jennifer.mcclelland 2024
+#
+#--------------------------------------------------------------------------------------------------------------------------------
+
+import os
+import json
+import tempfile
+
+from modules.metrics import Metrics
+
+
+# Test scenarios including corner cases
+def test_functions():
+
+    registry = Metrics(buckets=(0.1, 1.0))
+
+    # Test counters
+    registry.count("agriref_rows_entered", 10)
+    registry.count("agriref_rows_entered", 5)
+    registry.count("agriref_cache_requests", labels={"cache": "row", "result": "hit"})
+
+    counters = {(counter["name"], tuple(counter["labels"].items())): counter
+                for counter in registry.to_dict()["counters"]}
+    assert counters[("agriref_rows_entered", ())]["value"] == 15
+    assert counters[("agriref_rows_entered", ())]["rate_per_second"] > 0
+    assert counters[("agriref_cache_requests", (("cache", "row"), ("result", "hit")))]["value"] == 1
+
+    # Test histograms and timers
+    for value in (0.05, 0.1, 0.5, 3.0):
+        registry.observe("agriref_stage_seconds", value, {"stage": "read"})
+
+    with registry.timer("agriref_stage_seconds", {"stage": "write"}):
+        pass
+
+    @registry.timed("agriref_stage_seconds", {"stage": "failing"})
+    def fail():
+        raise ValueError("failed")
+
+    try:
+        fail()
+    except ValueError:
+        pass
+
+    histograms = {histogram["labels"]["stage"]: histogram for histogram in registry.to_dict()["histograms"]}
+    assert histograms["read"]["count"] == 4
+    assert histograms["read"]["buckets"] == {"0.1": 2, "1.0": 1}
+    assert histograms["read"]["min"] == 0.05 and histograms["read"]["max"] == 3.0
+    assert histograms["write"]["count"] == 1
+    assert histograms["failing"]["count"] == 1
+
+    # Test Prometheus export
+    text = registry.to_prometheus()
+    assert "# TYPE agriref_rows_entered_total counter\nagriref_rows_entered_total 15\n" in text
+    assert 'agriref_cache_requests_total{cache="row",result="hit"} 1' in text
+    assert 'agriref_stage_seconds_bucket{stage="read",le="0.1"} 2' in text
+    assert 'agriref_stage_seconds_bucket{stage="read",le="1.0"} 3' in text
+    assert 'agriref_stage_seconds_bucket{stage="read",le="+Inf"} 4' in text
+    assert 'agriref_stage_seconds_count{stage="read"} 4' in text
+    assert Metrics.format_labels({"path": 'a"b\\c'}) == '{path="a\\"b\\\\c"}'
+
+    # Test drain and merge as between worker and parent process
+    worker = Metrics(buckets=(0.1, 1.0))
+    worker.count("agriref_rows_entered", 5)
+    worker.observe("agriref_stage_seconds", 0.2, {"stage": "read"})
+    registry.merge(worker.drain())
+    assert worker.to_dict()["counters"] == []
+
+    metrics = registry.to_dict()
+    assert [c["value"] for c in metrics["counters"] if c["name"] == "agriref_rows_entered"] == [20]
+    assert [h["count"] for h in metrics["histograms"] if h["labels"] == {"stage": "read"}] == [5]
+
+    # Test JSON export
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "metrics.json")
+        registry.write(path)
+        with open(path) as f:
+            assert len(json.load(f)["histograms"]) == 3
+
+    # Test disabled registry
+    disabled = Metrics(enabled=False)
+    disabled.count("agriref_rows_entered")
+    disabled.observe("agriref_stage_seconds", 1.0)
+    assert disabled.to_prometheus() == ""
+
+    registry.reset()
+    assert registry.to_dict()["counters"] == []
+
+    print("All tests passed successfully!")
+
+
+if __name__ == "__main__":
+    test_functions()
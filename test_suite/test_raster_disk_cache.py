@@ -0,0 +1,74 @@
+#--------------------------------------------------------------------------------------------------------------------------------
+# Name:        test_raster_disk_cache
+# Purpose:
+#
+# Author:      jennifer.mcclelland
+#
+# Created:     2024
+# Copyright:   (c) jennifer.mcclelland 2024
+#
+#--------------------------------------------------------------------------------------------------------------------------------
+
+import os
+import tempfile
+import numpy as np
+
+from modules.raster_disk_cache import RasterDiskCache
+
+
+def create_raster(value):
+    return {"width": 4, "height": 3, "srid": 25832, "geotransform": (400000.0, 10.0, 0.0, 5500000.0, 0.0, -10.0),
+            "bands": [np.full((3, 4), value, dtype=np.float32), np.full((3, 4), value + 1, dtype=np.float32)],
+            "nodata": [None, -9999.0], "outdb": [None, None]}
+
+
+# Test scenarios including corner cases
+def test_functions():
+
+    with tempfile.TemporaryDirectory() as directory:
+        raster_size = np.stack(create_raster(0)["bands"]).nbytes
+        cache = RasterDiskCache(directory, 2 * raster_size + 300)
+
+        # Test get and put function
+        assert cache.get("field_day_c", 1, "2020-01-01", "s2_data") is None
+        assert cache.put("public.field_day_c", 1, "2020-01-01", "s2_data", create_raster(1))
+
+        raster = cache.get("field_day_c", 1, "2020-01-01", "s2_data")
+        assert isinstance(raster["bands"][0], np.memmap)
+        assert raster["bands"][1][2, 3] == 2
+        assert raster["geotransform"] == (400000.0, 10.0, 0.0, 5500000.0, 0.0, -10.0)
+        assert raster["nodata"] == [None, -9999.0]
+        assert not raster["bands"][0].flags.writeable
+
+        # Test a second process sharing the cache
+        assert RasterDiskCache(directory, cache.max_bytes).get("field_day_c", 1, "2020-01-01", "s2_data") is not None
+
+        # Test rasters that are not cached
+        assert not cache.put("field_day_c", 1, "2020-01-01", "bsc_data", None)
+        outdb_raster = dict(create_raster(1), bands=[None], outdb=[(1, "/data/cog/field.tif")])
+        assert not cache.put("field_day_c", 1, "2020-01-01", "bsc_data", outdb_raster)
+
+        # Test size capped eviction of the least recently used raster
+        cache.put("field_day_c", 1, "2020-01-02", "s2_data", create_raster(3))
+        cache.get("field_day_c", 1, "2020-01-01", "s2_data")
+        cache.put("field_day_c", 2, "2020-01-01", "s2_data", create_raster(5))
+
+        assert cache.get("field_day_c", 1, "2020-01-02", "s2_data") is None
+        assert cache.get("field_day_c", 1, "2020-01-01", "s2_data") is not None
+        assert cache.stats()["entries"] == 2
+        assert cache.stats()["size_bytes"] <= cache.max_bytes
+
+        # Test invalidate function
+        assert cache.invalidate("field_day_c", 1) == 1
+        assert cache.invalidate("field_day_c", 2, "2020-01-02") == 0
+        assert cache.invalidate("field_day_c", 2, "2020-01-01") == 1
+        assert cache.stats()["entries"] == 0
+
+        # Only the manifest is left, no temporary files
+        assert os.listdir(directory) == [RasterDiskCache.MANIFEST_NAME]
+
+    print("All tests passed successfully!")
+
+
+if __name__ == "__main__":
+    test_functions()
@@ -0,0 +1,80 @@
+#--------------------------------------------------------------------------------------------------------------------------------
+# Name:        test_raster_wkb
+# Purpose:
+#
+# Author:      jennifer.mcclelland
+#
+# Created:     2024
+# Copyright:   (c) jennifer.mcclelland 2024
+#
+#--------------------------------------------------------------------------------------------------------------------------------
+
+import struct
+import numpy as np
+
+from modules.raster_wkb import RasterWkb
+
+
+def create_raster_wkb(byte_order="<"):
+    """
+    Create a Postgis raster binary of 3x2 pixel with a 32BF band with no data value, a 16BUI band and an out-db band.
+    """
+    endian_flag = 1 if byte_order == "<" else 0
+    data = struct.pack("B", endian_flag)
+    data += struct.pack(byte_order + "HHddddddiHH", 0, 3, 10.0, -10.0, 400000.0, 5500000.0, 0.0, 0.0, 25832, 3, 2)
+
+    data += struct.pack("B", 0x40 | 10) + struct.pack(byte_order + "f", -9999.0)
+    data += np.arange(6, dtype=np.dtype(np.float32).newbyteorder(byte_order)).tobytes()
+
+    data += struct.pack("B", 6) + struct.pack(byte_order + "H", 0)
+    data += np.array([1, 2, 3, 4, 5, 6], dtype=np.dtype(np.uint16).newbyteorder(byte_order)).tobytes()
+
+    data += struct.pack("B", 0x80 | 10) + struct.pack(byte_order + "f", 0.0)
+    data += struct.pack("b", 1) + b"/data/cog/field.tif\0"
+
+    return data
+
+
+# Test scenarios including corner cases
+def test_functions():
+
+    # Test decode function
+    assert RasterWkb.decode(None) is None
+
+    for byte_order in ("<", ">"):
+        raster = RasterWkb.decode(memoryview(create_raster_wkb(byte_order)))
+
+        assert raster["width"] == 3
+        assert raster["height"] == 2
+        assert raster["srid"] == 25832
+        assert raster["geotransform"] == (400000.0, 10.0, 0.0, 5500000.0, 0.0, -10.0)
+
+        assert raster["bands"][0].shape == (2, 3)
+        assert raster["bands"][0].dtype == np.float32
+        assert raster["bands"][0][1, 2] == 5.0
+        assert raster["nodata"][0] == -9999.0
+
+        assert raster["bands"][1].tolist() == [[1, 2, 3], [4, 5, 6]]
+        assert raster["nodata"][1] is None
+
+        assert raster["bands"][2] is None
+        assert raster["outdb"] == [None, None, (2, "/data/cog/field.tif")]
+
+    # Test unknown pixel type
+    data = bytearray(create_raster_wkb())
+    data[RasterWkb.HEADER_SIZE] = 0x0F
+    try:
+        RasterWkb.decode(bytes(data))
+        assert False
+    except ValueError:
+        pass
+
+    # Test stack_bands function
+    assert RasterWkb.stack_bands(None) is None
+    assert RasterWkb.stack_bands(RasterWkb.decode(create_raster_wkb())).shape == (2, 2, 3)
+
+    print("All tests passed successfully!")
+
+
+if __name__ == "__main__":
+    test_functions()
@@ -0,0 +1,78 @@
+#--------------------------------------------------------------------------------------------------------------------------------
+# Name:        test_row_cache
+# Purpose:
+#
+# Author:      jennifer.mcclelland
+#
+# Created:     2024
+# Copyright:   (c) jennifer.mcclelland 2024
+#
+#--------------------------------------------------------------------------------------------------------------------------------
+
+import datetime
+import numpy as np
+
+from modules.row_cache import RowCache
+
+
+def create_row(amount_pixel):
+    return {"field_id": 1, "s2_data": {"bands": [np.zeros(amount_pixel, dtype=np.float32)]}}
+
+
+# Test scenarios including corner cases
+def test_functions():
+
+    row_size = RowCache.value_size(create_row(1000))
+    assert row_size > 4000
+
+    # Test get and put function
+    cache = RowCache(3 * row_size)
+    key = RowCache.make_key("public.field_day_c", 1, datetime.date(2020, 1, 1), "wkb")
+    assert key == RowCache.make_key("field_day_c", 1, "2020-01-01", "wkb")
+
+    assert cache.get(key) is None
+    assert cache.put(key, create_row(1000))
+    assert cache.get(key)["field_id"] == 1
+
+    # Test LRU eviction
+    for day in range(2, 4):
+        cache.put(RowCache.make_key("field_day_c", 1, f"2020-01-0{day}", "wkb"), create_row(1000))
+
+    assert cache.get(key) is not None
+    cache.put(RowCache.make_key("field_day_c", 1, "2020-01-04", "wkb"), create_row(1000))
+
+    assert cache.get(RowCache.make_key("field_day_c", 1, "2020-01-02", "wkb")) is None
+    assert cache.get(key) is not None
+    assert cache.stats()["entries"] == 3
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size_bytes"] <= cache.max_bytes
+
+    # Test values larger than the budget
+    assert not cache.put(RowCache.make_key("field_day_c", 2, "2020-01-01"), create_row(10000))
+
+    # Test invalidate function
+    # The least recently used row of 2020-01-03 is evicted for the row of field 2.
+    cache.put(RowCache.make_key("field_day_c", 2, "2020-01-01"), create_row(10))
+    assert cache.stats()["evictions"] == 2
+    assert cache.invalidate("field_day_c", 1, "2020-01-01") == 1
+    assert cache.get(key) is None
+    assert cache.invalidate("public.field_day_c", 1) == 1
+    assert cache.stats()["entries"] == 1
+    assert cache.invalidate("field_day_c", 3) == 0
+
+    stats = cache.stats()
+    assert stats["hits"] == 3
+    assert stats["misses"] == 3
+
+    cache.clear()
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["size_bytes"] == 0
+
+    # Test disabled cache
+    assert not RowCache(0).put(key, create_row(1))
+
+    print("All tests passed successfully!")
+
+
+if __name__ == "__main__":
+    test_functions()